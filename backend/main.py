@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Form, Body, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Form, Body, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
@@ -65,7 +65,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     
     return {"user_id": user_id, "username": username, "role": role, "email": user.email}
 
-# Create database tables
+# Create database tables (AuditLog is month-partitioned on PostgreSQL; columns added
+# to Dataset since its table was created are added in place)
+from services.audit_archive import AuditArchiveService
+AuditArchiveService.prepare_schema(engine)
+from services import dataset_storage
+dataset_storage.prepare_schema(engine)
 models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
@@ -83,6 +88,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def backfill_annotator_stats():
+    """Populate the daily annotator rollup on first start after upgrading"""
+    from database import SessionLocal
+    from services.annotator_stats import AnnotatorStatsService
+    db = SessionLocal()
+    try:
+        AnnotatorStatsService.backfill_if_empty(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Annotator stats backfill failed: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def backfill_dataset_storage():
+    """Record storage keys for datasets uploaded before they were stored on Dataset"""
+    from database import SessionLocal
+    from services.dataset_storage import backfill_storage_keys
+    db = SessionLocal()
+    try:
+        backfill_storage_keys(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Dataset storage backfill failed: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def backfill_upload_stats():
+    """Build the upload counters on first start after upgrading"""
+    from database import SessionLocal
+    from services.upload_stats import UploadStatsService
+    db = SessionLocal()
+    try:
+        UploadStatsService.reconcile_if_empty(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Upload stats backfill failed: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def purge_expired_uploads():
+    """Drop resumable uploads abandoned for longer than their TTL"""
+    from database import SessionLocal
+    from services.resumable_upload import ResumableUploadService
+    db = SessionLocal()
+    try:
+        ResumableUploadService.purge_expired(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Purging expired uploads failed: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def resume_ingestion_jobs():
+    """Requeue dataset ingestion jobs interrupted by the last shutdown"""
+    from database import SessionLocal
+    from services import ingestion_pipeline
+    db = SessionLocal()
+    try:
+        ingestion_pipeline.resume_pending(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Resuming ingestion jobs failed: {e}")
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+def stop_ingestion_workers():
+    from services import ingestion_pipeline
+    ingestion_pipeline.shutdown()
+
+@app.on_event("shutdown")
+def drain_audit_log():
+    """Write out audit events still buffered in memory"""
+    from services.audit_sink import audit_sink
+    audit_sink.stop()
+
 # Health check
 @app.get("/")
 def read_root():
@@ -218,11 +304,20 @@ async def upload_dataset(
     project_id: str = Form(...),
     name: str = Form(...),
     description: str = Form(""),
+    create_task: bool = Form(False),
+    items_per_task: Optional[int] = Form(None),
     db: Session = Depends(get_db)
 ):
-    """Upload a dataset file (CSV, JSON, TXT, images)"""
-    import os
-    import json
+    """
+    Upload a dataset file (CSV, JSON, TXT, images)
+    
+    The file is stored and registered, then parsed by a background ingestion
+    job; poll /api/ingestion/jobs/{ingestion_job_id} for its progress. With
+    create_task, the job also creates an annotation task in the project (or,
+    with items_per_task, one task per that many items)
+    """
+    from services.bulk_upload_service import BulkUploadService, UploadTooLargeError
+    from services import ingestion_pipeline
     
     try:
         # Convert project_id to int
@@ -231,52 +326,42 @@ async def upload_dataset(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid project_id")
         
-        # Create uploads directory if it doesn't exist
-        upload_dir = "uploads/datasets"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Save file
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        # Parse file content based on type
+        # Stream file into the blob store in chunks (never held in memory as
+        # a whole), indexing row offsets of line-oriented files on the way
         file_ext = file.filename.split('.')[-1].lower()
-        data_items = []
-        
-        if file_ext == 'csv':
-            import csv
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                data_items = list(reader)
-        elif file_ext == 'json':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data_items = json.load(f)
-        elif file_ext == 'txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                data_items = [{'text': line.strip(), 'line_number': i+1} for i, line in enumerate(lines) if line.strip()]
-        else:
-            # For images and other files, just store file reference
-            data_items = [{'file_path': file_path, 'filename': file.filename}]
+        try:
+            stored = await BulkUploadService.stream_to_blob(file, BulkUploadService.MAX_FILE_SIZE)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        file_path = stored['path']
         
         # Create dataset record
-        dataset_data = schemas.DatasetCreate(
-            dataset_name=name or file.filename,
-            description=description or f"Uploaded file: {file.filename}",
-            format=file_ext
-        )
+        dataset_id = project_service.bulk_create_datasets(db, [{
+            'filename': os.path.basename(file.filename),
+            'sha256': stored['sha256'],
+            'size': stored['size'],
+            'pinned': stored['pinned'],
+            'dataset_name': name or file.filename,
+            'description': description or f"Uploaded file: {file.filename}",
+            'format': file_ext
+        }])[0]['dataset_id']
         
-        dataset = project_service.create_dataset(db, dataset_data)
+        # Parsing, validation, items, index and tasks run in an ingestion worker
+        options = None
+        if create_task:
+            options = {'project_id': project_id_int, 'items_per_task': items_per_task}
+        job = ingestion_pipeline.enqueue(db, [dataset_id], options)[0]
         
         return {
             "message": "Dataset uploaded successfully",
-            "dataset_id": dataset.dataset_id,
+            "dataset_id": dataset_id,
             "file_name": file.filename,
             "file_path": file_path,
-            "data_count": len(data_items),
-            "data_preview": data_items[:5] if len(data_items) > 0 else []
+            "file_size": stored['size'],
+            "sha256": stored['sha256'],
+            "deduplicated": stored['deduplicated'],
+            "ingestion_job_id": job.job_id,
+            "ingestion_status": job.status
         }
     except HTTPException:
         raise
@@ -298,31 +383,19 @@ async def bulk_upload_files(files: List[UploadFile] = File(...), db: Session = D
         Upload results with success and failed files
     """
     from services.bulk_upload_service import BulkUploadService
-    from pathlib import Path
+    from services import ingestion_pipeline
     
     results = await BulkUploadService.upload_multiple_files(files)
-    
-    # Create dataset entries for successful uploads
-    created_datasets = []
     for success_file in results['success']:
-        try:
-            db_dataset = models.Dataset(
-                dataset_name=success_file['filename'],
-                description=f"Bulk uploaded {success_file['file_type']} file",
-                format=Path(success_file['filename']).suffix
-            )
-            db.add(db_dataset)
-            db.commit()
-            db.refresh(db_dataset)
-            
-            created_datasets.append({
-                'dataset_id': db_dataset.dataset_id,
-                'filename': success_file['filename']
-            })
-        except Exception as e:
-            print(f"Error creating dataset entry: {e}")
+        success_file['description'] = f"Bulk uploaded {success_file['file_type']} file"
     
-    results['created_datasets'] = created_datasets
+    # Create dataset entries for successful uploads in one transaction
+    try:
+        results['created_datasets'] = project_service.bulk_create_datasets(db, results['success'])
+    except Exception as e:
+        print(f"Error creating dataset entries: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to register uploaded files: {str(e)}")
+    ingestion_pipeline.enqueue_created(db, results['created_datasets'])
     
     return results
 
@@ -338,7 +411,7 @@ async def upload_zip_file(file: UploadFile = File(...), db: Session = Depends(ge
         Extraction results with all extracted files
     """
     from services.bulk_upload_service import BulkUploadService
-    from pathlib import Path
+    from services import ingestion_pipeline
     
     # Validate it's a ZIP file
     if not file.filename.endswith('.zip'):
@@ -349,38 +422,163 @@ async def upload_zip_file(file: UploadFile = File(...), db: Session = Depends(ge
     if 'error' in results:
         raise HTTPException(status_code=400, detail=results['error'])
     
-    # Create dataset entries for extracted files
-    created_datasets = []
+    # Register all extracted files in one transaction
     for success_file in results['success']:
-        try:
-            db_dataset = models.Dataset(
-                dataset_name=success_file['filename'],
-                description=f"Extracted from ZIP: {file.filename}",
-                format=Path(success_file['filename']).suffix
-            )
-            db.add(db_dataset)
-            db.commit()
-            db.refresh(db_dataset)
-            
-            created_datasets.append({
-                'dataset_id': db_dataset.dataset_id,
-                'filename': success_file['filename']
-            })
-        except Exception as e:
-            print(f"Error creating dataset entry: {e}")
-    
-    results['created_datasets'] = created_datasets
+        success_file['description'] = f"Extracted from ZIP: {file.filename}"
+    try:
+        results['created_datasets'] = project_service.bulk_create_datasets(db, results['success'])
+    except Exception as e:
+        print(f"Error creating dataset entries: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to register extracted files: {str(e)}")
+    ingestion_pipeline.enqueue_created(db, results['created_datasets'])
     
     return results
 
 @app.get("/api/datasets/upload-stats")
-def get_upload_statistics(db: Session = Depends(get_db)):
-    """Get statistics about uploaded files"""
-    from services.bulk_upload_service import BulkUploadService
+def get_upload_statistics(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Get statistics about uploaded files (maintained counters, reconciled periodically)"""
+    from services.upload_stats import UploadStatsService
     
-    stats = BulkUploadService.get_upload_statistics()
+    stats = UploadStatsService.get_stats(db)
+    if UploadStatsService.needs_reconcile(stats):
+        background_tasks.add_task(UploadStatsService.reconcile_background)
     return stats
 
+@app.post("/api/datasets/upload-stats/reconcile")
+def reconcile_upload_statistics(db: Session = Depends(get_db)):
+    """Recompute the upload counters from the Dataset and Blob tables"""
+    from services.upload_stats import UploadStatsService
+    return UploadStatsService.reconcile(db)
+
+@app.post("/api/blobs/missing")
+def find_missing_blobs(payload: dict = Body(...), db: Session = Depends(get_db)):
+    """
+    Which of the given SHA-256 hashes are not stored yet; clients upload only
+    those and register the rest with /api/datasets/register-blobs
+    """
+    from services.blob_store import find_existing_blobs
+    hashes = [str(h).lower() for h in payload.get("sha256", [])]
+    existing = find_existing_blobs(db, hashes)
+    return {"missing": [h for h in dict.fromkeys(hashes) if h not in existing]}
+
+@app.post("/api/datasets/register-blobs")
+def register_blob_datasets(payload: List[dict] = Body(...), db: Session = Depends(get_db)):
+    """Create datasets for already-stored content without uploading it again"""
+    from services.blob_store import find_existing_blobs
+    from services import ingestion_pipeline
+    
+    existing = find_existing_blobs(db, [str(item.get("sha256", "")).lower() for item in payload])
+    to_register = []
+    failed = []
+    for item in payload:
+        sha256 = str(item.get("sha256", "")).lower()
+        filename = os.path.basename(item.get("filename") or sha256)
+        if sha256 not in existing:
+            failed.append({"filename": filename, "sha256": sha256, "reason": "Content not stored; upload it first"})
+            continue
+        to_register.append({
+            "filename": filename,
+            "sha256": sha256,
+            "size": None,  # Blob row already exists
+            "dataset_name": item.get("dataset_name"),
+            "description": item.get("description") or f"Registered from stored file {filename}"
+        })
+    
+    try:
+        created_datasets = project_service.bulk_create_datasets(db, to_register)
+    except Exception as e:
+        print(f"Error registering stored files: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to register stored files: {str(e)}")
+    ingestion_pipeline.enqueue_created(db, created_datasets)
+    
+    return {"created_datasets": created_datasets, "failed": failed}
+
+# ==================== RESUMABLE UPLOADS ====================
+
+@app.post("/api/uploads/")
+def create_resumable_upload(payload: dict = Body(...), db: Session = Depends(get_db)):
+    """
+    Start a chunked upload
+
+    Body: {filename, total_size, chunk_size?, sha256?}. Chunks are then PUT to
+    /api/uploads/{upload_id}/chunks/{index} in any order and the upload is
+    finished with /api/uploads/{upload_id}/complete
+    """
+    from services.resumable_upload import ResumableUploadService
+
+    if not payload.get("filename") or payload.get("total_size") is None:
+        raise HTTPException(status_code=400, detail="filename and total_size are required")
+    try:
+        session = ResumableUploadService.create_session(
+            db,
+            filename=payload["filename"],
+            total_size=int(payload["total_size"]),
+            chunk_size=int(payload["chunk_size"]) if payload.get("chunk_size") else None,
+            sha256=payload.get("sha256"),
+            created_by=payload.get("user_id")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "upload_id": session.upload_id,
+        "chunk_size": session.chunk_size,
+        "total_chunks": session.total_chunks
+    }
+
+@app.put("/api/uploads/{upload_id}/chunks/{chunk_index}")
+async def upload_chunk(upload_id: str, chunk_index: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Upload one chunk as the raw request body; an optional X-Chunk-SHA256
+    header is verified before the chunk is accepted. Re-sending a chunk
+    replaces it
+    """
+    from services.resumable_upload import ResumableUploadService
+
+    session = ResumableUploadService.get_session(db, upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        return await ResumableUploadService.write_chunk(
+            db, session, chunk_index, request.stream(), checksum=request.headers.get("X-Chunk-SHA256")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/uploads/{upload_id}")
+def get_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Upload progress, including the chunk ranges still missing (for resuming)"""
+    from services.resumable_upload import ResumableUploadService
+
+    session = ResumableUploadService.get_session(db, upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return ResumableUploadService.get_status(db, session)
+
+@app.post("/api/uploads/{upload_id}/complete")
+def complete_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Verify the assembled file, move it into the blob store and create its dataset"""
+    from services.resumable_upload import ResumableUploadService
+
+    session = ResumableUploadService.get_session(db, upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        return ResumableUploadService.complete(db, session)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/api/uploads/{upload_id}")
+def abort_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Abort an upload and discard the chunks received so far"""
+    from services.resumable_upload import ResumableUploadService
+
+    session = ResumableUploadService.get_session(db, upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    ResumableUploadService.abort(db, session)
+    return {"message": "Upload aborted", "upload_id": upload_id}
+
 @app.get("/api/datasets/", response_model=List[schemas.Dataset])
 def list_datasets(skip: int = 0, limit: int = 100, project_id: Optional[int] = None, db: Session = Depends(get_db)):
     """List all datasets with project information"""
@@ -415,47 +613,42 @@ def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
 @app.get("/api/datasets/{dataset_id}/data")
 def get_dataset_data(dataset_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Get parsed data from uploaded dataset"""
+    from services import dataset_items, dataset_storage
+    
     dataset = project_service.get_dataset(db, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    import json
-    import csv
-    import os
-    
-    # Find the file in uploads directory
-    upload_dir = "backend/uploads/datasets"
-    file_path = None
-    
-    # Search for file matching dataset name
-    if os.path.exists(upload_dir):
-        for filename in os.listdir(upload_dir):
-            if dataset.dataset_name in filename or filename.startswith(dataset.dataset_name):
-                file_path = os.path.join(upload_dir, filename)
-                break
+    # Ingested datasets are paged straight from Dataset_Item
+    if dataset_items.has_items(db, dataset_id):
+        data_items = dataset_items.get_item_page(db, dataset_id, max(skip, 0), limit)
+        return {
+            "dataset_id": dataset_id,
+            "dataset_name": dataset.dataset_name,
+            "format": dataset.format,
+            "total_count": len(data_items),
+            "row_count": dataset.row_count,
+            "data": data_items
+        }
     
+    file_path = dataset_storage.dataset_path(dataset)
     if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Dataset file not found")
     
     data_items = []
-    file_ext = dataset.format.lower()
+    file_ext = dataset.format.lower().lstrip('.')  # Bulk uploads store the suffix, e.g. ".csv"
     
     try:
-        if file_ext == 'csv':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                data_items = list(reader)[skip:skip+limit]
+        # Line-oriented files seek straight to row `skip` through their offset index
+        index_path = dataset_storage.row_index_path(dataset)
+        if index_path:
+            from services import row_index
+            data_items = row_index.read_rows(file_path, index_path, file_ext, skip, limit)
         elif file_ext == 'json':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    data_items = data[skip:skip+limit]
-                else:
-                    data_items = [data]
-        elif file_ext == 'txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                data_items = [{'text': line.strip(), 'line_number': i+1} for i, line in enumerate(lines[skip:skip+limit]) if line.strip()]
+            # Elements are decoded one at a time; only the requested page is kept
+            from itertools import islice
+            from services.json_stream import iter_json_file
+            data_items = list(islice(iter_json_file(file_path), max(skip, 0), max(skip, 0) + limit))
         else:
             data_items = [{'message': 'Preview not available for this file type', 'file_type': file_ext}]
     except Exception as e:
@@ -466,9 +659,104 @@ def get_dataset_data(dataset_id: int, skip: int = 0, limit: int = 100, db: Sessi
         "dataset_name": dataset.dataset_name,
         "format": dataset.format,
         "total_count": len(data_items),
+        "row_count": dataset.row_count,
         "data": data_items
     }
 
+@app.post("/api/datasets/{dataset_id}/ingest")
+def ingest_dataset(
+    dataset_id: int,
+    project_id: Optional[int] = None,
+    items_per_task: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Queue a (re)ingestion of a dataset's file, e.g. for datasets uploaded
+    before ingestion existed; with project_id tasks are created once it's
+    done (one, or one per items_per_task items)
+    """
+    from services import dataset_storage, ingestion_pipeline
+    
+    dataset = project_service.get_dataset(db, dataset_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    file_path = dataset_storage.dataset_path(dataset)
+    if not file_path or not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Dataset file not found")
+    
+    active = ingestion_pipeline.active_jobs(db, [dataset_id]).get(dataset_id)
+    if active:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Ingestion job {active.job_id} is already {active.status} for this dataset"
+        )
+    
+    options = {'project_id': project_id, 'items_per_task': items_per_task} if project_id else None
+    job = ingestion_pipeline.enqueue(db, [dataset_id], options)[0]
+    return ingestion_pipeline.describe_job(job)
+
+@app.get("/api/datasets/{dataset_id}/ingestion")
+def get_dataset_ingestion(dataset_id: int, db: Session = Depends(get_db)):
+    """Status of the most recent ingestion job for a dataset"""
+    from services import ingestion_pipeline
+    
+    job = ingestion_pipeline.latest_job(db, dataset_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No ingestion job for this dataset")
+    return ingestion_pipeline.describe_job(job)
+
+@app.get("/api/ingestion/jobs/{job_id}")
+def get_ingestion_job(job_id: int, db: Session = Depends(get_db)):
+    """Stage, progress and validation warnings of an ingestion job"""
+    from services import ingestion_pipeline
+    
+    job = ingestion_pipeline.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return ingestion_pipeline.describe_job(job)
+
+@app.post("/api/datasets/{dataset_id}/sample")
+def sample_dataset(dataset_id: int, request: schemas.DatasetSampleRequest, db: Session = Depends(get_db)):
+    """
+    Reproducible (by seed) sample of a dataset's items, stratified by a field:
+    a fraction (`rate`) or fixed count (`per_stratum`) of every value, taken
+    in one streaming pass over the items. `ordinals` (and `items`, with
+    include_data) hold the offset/limit page of the sample; `sample_size`
+    counts all of it
+    """
+    from services import dataset_items, dataset_sampling
+    
+    dataset = project_service.get_dataset(db, dataset_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if dataset.row_count is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Dataset has not been ingested yet; see /api/datasets/{dataset_id}/ingestion"
+        )
+    if request.offset < 0 or request.limit < 1:
+        raise HTTPException(status_code=400, detail="offset must be at least 0 and limit at least 1")
+    
+    try:
+        sample = dataset_sampling.stratified_sample(
+            db, dataset,
+            stratify_by=request.stratify_by,
+            rate=request.rate,
+            per_stratum=request.per_stratum,
+            min_per_stratum=request.min_per_stratum,
+            seed=request.seed,
+            filters=request.filters
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    sample['ordinals'] = sample['ordinals'][request.offset:request.offset + request.limit]
+    sample['offset'] = request.offset
+    sample['limit'] = request.limit
+    if request.include_data:
+        sample['items'] = dataset_items.get_items_by_ordinals(db, dataset, sample['ordinals'])
+    return sample
+
 @app.delete("/api/datasets/{dataset_id}")
 def delete_dataset(dataset_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     """Delete a dataset (Admin/Manager only)"""
@@ -479,28 +767,12 @@ def delete_dataset(dataset_id: int, db: Session = Depends(get_db), current_user:
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    # Delete the physical file
-    import os
-    upload_dir = "backend/uploads/datasets"
-    if os.path.exists(upload_dir):
-        for filename in os.listdir(upload_dir):
-            if dataset.dataset_name in filename or filename.startswith(dataset.dataset_name):
-                file_path = os.path.join(upload_dir, filename)
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete file {file_path}: {str(e)}")
-    
-    # Delete from database
-    db.delete(dataset)
-    db.commit()
+    # Blob-stored content may be shared and is only removed once unreferenced
+    from services import dataset_storage
+    dataset_storage.delete_dataset(db, dataset)
     
     return {"message": "Dataset deleted successfully", "dataset_id": dataset_id}
 
-# ==========================================
-        "limit": limit
-    }
-
 # ==========================================
 # LABEL ENDPOINTS
 # ==========================================
@@ -539,12 +811,65 @@ def get_annotation_task(task_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
+@app.post("/api/projects/{project_id}/tasks/generate")
+def generate_project_tasks(project_id: int, request: schemas.TaskGenerationRequest, db: Session = Depends(get_db)):
+    """
+    Create tasks for a dataset's items in bulk: all items, or those matching
+    `filters` and/or a reproducible `sample_rate` sample (by `seed`), with
+    `items_per_task` items per task
+    """
+    if not project_service.get_project(db, project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    dataset = project_service.get_dataset(db, request.dataset_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if dataset.row_count is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Dataset has not been ingested yet; see /api/datasets/{dataset.dataset_id}/ingestion"
+        )
+
+    try:
+        return annotation_service.generate_tasks(
+            db, project_id, dataset,
+            items_per_task=request.items_per_task,
+            filters=request.filters,
+            sample_rate=request.sample_rate,
+            seed=request.seed,
+            max_items=request.max_items,
+            due_date=request.due_date,
+            stratify_by=request.stratify_by,
+            min_per_stratum=request.min_per_stratum
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/tasks/{task_id}/items")
+def get_annotation_task_items(task_id: int, db: Session = Depends(get_db)):
+    """The dataset items a generated task covers, in dataset order"""
+    from services import dataset_items
+
+    task = annotation_service.get_annotation_task(db, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    ordinals = annotation_service.get_task_item_ordinals(db, task_id)
+    return {
+        "task_id": task_id,
+        "dataset_id": task.dataset_id,
+        "items": dataset_items.get_items_by_ordinals(db, task.dataset, ordinals)
+    }
+
 # ==========================================
 # TASK ASSIGNMENT ENDPOINTS
 # ==========================================
 @app.post("/api/assignments/", response_model=schemas.TaskAssignment)
 def create_task_assignment(assignment: schemas.TaskAssignmentCreate, db: Session = Depends(get_db)):
-    return annotation_service.create_task_assignment(db, assignment)
+    from sqlalchemy.exc import IntegrityError
+    try:
+        return annotation_service.create_task_assignment(db, assignment)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Task {assignment.task_id} already assigned to user {assignment.user_id}")
 
 @app.post("/api/assignments/bulk/")
 def bulk_assign_tasks(
@@ -554,50 +879,14 @@ def bulk_assign_tasks(
     db: Session = Depends(get_db)
 ):
     """Bulk assign multiple tasks to multiple users"""
-    assignments = []
-    errors = []
-    
-    for task_id in task_ids:
-        # Verify task exists
-        task = annotation_service.get_annotation_task(db, task_id)
-        if not task:
-            errors.append(f"Task {task_id} not found")
-            continue
-        
-        for user_id in user_ids:
-            # Verify user exists
-            user = user_service.get_user(db, user_id)
-            if not user:
-                errors.append(f"User {user_id} not found")
-                continue
-            
-            # Check if already assigned
-            existing = annotation_service.get_assignment_by_task_and_user(db, task_id, user_id)
-            if existing:
-                errors.append(f"Task {task_id} already assigned to user {user_id}")
-                continue
-            
-            try:
-                assignment_data = schemas.TaskAssignmentCreate(
-                    task_id=task_id,
-                    assigned_to=user_id,
-                    assigned_by=assigned_by,
-                    status="Pending"
-                )
-                assignment = annotation_service.create_task_assignment(db, assignment_data)
-                assignments.append({
-                    "assignment_id": assignment.assignment_id,
-                    "task_id": task_id,
-                    "user_id": user_id
-                })
-            except Exception as e:
-                errors.append(f"Failed to assign task {task_id} to user {user_id}: {str(e)}")
+    pairs = [(task_id, user_id) for task_id in task_ids for user_id in user_ids]
+    result = annotation_service.bulk_create_task_assignments(db, pairs, assigned_by)
     
     return {
         "message": f"Bulk assignment completed",
-        "assignments_created": len(assignments),
-        "assignments": assignments,
-        "errors": errors
+        "assignments_created": len(result["assignments"]),
+        "assignments": result["assignments"],
+        "errors": result["errors"]
     }
 
 @app.post("/api/assignments/auto-distribute/")
@@ -605,44 +894,28 @@ def auto_distribute_tasks(
     project_id: int,
     user_ids: List[int],
     assigned_by: int,
+    weight_by_quality: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Automatically distribute tasks evenly among users"""
-    # Get all unassigned tasks for the project
-    tasks = annotation_service.get_annotation_tasks(db, project_id=project_id)
-    unassigned_tasks = [t for t in tasks if not annotation_service.get_task_assignments_by_task(db, t.task_id)]
-    
-    if not unassigned_tasks:
-        return {"message": "No unassigned tasks found", "assignments": []}
+    """
+    Distribute all unassigned project tasks, giving each task to the user with the
+    fewest pending assignments (optionally scaled by their average quality score)
+    """
+    from services.task_scheduler import TaskSchedulerService
     
     if not user_ids:
         raise HTTPException(status_code=400, detail="No users provided")
     
-    # Distribute tasks round-robin
-    assignments = []
-    for i, task in enumerate(unassigned_tasks):
-        user_id = user_ids[i % len(user_ids)]
-        
-        try:
-            assignment_data = schemas.TaskAssignmentCreate(
-                task_id=task.task_id,
-                assigned_to=user_id,
-                assigned_by=assigned_by,
-                status="Pending"
-            )
-            assignment = annotation_service.create_task_assignment(db, assignment_data)
-            assignments.append({
-                "assignment_id": assignment.assignment_id,
-                "task_id": task.task_id,
-                "user_id": user_id
-            })
-        except Exception as e:
-            continue
+    result = TaskSchedulerService.auto_distribute(db, project_id, user_ids, assigned_by, weight_by_quality)
+    
+    if not result["unassigned_tasks"]:
+        return {"message": "No unassigned tasks found", "assignments": []}
     
     return {
-        "message": f"Auto-distributed {len(assignments)} tasks to {len(user_ids)} users",
-        "assignments_created": len(assignments),
-        "assignments": assignments
+        "message": f"Auto-distributed {len(result['assignments'])} tasks to {len(user_ids)} users",
+        "assignments_created": len(result["assignments"]),
+        "assignments": result["assignments"],
+        "errors": result["errors"]
     }
 
 @app.get("/api/assignments/user/{user_id}", response_model=List[schemas.TaskAssignment])
@@ -667,6 +940,107 @@ def delete_assignment(assignment_id: int, db: Session = Depends(get_db)):
 def create_annotation(annotation: schemas.AnnotationCreate, db: Session = Depends(get_db)):
     return annotation_service.create_annotation(db, annotation)
 
+@app.post("/api/annotations/bulk")
+async def bulk_create_annotations(request: Request, db: Session = Depends(get_db)):
+    """
+    Bulk-create annotations from a JSON array, or from an NDJSON stream
+    (Content-Type: application/x-ndjson) with one annotation per line.
+    
+    Each item has task_id, user_id, content and label_ids. Both forms are parsed
+    as the body streams (services.json_stream for arrays), and items are validated
+    and inserted in chunks, one transaction per chunk; invalid items are skipped
+    and reported by their index in the request.
+    """
+    import json
+    from starlette.concurrency import run_in_threadpool
+    
+    max_reported_errors = 1000
+    chunk_size = annotation_service.BULK_CHUNK_SIZE
+    spool_size = 8 * 1024 * 1024
+    summary = {"received": 0, "created": 0, "failed": 0, "errors": []}
+    
+    def record(result):
+        summary["created"] += result["created"]
+        summary["failed"] += len(result["errors"])
+        room = max_reported_errors - len(summary["errors"])
+        summary["errors"].extend(sorted(result["errors"], key=lambda e: e["index"])[:room])
+    
+    async def write_chunk(batch, start_index):
+        record(await run_in_threadpool(annotation_service.bulk_create_annotations, db, batch, start_index))
+    
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        # Parse line by line as the body streams in
+        batch, start_index, buffer = [], 0, b""
+        
+        async def lines():
+            nonlocal buffer
+            async for chunk in request.stream():
+                buffer += chunk
+                *complete, buffer = buffer.split(b"\n")
+                for line in complete:
+                    yield line
+            if buffer:
+                yield buffer
+        
+        async for line in lines():
+            if not line.strip():
+                continue
+            try:
+                batch.append(json.loads(line))
+            except ValueError as e:
+                batch.append(ValueError(f"Invalid JSON: {e}"))
+            summary["received"] += 1
+            if len(batch) >= chunk_size:
+                await write_chunk(batch, start_index)
+                start_index += len(batch)
+                batch = []
+        if batch:
+            await write_chunk(batch, start_index)
+    else:
+        # Spool the body (to disk past spool_size) and decode the array element
+        # by element, so memory holds one chunk of annotations, not the document
+        import io
+        import tempfile
+        from services.json_stream import iter_json_items
+        
+        def write_array(f):
+            text = io.TextIOWrapper(f, encoding="utf-8")
+            first = text.read(1)
+            while first and first.isspace():
+                first = text.read(1)
+            if first != "[":
+                raise HTTPException(status_code=400, detail="Expected a JSON array of annotations")
+            text.seek(0)
+            
+            batch, start_index, broken = [], 0, None
+            try:
+                for item in iter_json_items(text):
+                    batch.append(item)
+                    summary["received"] += 1
+                    if len(batch) >= chunk_size:
+                        record(annotation_service.bulk_create_annotations(db, batch, start_index))
+                        start_index += len(batch)
+                        batch = []
+            except ValueError as e:
+                if not summary["received"]:
+                    raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+                broken = e
+            if batch:
+                record(annotation_service.bulk_create_annotations(db, batch, start_index))
+            if broken:
+                # Items before it are kept; report where the document broke off
+                record({"created": 0, "errors": [{"index": summary["received"], "error": f"Invalid JSON: {broken}"}]})
+        
+        with tempfile.SpooledTemporaryFile(max_size=spool_size) as body:
+            async for chunk in request.stream():
+                await run_in_threadpool(body.write, chunk)
+            body.seek(0)
+            await run_in_threadpool(write_array, body)
+    
+    summary["errors_truncated"] = summary["failed"] > len(summary["errors"])
+    return summary
+
 @app.get("/api/annotations/{annotation_id}", response_model=schemas.Annotation)
 def get_annotation(annotation_id: int, db: Session = Depends(get_db)):
     annotation = annotation_service.get_annotation(db, annotation_id)
@@ -727,8 +1101,41 @@ def update_review(review_id: int, review: schemas.ReviewUpdate, db: Session = De
 # AUDIT LOG ENDPOINTS
 # ==========================================
 @app.get("/api/audit-logs/", response_model=List[schemas.AuditLog])
-def get_audit_logs(user_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return annotation_service.get_audit_logs(db, user_id, skip, limit)
+def get_audit_logs(
+    user_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_archived: bool = False,
+    db: Session = Depends(get_db)
+):
+    """List audit logs, newest first. include_archived also searches archived months."""
+    return annotation_service.get_audit_logs(db, user_id, skip, limit, start, end, include_archived)
+
+@app.get("/api/audit-logs/archives")
+def list_audit_archives(current_user: dict = Depends(get_current_user)):
+    """List archived audit log months (Admin only)"""
+    if current_user['role'] != 'Admin':
+        raise HTTPException(status_code=403, detail="Not authorized to view audit log archives")
+    return {"archives": AuditArchiveService.list_archives()}
+
+@app.post("/api/audit-logs/archive")
+def archive_audit_logs(
+    retention_months: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Move audit log months older than the retention window to compressed archives (Admin only)"""
+    if current_user['role'] != 'Admin':
+        raise HTTPException(status_code=403, detail="Not authorized to archive audit logs")
+    
+    try:
+        archived = AuditArchiveService.archive_expired(db, retention_months)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    AuditArchiveService.ensure_partitions(engine)
+    return {"archived_months": len(archived), "archives": archived}
 
 # ==========================================
 # NOTIFICATION ENDPOINTS
@@ -1031,14 +1438,26 @@ def create_typed_annotation(
 # ==================== CROWD MANAGEMENT ====================
 @app.get("/api/crowd/leaderboard")
 def get_annotator_leaderboard(
+    background_tasks: BackgroundTasks,
     time_period: str = 'week',
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
-    """Get annotator leaderboard by performance"""
-    leaderboard = CrowdManagementService.get_annotator_leaderboard(db, time_period, limit)
+    """Get annotator leaderboard by performance (served from the periodic snapshot)"""
+    period = CrowdManagementService.normalize_period(time_period)
+    computed_at = CrowdManagementService.get_leaderboard_computed_at(db, period)
+    if computed_at is not None and CrowdManagementService.is_leaderboard_stale(computed_at):
+        # Serve the current snapshot and rebuild it after the response
+        background_tasks.add_task(CrowdManagementService.refresh_leaderboard_background, [period])
+    
+    leaderboard = CrowdManagementService.get_annotator_leaderboard(db, period, limit, refresh_if_stale=False)
     return {"time_period": time_period, "leaderboard": leaderboard}
 
+@app.post("/api/crowd/leaderboard/refresh")
+def refresh_annotator_leaderboard(db: Session = Depends(get_db)):
+    """Rebuild the week, month and all-time leaderboard snapshots"""
+    return {"refreshed": CrowdManagementService.refresh_leaderboard(db)}
+
 @app.get("/api/crowd/annotator/{user_id}/stats")
 def get_annotator_performance(
     user_id: int,
@@ -1049,6 +1468,25 @@ def get_annotator_performance(
     stats = CrowdManagementService.get_annotator_stats(db, user_id, days)
     return stats
 
+@app.get("/api/crowd/annotator/{user_id}/daily")
+def get_annotator_daily_stats(
+    user_id: int,
+    days: int = 30,
+    db: Session = Depends(get_db)
+):
+    """Get day-by-day productivity and review counts for an annotator"""
+    return {
+        "user_id": user_id,
+        "days": CrowdManagementService.get_annotator_daily_stats(db, user_id, days)
+    }
+
+@app.post("/api/crowd/stats/rebuild")
+def rebuild_annotator_stats(user_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Recompute the daily annotator rollup from annotations and reviews"""
+    from services.annotator_stats import AnnotatorStatsService
+    rows = AnnotatorStatsService.rebuild(db, user_id)
+    return {"rows": rows}
+
 @app.get("/api/crowd/languages")
 def get_supported_languages(db: Session = Depends(get_db)):
     """Get list of supported languages with annotator availability"""
@@ -1060,38 +1498,66 @@ def assign_expert_annotators(
     payload: dict = Body(...),
     db: Session = Depends(get_db)
 ):
-    """Intelligently assign expert annotators to a task"""
+    """
+    Intelligently assign expert annotators to a task, a list of tasks (task_ids),
+    or every task of a project (project_id), matched in one batch under capacity limits
+    """
     task_id = payload.get("task_id")
+    task_ids = payload.get("task_ids")
+    project_id = payload.get("project_id")
     expertise = payload.get("expertise_required", "general")
     language = payload.get("language", "en")
     count = payload.get("count", 3)
     
-    assigned_user_ids = CrowdManagementService.assign_expert_annotators(
-        db, task_id, expertise, language, count
-    )
+    if task_ids is None:
+        if task_id is not None:
+            task_ids = [task_id]
+        elif project_id is not None:
+            task_ids = [row.task_id for row in db.query(models.AnnotationTask.task_id).filter(
+                models.AnnotationTask.project_id == project_id
+            )]
+        else:
+            raise HTTPException(status_code=400, detail="Provide task_id, task_ids or project_id")
     
-    # Create task assignments
-    from services import annotation_service, user_service
-    assignments = []
-    for user_id in assigned_user_ids:
-        assignment_data = schemas.TaskAssignmentCreate(
-            task_id=task_id,
-            user_id=user_id,
-            assigned_by=payload.get("assigned_by", 1),
-            status="Pending"
-        )
-        assignment = annotation_service.create_task_assignment(db, assignment_data)
-        assignments.append({
-            "assignment_id": assignment.assignment_id,
-            "user_id": user_id
-        })
+    result = CrowdManagementService.assign_experts(
+        db, task_ids, expertise, language, count, payload.get("assigned_by", 1)
+    )
     
+    response = {
+        "tasks_matched": len([t for t, user_ids in result["matches"].items() if user_ids]),
+        "experts_assigned": len(result["assignments"]),
+        "assignments": result["assignments"],
+        "errors": result["errors"]
+    }
+    if task_id is not None and payload.get("task_ids") is None:
+        response["task_id"] = task_id
+    return response
+
+@app.put("/api/crowd/annotator/{user_id}/profile")
+def update_annotator_profile(
+    user_id: int,
+    payload: dict = Body(...),
+    db: Session = Depends(get_db)
+):
+    """Set an annotator's languages, skills and max pending assignments"""
+    profile = CrowdManagementService.update_annotator_profile(db, user_id, payload)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User not found")
     return {
-        "task_id": task_id,
-        "experts_assigned": len(assignments),
-        "assignments": assignments
+        "user_id": profile.user_id,
+        "languages": profile.languages or [],
+        "skills": profile.skills or [],
+        "max_pending": profile.max_pending,
+        "avg_quality": profile.avg_quality,
+        "pending_assignments": profile.pending_assignments
     }
 
+@app.post("/api/crowd/profiles/refresh")
+def refresh_annotator_profiles(db: Session = Depends(get_db)):
+    """Recompute quality, experience and workload for all annotator profiles"""
+    refreshed = CrowdManagementService.refresh_annotator_profiles(db)
+    return {"profiles_refreshed": refreshed}
+
 @app.get("/api/crowd/metrics")
 def get_crowd_metrics(db: Session = Depends(get_db)):
     """Get overall crowd performance metrics"""
@@ -1103,13 +1569,41 @@ def create_annotator_pool(
     payload: dict = Body(...),
     db: Session = Depends(get_db)
 ):
-    """Create a qualified annotator pool for a project"""
+    """Create a qualified annotator pool for a project (set "save": false to preview only)"""
     project_id = payload.get("project_id")
     criteria = payload.get("criteria", {})
     
-    pool = CrowdManagementService.create_annotator_pool(db, project_id, criteria)
+    pool = CrowdManagementService.create_annotator_pool(db, project_id, criteria, payload.get("save", True))
+    return pool
+
+@app.get("/api/crowd/pools")
+def list_annotator_pools(project_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """List stored annotator pools"""
+    return CrowdManagementService.list_annotator_pools(db, project_id)
+
+@app.get("/api/crowd/pools/{pool_id}")
+def get_annotator_pool(pool_id: int, db: Session = Depends(get_db)):
+    """Get a stored annotator pool with its members"""
+    pool = CrowdManagementService.get_annotator_pool(db, pool_id)
+    if not pool:
+        raise HTTPException(status_code=404, detail="Pool not found")
     return pool
 
+@app.post("/api/crowd/pools/{pool_id}/refresh")
+def refresh_annotator_pool(pool_id: int, db: Session = Depends(get_db)):
+    """Refresh annotator profiles and apply membership changes to the pool"""
+    pool = CrowdManagementService.refresh_annotator_pool(db, pool_id)
+    if not pool:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    return pool
+
+@app.delete("/api/crowd/pools/{pool_id}")
+def delete_annotator_pool(pool_id: int, db: Session = Depends(get_db)):
+    """Delete a stored annotator pool"""
+    if not CrowdManagementService.delete_annotator_pool(db, pool_id):
+        raise HTTPException(status_code=404, detail="Pool not found")
+    return {"message": "Pool deleted successfully"}
+
 # ==================== RESOURCES & EDUCATION ====================
 @app.get("/api/resources/core-concepts")
 def get_core_concepts():
@@ -15,6 +15,10 @@ def create_tables():
         engine = create_engine(SQLALCHEMY_DATABASE_URL)
         
         print("Creating tables...")
+        from services.audit_archive import AuditArchiveService
+        AuditArchiveService.prepare_schema(engine)
+        from services import dataset_storage
+        dataset_storage.prepare_schema(engine)
         Base.metadata.create_all(bind=engine)
         
         print("✓ All tables created successfully!")
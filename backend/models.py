@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean, JSON, Date, Enum as SQLEnum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Float, Boolean, JSON, Date, Enum as SQLEnum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, date
 from database import Base
@@ -40,6 +40,7 @@ class User(Base):
     reviews = relationship("Review", back_populates="reviewer", foreign_keys="Review.reviewer_id")
     audit_logs = relationship("AuditLog", back_populates="user")
     notifications = relationship("Notification", back_populates="user")
+    annotator_profile = relationship("AnnotatorProfile", back_populates="user", uselist=False, cascade="all, delete-orphan")
 
 class Project(Base):
     __tablename__ = "Project"
@@ -63,9 +64,120 @@ class Dataset(Base):
     description = Column(Text, nullable=True)
     create_date = Column(DateTime, default=datetime.utcnow)
     format = Column(String(50), nullable=False)
+    storage_key = Column(String(512), nullable=True)  # See services.dataset_storage, e.g. "blob:<sha256>"
+    file_size = Column(BigInteger, nullable=True)
+    checksum = Column(String(64), nullable=True)  # SHA-256 of the file
+    row_count = Column(Integer, nullable=True)  # Items/rows once parsed or indexed
     
     # Relationships
     annotation_tasks = relationship("AnnotationTask", back_populates="dataset", cascade="all, delete-orphan")
+    blobs = relationship("DatasetBlob", back_populates="dataset", cascade="all, delete-orphan")
+    items = relationship("DatasetItem", back_populates="dataset", cascade="all, delete-orphan", passive_deletes=True)
+
+class Blob(Base):
+    """Stored file content, addressed by SHA-256 (see services.blob_store)"""
+    __tablename__ = "Blob"
+    
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    mime_type = Column(String(100), nullable=True)
+    # Datasets using the content plus uploads that stored it and have not created their dataset yet
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class DatasetBlob(Base):
+    """Maps a dataset's files (by original name) to stored blobs"""
+    __tablename__ = "Dataset_Blob"
+    
+    dataset_blob_id = Column(Integer, primary_key=True, autoincrement=True)
+    dataset_id = Column(Integer, ForeignKey("Dataset.dataset_id", ondelete="CASCADE"), nullable=False, index=True)
+    sha256 = Column(String(64), ForeignKey("Blob.sha256"), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    added_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    dataset = relationship("Dataset", back_populates="blobs")
+
+class DatasetItem(Base):
+    """One parsed record (CSV row, JSON element, TXT line) of a dataset, in file order"""
+    __tablename__ = "Dataset_Item"
+    __table_args__ = (
+        UniqueConstraint("dataset_id", "ordinal", name="uq_dataset_item_dataset_ordinal"),
+    )
+    
+    item_id = Column(Integer, primary_key=True, autoincrement=True)
+    dataset_id = Column(Integer, ForeignKey("Dataset.dataset_id", ondelete="CASCADE"), nullable=False)
+    ordinal = Column(Integer, nullable=False)  # 0-based position in the file
+    payload = Column(JSON, nullable=False)
+    
+    # Relationships
+    dataset = relationship("Dataset", back_populates="items")
+
+class UploadStats(Base):
+    """Running file count and size per upload category, kept by the upload and delete paths"""
+    __tablename__ = "Upload_Stats"
+    
+    category = Column(String(20), primary_key=True)  # File type (text, image, ...) or "blob_store"
+    file_count = Column(BigInteger, default=0, nullable=False)
+    total_size = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    reconciled_at = Column(DateTime, nullable=True)
+
+class UploadSession(Base):
+    """Resumable chunked upload; chunks are written at their offset in a staging file"""
+    __tablename__ = "Upload_Session"
+    
+    upload_id = Column(String(32), primary_key=True)
+    filename = Column(String(255), nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    total_chunks = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=True)  # Expected digest of the whole file, if the client sent one
+    status = Column(String(20), default="open", nullable=False, index=True)  # open, completing, complete, aborted
+    dataset_id = Column(Integer, ForeignKey("Dataset.dataset_id", ondelete="SET NULL"), nullable=True)
+    created_by = Column(Integer, ForeignKey("Users.user_id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    # Relationships
+    chunks = relationship("UploadChunk", back_populates="session", cascade="all, delete-orphan")
+
+class UploadChunk(Base):
+    """A received byte range (chunk_index * chunk_size, size) of an upload session"""
+    __tablename__ = "Upload_Chunk"
+    
+    upload_id = Column(String(32), ForeignKey("Upload_Session.upload_id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    session = relationship("UploadSession", back_populates="chunks")
+
+class IngestionJob(Base):
+    """Background ingestion of an uploaded dataset, run stage by stage in a worker process"""
+    __tablename__ = "Ingestion_Job"
+    
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    dataset_id = Column(Integer, ForeignKey("Dataset.dataset_id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String(20), default="queued", nullable=False, index=True)  # queued, running, complete, failed
+    stage = Column(String(30), nullable=True)  # See services.ingestion_pipeline.STAGES
+    progress = Column(Float, default=0.0, nullable=False)  # 0..1 across all stages
+    detected_format = Column(String(50), nullable=True)
+    items_processed = Column(Integer, default=0, nullable=False)
+    items_total = Column(Integer, nullable=True)  # Known up front only for row-indexed files
+    invalid_count = Column(Integer, default=0, nullable=False)
+    warnings = Column(JSON, nullable=True)  # First few validation problems
+    options = Column(JSON, nullable=True)  # e.g. {"project_id": 3} to create tasks when done
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    dataset = relationship("Dataset")
 
 class Label(Base):
     __tablename__ = "Label"
@@ -91,9 +203,23 @@ class AnnotationTask(Base):
     dataset = relationship("Dataset", back_populates="annotation_tasks")
     task_assignments = relationship("TaskAssignment", back_populates="task", cascade="all, delete-orphan")
     annotations = relationship("Annotation", back_populates="task", cascade="all, delete-orphan")
+    items = relationship("AnnotationTaskItem", back_populates="task", cascade="all, delete-orphan")
+
+class AnnotationTaskItem(Base):
+    """A dataset item (by ordinal, as in Dataset_Item) covered by an annotation task"""
+    __tablename__ = "Annotation_Task_Item"
+    
+    task_id = Column(Integer, ForeignKey("Annotation_Task.task_id", ondelete="CASCADE"), primary_key=True)
+    ordinal = Column(Integer, primary_key=True)
+    
+    # Relationships
+    task = relationship("AnnotationTask", back_populates="items")
 
 class TaskAssignment(Base):
     __tablename__ = "Task_Assignment"
+    __table_args__ = (
+        UniqueConstraint("task_id", "user_id", name="uq_task_assignment_task_user"),
+    )
     
     assignment_id = Column(Integer, primary_key=True, autoincrement=True)
     task_id = Column(Integer, ForeignKey("Annotation_Task.task_id", ondelete="CASCADE"), nullable=False)
@@ -122,6 +248,7 @@ class Annotation(Base):
     user = relationship("User", back_populates="annotations")
     annotation_labels = relationship("AnnotationLabel", back_populates="annotation", cascade="all, delete-orphan")
     reviews = relationship("Review", back_populates="annotation", cascade="all, delete-orphan")
+    versions = relationship("AnnotationVersion", back_populates="annotation", cascade="all, delete-orphan")
 
 class AnnotationLabel(Base):
     __tablename__ = "Annotation_Label"
@@ -133,6 +260,25 @@ class AnnotationLabel(Base):
     annotation = relationship("Annotation", back_populates="annotation_labels")
     label = relationship("Label", back_populates="annotation_labels")
 
+class AnnotationVersion(Base):
+    __tablename__ = "Annotation_Version"
+    __table_args__ = (
+        # Backs history lookups and version reconstruction
+        UniqueConstraint("annotation_id", "version", name="uq_annotation_version"),
+    )
+    
+    version_id = Column(Integer, primary_key=True, autoincrement=True)
+    annotation_id = Column(Integer, ForeignKey("Annotation.annotation_id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)  # 1-based, per annotation
+    user_id = Column(Integer, ForeignKey("Users.user_id", ondelete="SET NULL"), nullable=True)
+    is_snapshot = Column(Boolean, default=False, nullable=False)
+    data = Column(Text, nullable=False)  # Full JSON document if snapshot, otherwise JSON patch from previous version
+    change_description = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    annotation = relationship("Annotation", back_populates="versions")
+
 class Review(Base):
     __tablename__ = "Review"
     
@@ -150,6 +296,10 @@ class Review(Base):
 
 class AuditLog(Base):
     __tablename__ = "AuditLog"
+    __table_args__ = (
+        # On PostgreSQL the table is created month-partitioned by services.audit_archive
+        Index("ix_AuditLog_user_timestamp", "user_id", "timestamp"),
+    )
     
     log_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("Users.user_id", ondelete="CASCADE"), nullable=False)
@@ -157,7 +307,7 @@ class AuditLog(Base):
     entity_type = Column(String(50), nullable=True)  # Type of entity (Annotation, Task, etc.)
     entity_id = Column(Integer, nullable=True)  # ID of the entity
     details = Column(Text, nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)  # Changed from time_stamp to timestamp
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)  # Changed from time_stamp to timestamp
     
     # Relationships
     user = relationship("User", back_populates="audit_logs")
@@ -173,3 +323,94 @@ class Notification(Base):
     
     # Relationships
     user = relationship("User", back_populates="notifications")
+
+class AnnotatorProfile(Base):
+    """Precomputed per-annotator matching data, refreshed from annotations/reviews/assignments"""
+    __tablename__ = "Annotator_Profile"
+    __table_args__ = (
+        # Pool and expert searches filter on quality and experience together
+        Index("ix_Annotator_Profile_quality_experience", "avg_quality", "total_annotations"),
+    )
+    
+    user_id = Column(Integer, ForeignKey("Users.user_id", ondelete="CASCADE"), primary_key=True)
+    total_annotations = Column(Integer, default=0, nullable=False)
+    reviewed_count = Column(Integer, default=0, nullable=False)
+    avg_quality = Column(Float, nullable=True, index=True)  # Average review quality score 0-10
+    pending_assignments = Column(Integer, default=0, nullable=False)
+    max_pending = Column(Integer, default=10, nullable=False)  # Capacity for expert matching
+    languages = Column(JSON, nullable=True)  # e.g. ["en", "es"]
+    skills = Column(JSON, nullable=True)  # Expertise domains, e.g. ["medical", "legal"]
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    # Relationships
+    user = relationship("User", back_populates="annotator_profile")
+
+class AnnotatorPool(Base):
+    """Saved set of annotators qualifying for a project under the stored criteria"""
+    __tablename__ = "Annotator_Pool"
+    
+    pool_id = Column(Integer, primary_key=True, autoincrement=True)
+    project_id = Column(Integer, ForeignKey("Project.project_id", ondelete="CASCADE"), nullable=True, index=True)
+    criteria = Column(JSON, nullable=False)
+    member_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    members = relationship("AnnotatorPoolMember", back_populates="pool", cascade="all, delete-orphan")
+
+class AnnotatorPoolMember(Base):
+    __tablename__ = "Annotator_Pool_Member"
+    
+    pool_id = Column(Integer, ForeignKey("Annotator_Pool.pool_id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("Users.user_id", ondelete="CASCADE"), primary_key=True, index=True)
+    experience = Column(Integer, default=0, nullable=False)
+    quality_score = Column(Float, default=0.0, nullable=False)
+    added_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    pool = relationship("AnnotatorPool", back_populates="members")
+
+class LeaderboardSnapshot(Base):
+    """Ranked annotator leaderboard per period, rebuilt periodically by CrowdManagementService"""
+    __tablename__ = "Leaderboard_Snapshot"
+    __table_args__ = (
+        # Leaderboard reads are a range scan over (time_period, rank)
+        UniqueConstraint("time_period", "rank", name="uq_leaderboard_period_rank"),
+    )
+    
+    snapshot_id = Column(Integer, primary_key=True, autoincrement=True)
+    time_period = Column(String(20), nullable=False)  # week, month, all_time
+    rank = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("Users.user_id", ondelete="CASCADE"), nullable=False)
+    username = Column(String(100), nullable=False)
+    total_annotations = Column(Integer, default=0, nullable=False)
+    reviews_received = Column(Integer, default=0, nullable=False)
+    approved_reviews = Column(Integer, default=0, nullable=False)
+    avg_quality_score = Column(Float, default=0.0, nullable=False)
+    approval_rate = Column(Float, default=0.0, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class LeaderboardRefresh(Base):
+    """When each leaderboard period was last rebuilt, also for periods with no ranked annotators"""
+    __tablename__ = "Leaderboard_Refresh"
+    
+    time_period = Column(String(20), primary_key=True)
+    computed_at = Column(DateTime, nullable=False)
+    annotator_count = Column(Integer, default=0, nullable=False)
+
+class AnnotatorDailyStats(Base):
+    """Per-annotator daily rollup, maintained incrementally by services.annotator_stats"""
+    __tablename__ = "Annotator_Daily_Stats"
+    
+    user_id = Column(Integer, ForeignKey("Users.user_id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC day the annotations were created
+    annotations = Column(Integer, default=0, nullable=False)
+    tasks_started = Column(Integer, default=0, nullable=False)  # Tasks first annotated by the user that day
+    reviews = Column(Integer, default=0, nullable=False)  # Reviews of that day's annotations
+    approved = Column(Integer, default=0, nullable=False)
+    rejected = Column(Integer, default=0, nullable=False)
+    pending = Column(Integer, default=0, nullable=False)
+    quality_sum = Column(Float, default=0.0, nullable=False)
+    quality_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
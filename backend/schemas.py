@@ -81,6 +81,9 @@ class DatasetCreate(DatasetBase):
 class Dataset(DatasetBase):
     dataset_id: int
     create_date: datetime
+    file_size: Optional[int] = None
+    checksum: Optional[str] = None
+    row_count: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -115,6 +118,28 @@ class AnnotationTask(AnnotationTaskBase):
     class Config:
         from_attributes = True
 
+class TaskGenerationRequest(BaseModel):
+    dataset_id: int
+    items_per_task: int = 1
+    filters: Optional[Dict[str, Any]] = None  # Field -> value or list of values
+    sample_rate: Optional[float] = None  # Keep this fraction of the matching items
+    seed: int = 0
+    max_items: Optional[int] = None
+    due_date: Optional[date] = None
+    stratify_by: Optional[str] = None  # Sample sample_rate of every value of this field
+    min_per_stratum: int = 0
+
+class DatasetSampleRequest(BaseModel):
+    stratify_by: Optional[str] = None  # Item field, e.g. "label" or "meta.source"
+    rate: Optional[float] = None  # Fraction of every stratum, or ...
+    per_stratum: Optional[int] = None  # ... a fixed number per stratum
+    min_per_stratum: int = 0
+    seed: int = 0
+    filters: Optional[Dict[str, Any]] = None
+    include_data: bool = False  # Also return the data of the page's items
+    offset: int = 0  # Page of the sorted ordinals (sample_size counts them all)
+    limit: int = 100
+
 # Task Assignment schemas
 class TaskAssignmentBase(BaseModel):
     task_id: int
@@ -4,9 +4,12 @@ Includes: Active Learning, Version Control, Quality Metrics, Consensus, Export
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
+from sqlalchemy.exc import IntegrityError
 from typing import List, Dict, Any, Optional
 import models
 import json
+from services.json_patch import make_patch, apply_patch
+from services.annotator_stats import AnnotatorStatsService
 from datetime import datetime, timedelta
 import random
 from collections import Counter
@@ -94,77 +97,159 @@ class ActiveLearningService:
 class VersionControlService:
     """Version control for annotations"""
     
+    # Every SNAPSHOT_INTERVAL-th version is stored in full, the rest as JSON-patch deltas
+    SNAPSHOT_INTERVAL = 10
+    SAVE_ATTEMPTS = 5
+    
     @staticmethod
-    def create_version(db: Session, annotation_id: int, user_id: int, content: Any, 
-                      label_ids: List[int], change_description: str = ""):
-        """Save annotation version history"""
-        annotation = db.query(models.Annotation).filter(
-            models.Annotation.annotation_id == annotation_id
-        ).first()
+    def _is_snapshot_version(version: int) -> bool:
+        return (version - 1) % VersionControlService.SNAPSHOT_INTERVAL == 0
+    
+    @staticmethod
+    def _reconstruct(db: Session, annotation_id: int, version: int) -> Optional[Dict]:
+        """Rebuild a version from its nearest snapshot plus at most SNAPSHOT_INTERVAL - 1 deltas"""
+        interval = VersionControlService.SNAPSHOT_INTERVAL
+        base_version = ((version - 1) // interval) * interval + 1
         
-        if not annotation:
+        rows = db.query(models.AnnotationVersion).filter(
+            and_(
+                models.AnnotationVersion.annotation_id == annotation_id,
+                models.AnnotationVersion.version >= base_version,
+                models.AnnotationVersion.version <= version
+            )
+        ).order_by(models.AnnotationVersion.version).all()
+        
+        if not rows or rows[-1].version != version:
+            return None
+        
+        # Start from the latest snapshot, which may be a fallback written after a broken chain
+        snapshots = [i for i, row in enumerate(rows) if row.is_snapshot]
+        if not snapshots:
+            return None
+        chain = rows[snapshots[-1]:]
+        if chain[-1].version - chain[0].version != len(chain) - 1:
             return None
         
-        # Create audit log entry as version
-        version_data = {
-            "annotation_id": annotation_id,
-            "content": content,
-            "label_ids": label_ids,
-            "modified_by": user_id,
-            "change_description": change_description,
-            "version_timestamp": datetime.utcnow().isoformat()
+        document = json.loads(chain[0].data)
+        for row in chain[1:]:
+            document = apply_patch(document, json.loads(row.data))
+        return document
+    
+    @staticmethod
+    def _to_version_data(row: models.AnnotationVersion, document: Dict) -> Dict:
+        return {
+            "annotation_id": row.annotation_id,
+            "version": row.version,
+            "content": document.get("content"),
+            "label_ids": document.get("label_ids", []),
+            "modified_by": row.user_id,
+            "change_description": row.change_description or "",
+            "version_timestamp": row.created_at.isoformat() if row.created_at else None
         }
+    
+    @staticmethod
+    def _commit_with_retry(db: Session, write):
+        """
+        Run write() and commit, rerunning both when a concurrent save took the
+        same version number first (uq_annotation_version)
+        """
+        for attempt in range(VersionControlService.SAVE_ATTEMPTS):
+            result = write()
+            if result is None:
+                return None
+            try:
+                db.commit()
+                return result
+            except IntegrityError:
+                db.rollback()
+                if attempt == VersionControlService.SAVE_ATTEMPTS - 1:
+                    raise
+    
+    @staticmethod
+    def _add_version(db: Session, annotation_id: int, user_id: int, document: Dict,
+                     change_description: str) -> models.AnnotationVersion:
+        """Stage the next version of an annotation (no commit)"""
+        latest = db.query(models.AnnotationVersion.version).filter(
+            models.AnnotationVersion.annotation_id == annotation_id
+        ).order_by(models.AnnotationVersion.version.desc()).first()
+        
+        version = latest.version + 1 if latest else 1
+        
+        is_snapshot = VersionControlService._is_snapshot_version(version)
+        if is_snapshot:
+            data = document
+        else:
+            previous = VersionControlService._reconstruct(db, annotation_id, version - 1)
+            if previous is None:
+                # Broken delta chain - fall back to a full copy so later versions stay readable
+                is_snapshot = True
+                data = document
+            else:
+                data = make_patch(previous, document)
         
-        audit = models.AuditLog(
+        db_version = models.AnnotationVersion(
+            annotation_id=annotation_id,
+            version=version,
             user_id=user_id,
-            action="annotation_version",
-            entity_type="Annotation",
-            entity_id=annotation_id,
-            details=json.dumps(version_data),
-            timestamp=datetime.utcnow()
+            is_snapshot=is_snapshot,
+            data=json.dumps(data),
+            change_description=change_description,
+            created_at=datetime.utcnow()
         )
-        db.add(audit)
-        db.commit()
-        return version_data
+        db.add(db_version)
+        return db_version
+    
+    @staticmethod
+    def create_version(db: Session, annotation_id: int, user_id: int, content: Any, 
+                      label_ids: List[int], change_description: str = ""):
+        """Save annotation version history"""
+        document = {"content": content, "label_ids": list(label_ids or [])}
+        
+        def write():
+            annotation = db.query(models.Annotation).filter(
+                models.Annotation.annotation_id == annotation_id
+            ).first()
+            if not annotation:
+                return None
+            return VersionControlService._add_version(db, annotation_id, user_id, document, change_description)
+        
+        db_version = VersionControlService._commit_with_retry(db, write)
+        if db_version is None:
+            return None
+        return VersionControlService._to_version_data(db_version, document)
     
     @staticmethod
     def get_version_history(db: Session, annotation_id: int) -> List[Dict]:
         """Get all versions of an annotation"""
-        versions = db.query(models.AuditLog).filter(
-            and_(
-                models.AuditLog.entity_type == "Annotation",
-                models.AuditLog.entity_id == annotation_id,
-                models.AuditLog.action.in_(["annotation_version", "update_annotation", "create_annotation"])
-            )
-        ).order_by(models.AuditLog.timestamp.desc()).all()
+        versions = db.query(models.AnnotationVersion).filter(
+            models.AnnotationVersion.annotation_id == annotation_id
+        ).order_by(models.AnnotationVersion.version).all()
         
         history = []
+        document = None
         for v in versions:
-            try:
-                details = json.loads(v.details) if isinstance(v.details, str) else v.details
-            except:
-                details = {}
+            data = json.loads(v.data)
+            if v.is_snapshot:
+                document = data
+            elif document is None:
+                continue
+            else:
+                document = apply_patch(document, data)
             
             history.append({
-                "version_id": v.log_id,
-                "timestamp": v.timestamp.isoformat(),
+                "version_id": v.version,
+                "timestamp": v.created_at.isoformat(),
                 "user_id": v.user_id,
-                "action": v.action,
-                "details": details
+                "action": "annotation_version",
+                "details": VersionControlService._to_version_data(v, document)
             })
         
+        history.reverse()
         return history
     
     @staticmethod
     def restore_version(db: Session, annotation_id: int, version_id: int, user_id: int):
         """Restore annotation to a previous version"""
-        version = db.query(models.AuditLog).filter(
-            models.AuditLog.log_id == version_id
-        ).first()
-        
-        if not version:
-            return None
-        
         annotation = db.query(models.Annotation).filter(
             models.Annotation.annotation_id == annotation_id
         ).first()
@@ -172,36 +257,36 @@ class VersionControlService:
         if not annotation:
             return None
         
-        try:
-            details = json.loads(version.details) if isinstance(version.details, str) else version.details
-            
+        details = VersionControlService._reconstruct(db, annotation_id, version_id)
+        if details is None:
+            return None
+        
+        def write():
             # Restore content
-            if "content" in details:
-                annotation.content = details["content"]
+            content = details.get("content")
+            annotation.content = content if content is None or isinstance(content, str) else json.dumps(content)
             
             # Restore labels
-            if "label_ids" in details:
-                # Remove old labels
-                db.query(models.AnnotationLabel).filter(
-                    models.AnnotationLabel.annotation_id == annotation_id
-                ).delete()
-                
-                # Add restored labels
-                for label_id in details["label_ids"]:
-                    ann_label = models.AnnotationLabel(
-                        annotation_id=annotation_id,
-                        label_id=label_id
-                    )
-                    db.add(ann_label)
+            db.query(models.AnnotationLabel).filter(
+                models.AnnotationLabel.annotation_id == annotation_id
+            ).delete()
             
-            db.commit()
+            for label_id in details.get("label_ids", []):
+                ann_label = models.AnnotationLabel(
+                    annotation_id=annotation_id,
+                    label_id=label_id
+                )
+                db.add(ann_label)
             
-            # Log restoration
-            VersionControlService.create_version(
-                db, annotation_id, user_id, annotation.content,
-                details.get("label_ids", []), f"Restored to version {version_id}"
+            # Log restoration in the same transaction
+            return VersionControlService._add_version(
+                db, annotation_id, user_id,
+                {"content": details.get("content"), "label_ids": list(details.get("label_ids", []))},
+                f"Restored to version {version_id}"
             )
-            
+        
+        try:
+            VersionControlService._commit_with_retry(db, write)
             return annotation
         except Exception as e:
             db.rollback()
@@ -213,35 +298,19 @@ class QualityMetricsService:
     
     @staticmethod
     def calculate_annotator_metrics(db: Session, user_id: int, days: int = 30) -> Dict:
-        """Calculate performance metrics for an annotator"""
+        """Calculate performance metrics for an annotator from the daily rollup"""
         cutoff_date = datetime.utcnow() - timedelta(days=days)
+        totals = AnnotatorStatsService.get_window_totals(db, user_id, days)
         
-        # Total annotations
-        total_annotations = db.query(models.Annotation).filter(
-            and_(
-                models.Annotation.user_id == user_id,
-                models.Annotation.create_date >= cutoff_date
-            )
-        ).count()
-        
-        # Reviewed annotations
-        reviewed = db.query(models.Review).join(
-            models.Annotation,
-            models.Review.annotation_id == models.Annotation.annotation_id
-        ).filter(
-            and_(
-                models.Annotation.user_id == user_id,
-                models.Review.review_date >= cutoff_date
-            )
-        ).all()
+        total_annotations = totals['annotations']
+        reviewed_count = totals['reviews']
+        approved_count = totals['approved']
         
         # Calculate approval rate
-        approved_count = sum(1 for r in reviewed if r.status == "Approved")
-        approval_rate = (approved_count / len(reviewed) * 100) if reviewed else 0
+        approval_rate = (approved_count / reviewed_count * 100) if reviewed_count else 0
         
         # Average quality score
-        quality_scores = [r.quality_score for r in reviewed if r.quality_score]
-        avg_quality = sum(quality_scores) / len(quality_scores) if quality_scores else 0
+        avg_quality = totals['quality_sum'] / totals['quality_count'] if totals['quality_count'] else 0
         
         # Productivity (annotations per day)
         annotations_per_day = total_annotations / days if days > 0 else 0
@@ -253,7 +322,7 @@ class QualityMetricsService:
             "user_id": user_id,
             "period_days": days,
             "total_annotations": total_annotations,
-            "reviewed_count": len(reviewed),
+            "reviewed_count": reviewed_count,
             "approved_count": approved_count,
             "approval_rate": round(approval_rate, 2),
             "average_quality_score": round(avg_quality, 2),
@@ -449,6 +518,7 @@ class ConsensusService:
             )
             db.add(ann_label)
         
+        AnnotatorStatsService.record_annotations(db, [gold_annotation])
         db.commit()
         return gold_annotation
 
@@ -1,8 +1,27 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from pydantic import ValidationError
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, date
 import models
 import schemas
 import json
+from itertools import islice
+from services.audit_sink import audit_sink
+from services.annotator_stats import AnnotatorStatsService
+
+def _commit_keep_loaded(db: Session):
+    """
+    Commit without expiring the session's objects, so a write path can return
+    the rows it just wrote without a re-SELECT when they are serialized
+    """
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
 
 # Annotation Task functions
 def create_annotation_task(db: Session, task: schemas.AnnotationTaskCreate):
@@ -12,6 +31,77 @@ def create_annotation_task(db: Session, task: schemas.AnnotationTaskCreate):
     db.refresh(db_task)
     return db_task
 
+TASK_INSERT_BATCH_SIZE = 1000
+
+def generate_tasks(db: Session, project_id: int, dataset: models.Dataset, items_per_task: int = 1,
+                   filters: Optional[Dict[str, Any]] = None, sample_rate: Optional[float] = None,
+                   seed: int = 0, max_items: Optional[int] = None, due_date: Optional[date] = None,
+                   stratify_by: Optional[str] = None, min_per_stratum: int = 0) -> Dict[str, Any]:
+    """
+    Create tasks covering a dataset's items (all of them, or those matching
+    `filters` and/or a deterministic `sample_rate` sample, taken within each
+    value of `stratify_by` if given), each linked to `items_per_task`
+    consecutive selected items through Annotation_Task_Item
+
+    Items are selected in one streaming pass; tasks and links are inserted
+    TASK_INSERT_BATCH_SIZE tasks at a time and committed once, so memory is
+    bounded by a chunk and a failure creates nothing. With stratify_by the
+    selection itself is held in memory (O(sample) ordinals), since per-stratum
+    minimums and the max_items share are only known after the full pass.
+
+    Raises:
+        ValueError: invalid granularity, sample rate, max_items or stratification field
+    """
+    from services.dataset_sampling import select_ordinals, stratified_sample
+    from services.project_service import insert_returning_ids
+    
+    if items_per_task < 1:
+        raise ValueError("items_per_task must be at least 1")
+    if sample_rate is not None and not 0 < sample_rate <= 1:
+        raise ValueError("sample_rate must be in (0, 1]")
+    if max_items is not None and max_items < 1:
+        raise ValueError("max_items must be at least 1")
+    
+    if stratify_by:
+        # max_items is shared out across strata, so a cap never drops the later ones
+        sample = stratified_sample(db, dataset, stratify_by, rate=sample_rate or 1.0,
+                                   min_per_stratum=min_per_stratum, seed=seed, filters=filters,
+                                   max_items=max_items)
+        ordinals = iter(sample["ordinals"])
+    else:
+        ordinals = select_ordinals(db, dataset, filters, sample_rate, seed, max_items)
+    link_table = models.AnnotationTaskItem.__table__
+    result = {"project_id": project_id, "dataset_id": dataset.dataset_id, "tasks_created": 0,
+              "items_assigned": 0, "first_task_id": None, "last_task_id": None}
+    try:
+        while True:
+            chunk = list(islice(ordinals, items_per_task * TASK_INSERT_BATCH_SIZE))
+            if not chunk:
+                break
+            groups = [chunk[start:start + items_per_task] for start in range(0, len(chunk), items_per_task)]
+            task_ids = insert_returning_ids(db, models.AnnotationTask, [
+                {"project_id": project_id, "dataset_id": dataset.dataset_id, "due_date": due_date}
+                for _ in groups
+            ], TASK_INSERT_BATCH_SIZE)
+            db.execute(insert(link_table), [
+                {"task_id": task_id, "ordinal": ordinal}
+                for task_id, group in zip(task_ids, groups) for ordinal in group
+            ])
+            result["tasks_created"] += len(task_ids)
+            result["items_assigned"] += len(chunk)
+            result["first_task_id"] = result["first_task_id"] or task_ids[0]
+            result["last_task_id"] = task_ids[-1]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+def get_task_item_ordinals(db: Session, task_id: int) -> List[int]:
+    return [row.ordinal for row in db.query(models.AnnotationTaskItem.ordinal).filter(
+        models.AnnotationTaskItem.task_id == task_id
+    ).order_by(models.AnnotationTaskItem.ordinal)]
+
 def get_annotation_task(db: Session, task_id: int):
     return db.query(models.AnnotationTask).filter(models.AnnotationTask.task_id == task_id).first()
 
@@ -23,24 +113,27 @@ def get_annotation_tasks(db: Session, project_id: Optional[int] = None, skip: in
 
 # Task Assignment functions
 def create_task_assignment(db: Session, assignment: schemas.TaskAssignmentCreate):
-    db_assignment = models.TaskAssignment(**assignment.dict())
-    db.add(db_assignment)
-    db.commit()
-    db.refresh(db_assignment)
+    # Project name for the notification, fetched in one query
+    project_name = db.query(models.Project.project_name).join(
+        models.AnnotationTask, models.AnnotationTask.project_id == models.Project.project_id
+    ).filter(models.AnnotationTask.task_id == assignment.task_id).scalar()
     
-    # Get task details for notification
-    task = get_annotation_task(db, assignment.task_id)
     task_info = f"Task #{assignment.task_id}"
-    if task and task.project:
-        task_info = f"Task #{assignment.task_id} from project '{task.project.project_name}'"
+    if project_name:
+        task_info = f"Task #{assignment.task_id} from project '{project_name}'"
+    
+    now = datetime.utcnow()
+    db_assignment = models.TaskAssignment(**assignment.dict(), assign_date=now)
+    db.add(db_assignment)
     
     # Create notification for assigned user
     notification = models.Notification(
         user_id=assignment.user_id,
-        message=f"🎯 New task assigned: {task_info}"
+        message=f"🎯 New task assigned: {task_info}",
+        created_date=now
     )
     db.add(notification)
-    db.commit()
+    _commit_keep_loaded(db)
     
     # Log the action
     if assignment.assigned_by:
@@ -48,6 +141,122 @@ def create_task_assignment(db: Session, assignment: schemas.TaskAssignmentCreate
     
     return db_assignment
 
+def _chunks(values: List[Any], size: int = 500):
+    """Split IN-lists so they stay under driver parameter limits"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def bulk_create_task_assignments(db: Session, pairs: List[Tuple[int, int]], assigned_by: Optional[int] = None,
+                                 due_date: Optional[date] = None, commit: bool = True) -> Dict[str, Any]:
+    """
+    Create many (task_id, user_id) assignments in one transaction
+
+    Task/user existence and duplicate checks are set queries rather than
+    per-pair lookups. Assignments, notifications and audit rows are bulk
+    inserted and committed together (with commit=False the caller commits,
+    so it can record more in the same transaction).
+
+    Returns:
+        Dict with created 'assignments' and human-readable 'errors'
+    """
+    pairs = list(dict.fromkeys(pairs))
+    errors = []
+    if not pairs:
+        return {"assignments": [], "errors": errors}
+    
+    task_ids = {task_id for task_id, _ in pairs}
+    user_ids = {user_id for _, user_id in pairs}
+    
+    project_names = {}
+    for chunk in _chunks(task_ids):
+        rows = db.query(models.AnnotationTask.task_id, models.Project.project_name).outerjoin(
+            models.Project, models.AnnotationTask.project_id == models.Project.project_id
+        ).filter(models.AnnotationTask.task_id.in_(chunk))
+        project_names.update({task_id: name for task_id, name in rows})
+    
+    known_users = set()
+    for chunk in _chunks(user_ids):
+        known_users.update(row[0] for row in db.query(models.User.user_id).filter(models.User.user_id.in_(chunk)))
+    
+    existing = set()
+    for task_chunk in _chunks(task_ids):
+        for user_chunk in _chunks(user_ids):
+            existing.update(db.query(models.TaskAssignment.task_id, models.TaskAssignment.user_id).filter(
+                models.TaskAssignment.task_id.in_(task_chunk),
+                models.TaskAssignment.user_id.in_(user_chunk)
+            ).all())
+    
+    errors.extend(f"Task {task_id} not found" for task_id in sorted(task_ids - project_names.keys()))
+    errors.extend(f"User {user_id} not found" for user_id in sorted(user_ids - known_users))
+    
+    new_pairs = []
+    for task_id, user_id in pairs:
+        if task_id not in project_names or user_id not in known_users:
+            continue
+        if (task_id, user_id) in existing:
+            errors.append(f"Task {task_id} already assigned to user {user_id}")
+            continue
+        new_pairs.append((task_id, user_id))
+    
+    if not new_pairs:
+        return {"assignments": [], "errors": errors}
+    
+    now = datetime.utcnow()
+    assignment_rows = [
+        {"task_id": task_id, "user_id": user_id, "assigned_by": assigned_by,
+         "assign_date": now, "due_date": due_date, "status": "Pending"}
+        for task_id, user_id in new_pairs
+    ]
+    
+    def task_info(task_id):
+        name = project_names.get(task_id)
+        return f"Task #{task_id} from project '{name}'" if name else f"Task #{task_id}"
+    
+    try:
+        # (task_id, user_id) is unique, so generated ids can be matched back
+        # without relying on RETURNING order
+        table = models.TaskAssignment.__table__
+        if db.get_bind().dialect.insert_executemany_returning:
+            created = db.execute(
+                insert(table).returning(table.c.assignment_id, table.c.task_id, table.c.user_id),
+                assignment_rows
+            ).all()
+        else:
+            db.execute(insert(table), assignment_rows)
+            new_keys = set(new_pairs)
+            created = []
+            for chunk in _chunks({task_id for task_id, _ in new_pairs}):
+                created.extend(row for row in db.query(
+                    models.TaskAssignment.assignment_id, models.TaskAssignment.task_id, models.TaskAssignment.user_id
+                ).filter(models.TaskAssignment.task_id.in_(chunk)) if (row.task_id, row.user_id) in new_keys)
+        
+        db.execute(insert(models.Notification), [
+            {"user_id": user_id, "message": f"🎯 New task assigned: {task_info(task_id)}",
+             "created_date": now, "is_read": False}
+            for task_id, user_id in new_pairs
+        ])
+        if assigned_by:
+            db.execute(insert(models.AuditLog), [
+                {"user_id": assigned_by, "action": "ASSIGN_TASK", "entity_type": "Task", "entity_id": task_id,
+                 "details": f"Assigned task {task_id} to user {user_id}", "timestamp": now}
+                for task_id, user_id in new_pairs
+            ])
+        if commit:
+            db.commit()
+    except IntegrityError:
+        # A concurrent request assigned one of the pairs first
+        db.rollback()
+        return {"assignments": [], "errors": errors + ["Some tasks were assigned concurrently; no assignments were created"]}
+    
+    return {
+        "assignments": sorted(
+            ({"assignment_id": row.assignment_id, "task_id": row.task_id, "user_id": row.user_id} for row in created),
+            key=lambda a: a["assignment_id"]
+        ),
+        "errors": errors
+    }
+
 def get_task_assignments_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
     from sqlalchemy.orm import joinedload
     return db.query(models.TaskAssignment).options(
@@ -79,32 +288,126 @@ def delete_task_assignment(db: Session, assignment_id: int):
     return True
 
 # Annotation functions
+def _insert_annotation_labels(db: Session, annotation_id: int, label_ids: List[int]):
+    """Add label links with a single executemany INSERT"""
+    rows = [{"annotation_id": annotation_id, "label_id": label_id} for label_id in dict.fromkeys(label_ids)]
+    if rows:
+        db.execute(insert(models.AnnotationLabel), rows)
+
 def create_annotation(db: Session, annotation: schemas.AnnotationCreate):
-    # Create the annotation
+    # Create the annotation (create_date set here so no refresh is needed after commit)
     db_annotation = models.Annotation(
         task_id=annotation.task_id,
         user_id=annotation.user_id,
-        content=annotation.content
+        content=annotation.content,
+        create_date=datetime.utcnow()
     )
     db.add(db_annotation)
     db.flush()  # Flush to get the annotation_id
     
     # Add labels (many-to-many relationship)
-    for label_id in annotation.label_ids:
-        annotation_label = models.AnnotationLabel(
-            annotation_id=db_annotation.annotation_id,
-            label_id=label_id
-        )
-        db.add(annotation_label)
+    _insert_annotation_labels(db, db_annotation.annotation_id, annotation.label_ids)
+    AnnotatorStatsService.record_annotations(db, [db_annotation])
     
-    db.commit()
-    db.refresh(db_annotation)
+    _commit_keep_loaded(db)
     
     # Log the action
     log_audit(db, annotation.user_id, "CREATE_ANNOTATION", f"Created annotation {db_annotation.annotation_id}")
     
     return db_annotation
 
+# Bulk ingest
+BULK_CHUNK_SIZE = 1000
+
+def bulk_create_annotations(db: Session, items: List[Any], start_index: int = 0) -> Dict[str, Any]:
+    """
+    Validate and insert a batch of annotations in one transaction
+
+    Items are validated together: task, user and label references are checked
+    with one IN query each. Invalid items are skipped and reported by their
+    position in the request (start_index + offset), the rest are inserted.
+
+    Returns:
+        Dict with 'created' count and per-item 'errors'
+    """
+    errors = []
+    parsed = []
+    for offset, item in enumerate(items):
+        index = start_index + offset
+        if isinstance(item, Exception):
+            errors.append({"index": index, "error": str(item)})
+            continue
+        try:
+            parsed.append((index, schemas.AnnotationCreate.model_validate(item)))
+        except ValidationError as e:
+            errors.append({"index": index, "error": "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            )})
+    
+    if not parsed:
+        return {"created": 0, "errors": errors}
+    
+    task_ids = {a.task_id for _, a in parsed}
+    user_ids = {a.user_id for _, a in parsed}
+    label_ids = {label_id for _, a in parsed for label_id in a.label_ids}
+    
+    known_tasks = {row[0] for row in db.query(models.AnnotationTask.task_id).filter(
+        models.AnnotationTask.task_id.in_(task_ids))}
+    known_users = {row[0] for row in db.query(models.User.user_id).filter(
+        models.User.user_id.in_(user_ids))}
+    known_labels = {row[0] for row in db.query(models.Label.label_id).filter(
+        models.Label.label_id.in_(label_ids))} if label_ids else set()
+    
+    valid = []
+    for index, annotation in parsed:
+        problems = []
+        if annotation.task_id not in known_tasks:
+            problems.append(f"Task {annotation.task_id} not found")
+        if annotation.user_id not in known_users:
+            problems.append(f"User {annotation.user_id} not found")
+        missing_labels = [l for l in annotation.label_ids if l not in known_labels]
+        if missing_labels:
+            problems.append(f"Labels not found: {missing_labels}")
+        if problems:
+            errors.append({"index": index, "error": "; ".join(problems)})
+        else:
+            valid.append((index, annotation))
+    
+    if not valid:
+        return {"created": 0, "errors": errors}
+    
+    now = datetime.utcnow()
+    db_annotations = [
+        models.Annotation(task_id=a.task_id, user_id=a.user_id, content=a.content, create_date=now)
+        for _, a in valid
+    ]
+    try:
+        db.add_all(db_annotations)
+        db.flush()  # Batched INSERT, assigns annotation_ids
+        
+        label_rows = [
+            {"annotation_id": db_annotation.annotation_id, "label_id": label_id}
+            for db_annotation, (_, a) in zip(db_annotations, valid)
+            for label_id in dict.fromkeys(a.label_ids)
+        ]
+        if label_rows:
+            db.execute(insert(models.AnnotationLabel), label_rows)
+        AnnotatorStatsService.record_annotations(db, db_annotations)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        errors.extend({"index": index, "error": f"Batch insert failed: {e}"} for index, _ in valid)
+        return {"created": 0, "errors": errors}
+    
+    # One audit event per annotator for the whole batch
+    per_user = {}
+    for _, a in valid:
+        per_user[a.user_id] = per_user.get(a.user_id, 0) + 1
+    for user_id, count in per_user.items():
+        log_audit(db, user_id, "BULK_CREATE_ANNOTATIONS", f"Created {count} annotations")
+    
+    return {"created": len(valid), "errors": errors}
+
 def get_annotation(db: Session, annotation_id: int):
     return db.query(models.Annotation).filter(models.Annotation.annotation_id == annotation_id).first()
 
@@ -133,15 +436,9 @@ def update_annotation(db: Session, annotation_id: int, annotation_update: schema
         ).delete()
         
         # Add new labels
-        for label_id in annotation_update.label_ids:
-            annotation_label = models.AnnotationLabel(
-                annotation_id=annotation_id,
-                label_id=label_id
-            )
-            db.add(annotation_label)
+        _insert_annotation_labels(db, annotation_id, annotation_update.label_ids)
     
-    db.commit()
-    db.refresh(db_annotation)
+    _commit_keep_loaded(db)
     
     # Log the action
     log_audit(db, user_id, "UPDATE_ANNOTATION", f"Updated annotation {annotation_id}")
@@ -153,7 +450,14 @@ def delete_annotation(db: Session, annotation_id: int, user_id: int):
     if not db_annotation:
         return False
     
+    annotator_id = db_annotation.user_id
+    created = db_annotation.create_date
+    
     db.delete(db_annotation)
+    db.flush()
+    if created is not None:
+        # Later days can gain a "first annotation" of the task, so rebuild from that day on
+        AnnotatorStatsService.rebuild(db, annotator_id, start_day=created.date(), commit=False)
     db.commit()
     
     # Log the action
@@ -163,20 +467,29 @@ def delete_annotation(db: Session, annotation_id: int, user_id: int):
 
 # Review functions
 def create_review(db: Session, review: schemas.ReviewCreate):
-    db_review = models.Review(**review.dict())
+    annotation = db.query(models.Annotation.user_id, models.Annotation.create_date).filter(
+        models.Annotation.annotation_id == review.annotation_id
+    ).first()
+    annotator_id = annotation.user_id if annotation else None
+    
+    now = datetime.utcnow()
+    db_review = models.Review(**review.dict(), review_date=now)
     db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
+    if annotation:
+        AnnotatorStatsService.record_review(
+            db, annotation.user_id, annotation.create_date, db_review.status, db_review.quality_score
+        )
     
     # Notify the annotation creator
-    annotation = get_annotation(db, review.annotation_id)
-    if annotation:
+    if annotator_id is not None:
         notification = models.Notification(
-            user_id=annotation.user_id,
-            message=f"Your annotation #{review.annotation_id} has been reviewed: {review.status.value}"
+            user_id=annotator_id,
+            message=f"Your annotation #{review.annotation_id} has been reviewed: {review.status.value}",
+            created_date=now
         )
         db.add(notification)
-        db.commit()
+    
+    _commit_keep_loaded(db)
     
     # Log the action
     log_audit(db, review.reviewer_id, "CREATE_REVIEW", f"Reviewed annotation {review.annotation_id}")
@@ -200,25 +513,46 @@ def update_review(db: Session, review_id: int, review_update: schemas.ReviewUpda
     for key, value in update_data.items():
         setattr(db_review, key, value)
     
+    if 'status' in update_data or 'quality_score' in update_data:
+        db.flush()
+        annotation = db_review.annotation
+        if annotation is not None and annotation.create_date is not None:
+            day = annotation.create_date.date()
+            AnnotatorStatsService.rebuild(db, annotation.user_id, day, day, commit=False)
+    
     db.commit()
     db.refresh(db_review)
     return db_review
 
 # Audit Log function
-def log_audit(db: Session, user_id: int, action: str, details: Optional[str] = None):
-    audit_log = models.AuditLog(
-        user_id=user_id,
-        action=action,
-        details=details
-    )
-    db.add(audit_log)
-    db.commit()
+def log_audit(db: Session, user_id: int, action: str, details: Optional[str] = None,
+              entity_type: Optional[str] = None, entity_id: Optional[int] = None):
+    # Queued for the background audit writer - never commits the caller's session.
+    # Events become visible in get_audit_logs after the next flush (AUDIT_FLUSH_INTERVAL_MS).
+    audit_sink.emit(user_id, action, details, entity_type=entity_type, entity_id=entity_id)
 
-def get_audit_logs(db: Session, user_id: Optional[int] = None, skip: int = 0, limit: int = 100):
+def get_audit_logs(db: Session, user_id: Optional[int] = None, skip: int = 0, limit: int = 100,
+                   start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   include_archived: bool = False):
     query = db.query(models.AuditLog)
     if user_id:
         query = query.filter(models.AuditLog.user_id == user_id)
-    return query.order_by(models.AuditLog.timestamp.desc()).offset(skip).limit(limit).all()
+    if start:
+        query = query.filter(models.AuditLog.timestamp >= start)
+    if end:
+        query = query.filter(models.AuditLog.timestamp < end)
+    query = query.order_by(models.AuditLog.timestamp.desc())
+    
+    if not include_archived:
+        return query.offset(skip).limit(limit).all()
+    
+    # Merge the newest skip+limit rows of the hot table with archived months
+    from services.audit_archive import AuditArchiveService
+    needed = skip + limit
+    hot = query.limit(needed).all()
+    archived = AuditArchiveService.query_archives(user_id, start, end, needed)
+    merged = sorted(hot + archived, key=lambda log: log.timestamp if isinstance(log, models.AuditLog) else log['timestamp'], reverse=True)
+    return merged[skip:needed]
 
 # Notification functions
 def create_notification(db: Session, notification: schemas.NotificationCreate):
@@ -9,6 +9,7 @@ import models
 import schemas
 import json
 from datetime import datetime
+from services.annotator_stats import AnnotatorStatsService
 
 class AnnotationTypeService:
     """
@@ -339,6 +340,7 @@ class AnnotationTypeService:
             )
             db.add(annotation_label)
         
+        AnnotatorStatsService.record_annotations(db, [db_annotation])
         db.commit()
         db.refresh(db_annotation)
         
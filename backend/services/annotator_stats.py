@@ -0,0 +1,286 @@
+"""
+Annotator Statistics Rollup
+Daily per-annotator counters (Annotator_Daily_Stats) kept up to date by the
+annotation and review write paths, so any N-day window is a sum over N rows
+"""
+from datetime import datetime, date, time, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import func, case, delete, insert
+from sqlalchemy.orm import Session
+import models
+
+
+COUNTERS = (
+    'annotations', 'tasks_started', 'reviews', 'approved', 'rejected',
+    'pending', 'quality_sum', 'quality_count'
+)
+
+StatsKey = Tuple[int, date]
+
+
+def _as_date(value) -> Optional[date]:
+    """DATE() comes back as a string on SQLite and a date elsewhere"""
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+class AnnotatorStatsService:
+    """Maintain and query the daily annotator rollup"""
+
+    # ---------- Incremental maintenance ----------
+
+    @staticmethod
+    def _apply_deltas(db: Session, deltas: Dict[StatsKey, Dict[str, float]]):
+        """Add counter deltas to their (user_id, day) rows with one upsert statement"""
+        if not deltas:
+            return
+
+        table = models.AnnotatorDailyStats.__table__
+        now = datetime.utcnow()
+        rows = [
+            dict({counter: values.get(counter, 0) for counter in COUNTERS},
+                 user_id=user_id, day=day, updated_at=now)
+            for (user_id, day), values in deltas.items()
+        ]
+
+        dialect = db.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(table)
+            set_ = {counter: table.c[counter] + stmt.excluded[counter] for counter in COUNTERS}
+            set_['updated_at'] = stmt.excluded.updated_at
+            db.execute(stmt.on_conflict_do_update(index_elements=['user_id', 'day'], set_=set_), rows)
+        elif dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+            stmt = mysql_insert(table)
+            set_ = {counter: table.c[counter] + stmt.inserted[counter] for counter in COUNTERS}
+            set_['updated_at'] = stmt.inserted.updated_at
+            db.execute(stmt.on_duplicate_key_update(set_), rows)
+        else:
+            for row in rows:
+                existing = db.get(models.AnnotatorDailyStats, (row['user_id'], row['day']))
+                if existing is None:
+                    db.add(models.AnnotatorDailyStats(**row))
+                    continue
+                for counter in COUNTERS:
+                    setattr(existing, counter, getattr(existing, counter) + row[counter])
+                existing.updated_at = now
+            db.flush()
+
+    @staticmethod
+    def record_annotations(db: Session, annotations: List[models.Annotation]):
+        """
+        Count newly flushed annotations (call before commit, in the same transaction)
+
+        A task counts as started on the day of the user's first annotation on it.
+        """
+        annotations = [a for a in annotations if a.create_date is not None]
+        if not annotations:
+            return
+
+        new_per_pair: Dict[Tuple[int, int], List[models.Annotation]] = {}
+        for annotation in annotations:
+            new_per_pair.setdefault((annotation.user_id, annotation.task_id), []).append(annotation)
+
+        totals = {
+            (user_id, task_id): count
+            for user_id, task_id, count in db.query(
+                models.Annotation.user_id, models.Annotation.task_id, func.count(models.Annotation.annotation_id)
+            ).filter(
+                models.Annotation.user_id.in_({user_id for user_id, _ in new_per_pair}),
+                models.Annotation.task_id.in_({task_id for _, task_id in new_per_pair})
+            ).group_by(models.Annotation.user_id, models.Annotation.task_id)
+            if (user_id, task_id) in new_per_pair
+        }
+
+        deltas: Dict[StatsKey, Dict[str, float]] = {}
+        for annotation in annotations:
+            entry = deltas.setdefault((annotation.user_id, annotation.create_date.date()), {})
+            entry['annotations'] = entry.get('annotations', 0) + 1
+
+        for pair, new in new_per_pair.items():
+            if totals.get(pair, len(new)) > len(new):
+                continue  # The user had already worked on this task
+            first = min(new, key=lambda a: a.create_date)
+            entry = deltas[(first.user_id, first.create_date.date())]
+            entry['tasks_started'] = entry.get('tasks_started', 0) + 1
+
+        AnnotatorStatsService._apply_deltas(db, deltas)
+
+    @staticmethod
+    def record_review(
+        db: Session,
+        annotator_id: int,
+        annotation_date: Optional[datetime],
+        status: models.ReviewStatus,
+        quality_score: Optional[float]
+    ):
+        """Count a new review against the day its annotation was created"""
+        if annotation_date is None:
+            return
+
+        delta = {'reviews': 1}
+        if status == models.ReviewStatus.APPROVED:
+            delta['approved'] = 1
+        elif status == models.ReviewStatus.REJECTED:
+            delta['rejected'] = 1
+        elif status == models.ReviewStatus.PENDING:
+            delta['pending'] = 1
+        if quality_score is not None:
+            delta['quality_sum'] = quality_score
+            delta['quality_count'] = 1
+
+        AnnotatorStatsService._apply_deltas(db, {(annotator_id, annotation_date.date()): delta})
+
+    # ---------- Rebuild / backfill ----------
+
+    @staticmethod
+    def rebuild(
+        db: Session,
+        user_id: Optional[int] = None,
+        start_day: Optional[date] = None,
+        end_day: Optional[date] = None,
+        commit: bool = True
+    ) -> int:
+        """
+        Recompute rollup rows from the raw tables with three grouped queries
+
+        Used for backfill and after edits that can't be applied as deltas
+        (review updates, annotation deletes).
+
+        Returns:
+            Number of rollup rows written
+        """
+        annotation = models.Annotation
+        table = models.AnnotatorDailyStats.__table__
+
+        def in_range(column):
+            conditions = []
+            if user_id is not None:
+                conditions.append(annotation.user_id == user_id)
+            if start_day is not None:
+                conditions.append(column >= datetime.combine(start_day, time.min))
+            if end_day is not None:
+                conditions.append(column < datetime.combine(end_day + timedelta(days=1), time.min))
+            return conditions
+
+        stats: Dict[StatsKey, Dict[str, float]] = {}
+
+        def entry(row_user_id, row_day) -> Dict[str, float]:
+            return stats.setdefault((row_user_id, _as_date(row_day)), {counter: 0 for counter in COUNTERS})
+
+        day = func.date(annotation.create_date)
+        for row_user_id, row_day, count in db.query(
+            annotation.user_id, day, func.count(annotation.annotation_id)
+        ).filter(*in_range(annotation.create_date)).group_by(annotation.user_id, day):
+            entry(row_user_id, row_day)['annotations'] = count
+
+        first = db.query(
+            annotation.user_id,
+            func.min(annotation.create_date).label('first_date')
+        ).filter(
+            *([annotation.user_id == user_id] if user_id is not None else [])
+        ).group_by(annotation.user_id, annotation.task_id).subquery()
+        first_day = func.date(first.c.first_date)
+        first_conditions = []
+        if start_day is not None:
+            first_conditions.append(first.c.first_date >= datetime.combine(start_day, time.min))
+        if end_day is not None:
+            first_conditions.append(first.c.first_date < datetime.combine(end_day + timedelta(days=1), time.min))
+        for row_user_id, row_day, count in db.query(
+            first.c.user_id, first_day, func.count()
+        ).filter(*first_conditions).group_by(first.c.user_id, first_day):
+            entry(row_user_id, row_day)['tasks_started'] = count
+
+        for row in db.query(
+            annotation.user_id,
+            day.label('day'),
+            func.count(models.Review.review_id).label('reviews'),
+            func.sum(case((models.Review.status == models.ReviewStatus.APPROVED, 1), else_=0)).label('approved'),
+            func.sum(case((models.Review.status == models.ReviewStatus.REJECTED, 1), else_=0)).label('rejected'),
+            func.sum(case((models.Review.status == models.ReviewStatus.PENDING, 1), else_=0)).label('pending'),
+            func.sum(models.Review.quality_score).label('quality_sum'),
+            func.count(models.Review.quality_score).label('quality_count')
+        ).join(
+            models.Review, models.Review.annotation_id == annotation.annotation_id
+        ).filter(*in_range(annotation.create_date)).group_by(annotation.user_id, day):
+            values = entry(row.user_id, row.day)
+            for counter in ('reviews', 'approved', 'rejected', 'pending', 'quality_sum', 'quality_count'):
+                values[counter] = getattr(row, counter) or 0
+
+        conditions = []
+        if user_id is not None:
+            conditions.append(table.c.user_id == user_id)
+        if start_day is not None:
+            conditions.append(table.c.day >= start_day)
+        if end_day is not None:
+            conditions.append(table.c.day <= end_day)
+        db.execute(delete(table).where(*conditions))
+
+        now = datetime.utcnow()
+        rows = [
+            dict(values, user_id=row_user_id, day=row_day, updated_at=now)
+            for (row_user_id, row_day), values in stats.items()
+            if row_day is not None
+        ]
+        if rows:
+            db.execute(insert(table), rows)
+
+        if commit:
+            db.commit()
+        return len(rows)
+
+    @staticmethod
+    def backfill_if_empty(db: Session) -> int:
+        """Build the rollup once for databases that have annotations but no stats yet"""
+        if db.query(models.AnnotatorDailyStats.user_id).first() is not None:
+            return 0
+        if db.query(models.Annotation.annotation_id).first() is None:
+            return 0
+        return AnnotatorStatsService.rebuild(db)
+
+    # ---------- Queries ----------
+
+    @staticmethod
+    def _window_start(days: int) -> date:
+        """First day of the last `days` UTC days, today included"""
+        return datetime.utcnow().date() - timedelta(days=max(days, 1) - 1)
+
+    @staticmethod
+    def get_window_totals(db: Session, user_id: int, days: int = 30) -> Dict[str, float]:
+        """Sum the rollup over the last `days` days (at most `days` rows)"""
+        stats = models.AnnotatorDailyStats
+        row = db.query(
+            *[func.coalesce(func.sum(getattr(stats, counter)), 0).label(counter) for counter in COUNTERS]
+        ).filter(
+            stats.user_id == user_id,
+            stats.day >= AnnotatorStatsService._window_start(days)
+        ).one()
+        return {counter: getattr(row, counter) for counter in COUNTERS}
+
+    @staticmethod
+    def get_daily_series(db: Session, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        """One entry per day of the window, zero-filled, for productivity charts"""
+        start = AnnotatorStatsService._window_start(days)
+        rows = {
+            row.day: row for row in db.query(models.AnnotatorDailyStats).filter(
+                models.AnnotatorDailyStats.user_id == user_id,
+                models.AnnotatorDailyStats.day >= start
+            )
+        }
+
+        series = []
+        for offset in range(max(days, 1)):
+            day = start + timedelta(days=offset)
+            row = rows.get(day)
+            values = {counter: getattr(row, counter) if row else 0 for counter in COUNTERS}
+            values['avg_quality'] = round(values['quality_sum'] / values['quality_count'], 2) \
+                if values['quality_count'] else None
+            series.append(dict(values, day=day.isoformat()))
+        return series
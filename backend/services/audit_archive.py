@@ -0,0 +1,323 @@
+"""
+Audit Log Partitioning & Archiving
+Keeps the hot AuditLog table limited to recent months:
+- PostgreSQL: AuditLog is range-partitioned by month on `timestamp`
+- Every backend: months older than the retention window are moved to compressed
+  archive files (Parquet/zstd when pyarrow is installed, gzip JSONL otherwise)
+  that can still be queried through the audit endpoint
+"""
+import glob
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterator
+from sqlalchemy import text, inspect, select, delete, func
+from sqlalchemy.orm import Session
+import models
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False  # Fall back to gzip-compressed JSONL archives
+
+
+AUDIT_COLUMNS = ['log_id', 'user_id', 'action', 'entity_type', 'entity_id', 'details', 'timestamp']
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month_index = value.year * 12 + (value.month - 1) + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+class AuditArchiveService:
+    """Monthly partition management and retention for AuditLog"""
+
+    ARCHIVE_DIR = os.getenv(
+        "AUDIT_ARCHIVE_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit_archive")
+    )
+    RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", 3))
+    BATCH_SIZE = 10000
+
+    # ---------- Partitioning (PostgreSQL) ----------
+
+    @staticmethod
+    def _partition_name(month: datetime) -> str:
+        return f"AuditLog_{month.year:04d}_{month.month:02d}"
+
+    @staticmethod
+    def prepare_schema(engine):
+        """
+        Create AuditLog as a monthly range-partitioned table on a fresh PostgreSQL
+        database. Must run before Base.metadata.create_all, which then skips the table.
+        Existing unpartitioned tables are left alone and archived by range deletes.
+        """
+        if engine.dialect.name != 'postgresql':
+            return
+
+        if inspect(engine).has_table(models.AuditLog.__tablename__):
+            AuditArchiveService.ensure_partitions(engine)
+            return
+
+        models.User.__table__.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            conn.execute(text('''
+                CREATE TABLE "AuditLog" (
+                    log_id SERIAL,
+                    user_id INTEGER NOT NULL REFERENCES "Users"(user_id) ON DELETE CASCADE,
+                    action VARCHAR(255) NOT NULL,
+                    entity_type VARCHAR(50),
+                    entity_id INTEGER,
+                    details TEXT,
+                    timestamp TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+                    PRIMARY KEY (log_id, timestamp)
+                ) PARTITION BY RANGE (timestamp)
+            '''))
+            conn.execute(text('CREATE TABLE "AuditLog_default" PARTITION OF "AuditLog" DEFAULT'))
+            conn.execute(text('CREATE INDEX "ix_AuditLog_timestamp" ON "AuditLog" (timestamp)'))
+            conn.execute(text('CREATE INDEX "ix_AuditLog_user_timestamp" ON "AuditLog" (user_id, timestamp)'))
+
+        AuditArchiveService.ensure_partitions(engine)
+
+    @staticmethod
+    def is_partitioned(bind) -> bool:
+        if bind.dialect.name != 'postgresql':
+            return False
+        with bind.connect() as conn:
+            relkind = conn.execute(
+                text("SELECT relkind FROM pg_class WHERE relname = 'AuditLog'")
+            ).scalar()
+        return relkind == 'p'
+
+    @staticmethod
+    def ensure_partitions(engine, months_ahead: int = 2):
+        """Create partitions for the current month and the next `months_ahead` months"""
+        if not AuditArchiveService.is_partitioned(engine):
+            return
+
+        current = _month_start(datetime.utcnow())
+        with engine.begin() as conn:
+            for offset in range(months_ahead + 1):
+                month = _add_months(current, offset)
+                name = AuditArchiveService._partition_name(month)
+                exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": f'"{name}"'}).scalar()
+                if exists:
+                    continue
+                conn.execute(text(
+                    f'CREATE TABLE "{name}" PARTITION OF "AuditLog" '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+                ))
+
+    # ---------- Retention ----------
+
+    @staticmethod
+    def archive_expired(db: Session, retention_months: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Move every month older than the retention window out of the hot table
+
+        Returns:
+            One entry per archived month with its archive file and row count
+
+        Raises:
+            ValueError: retention_months below 1 (it would archive the current month)
+        """
+        if retention_months is None:
+            retention_months = AuditArchiveService.RETENTION_MONTHS
+        if retention_months < 1:
+            raise ValueError("retention_months must be at least 1")
+
+        cutoff = _add_months(_month_start(datetime.utcnow()), -retention_months)
+        oldest = db.execute(
+            select(func.min(models.AuditLog.timestamp)).where(models.AuditLog.timestamp < cutoff)
+        ).scalar()
+
+        archived = []
+        if oldest is None:
+            return archived
+
+        month = _month_start(oldest)
+        while month < cutoff:
+            result = AuditArchiveService._archive_month(db, month)
+            if result['rows']:
+                archived.append(result)
+            month = _add_months(month, 1)
+
+        return archived
+
+    @staticmethod
+    def _archive_month(db: Session, month: datetime) -> Dict[str, Any]:
+        next_month = _add_months(month, 1)
+        os.makedirs(AuditArchiveService.ARCHIVE_DIR, exist_ok=True)
+
+        rows = AuditArchiveService._iter_hot_rows(db, month, next_month)
+        path, count = AuditArchiveService._write_archive(month, rows)
+
+        partition = AuditArchiveService._partition_name(month)
+        bind = db.get_bind()
+        if count and AuditArchiveService.is_partitioned(bind) and db.execute(
+            text("SELECT to_regclass(:name)"), {"name": f'"{partition}"'}
+        ).scalar():
+            db.execute(text(f'ALTER TABLE "AuditLog" DETACH PARTITION "{partition}"'))
+            db.execute(text(f'DROP TABLE "{partition}"'))
+
+        # Rows outside a dedicated partition (SQLite/MySQL, or the default partition)
+        db.execute(
+            delete(models.AuditLog).where(
+                models.AuditLog.timestamp >= month,
+                models.AuditLog.timestamp < next_month
+            ).execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        return {'month': month.strftime('%Y-%m'), 'rows': count, 'archive': path}
+
+    @staticmethod
+    def _iter_hot_rows(db: Session, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        table = models.AuditLog.__table__
+        result = db.execute(
+            select(*[table.c[name] for name in AUDIT_COLUMNS]).where(
+                table.c.timestamp >= start,
+                table.c.timestamp < end
+            ).order_by(table.c.timestamp).execution_options(yield_per=AuditArchiveService.BATCH_SIZE)
+        )
+        for row in result.mappings():
+            yield dict(row)
+
+    @staticmethod
+    def _next_archive_path(month: datetime, extension: str) -> str:
+        base = os.path.join(AuditArchiveService.ARCHIVE_DIR, f"audit_{month.year:04d}_{month.month:02d}")
+        path = f"{base}{extension}"
+        part = 1
+        while os.path.exists(path):
+            path = f"{base}.part{part}{extension}"
+            part += 1
+        return path
+
+    @staticmethod
+    def _write_archive(month: datetime, rows: Iterator[Dict[str, Any]]):
+        """Stream rows into a new archive file; returns (path, row_count)"""
+        extension = '.parquet' if PARQUET_AVAILABLE else '.jsonl.gz'
+        path = AuditArchiveService._next_archive_path(month, extension)
+        tmp_path = f"{path}.tmp"
+        count = 0
+
+        if PARQUET_AVAILABLE:
+            schema = pa.schema([
+                ('log_id', pa.int64()), ('user_id', pa.int64()), ('action', pa.string()),
+                ('entity_type', pa.string()), ('entity_id', pa.int64()), ('details', pa.string()),
+                ('timestamp', pa.timestamp('us'))
+            ])
+            writer = None
+            batch = []
+
+            def write_batch():
+                nonlocal writer
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+            for row in rows:
+                batch.append(row)
+                count += 1
+                if len(batch) >= AuditArchiveService.BATCH_SIZE:
+                    write_batch()
+                    batch = []
+            if batch:
+                write_batch()
+            if writer is not None:
+                writer.close()
+        else:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                for row in rows:
+                    row = dict(row, timestamp=row['timestamp'].isoformat())
+                    f.write(json.dumps(row) + '\n')
+                    count += 1
+
+        if count == 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None, 0
+
+        os.replace(tmp_path, path)
+        return path, count
+
+    # ---------- Querying archives ----------
+
+    @staticmethod
+    def list_archives() -> List[Dict[str, Any]]:
+        """Archived months, newest first"""
+        archives = {}
+        for path in glob.glob(os.path.join(AuditArchiveService.ARCHIVE_DIR, "audit_*")):
+            name = os.path.basename(path)
+            if name.endswith('.tmp'):
+                continue
+            year, month = name[len("audit_"):].split('.')[0].split('_')[:2]
+            key = f"{year}-{month}"
+            archives.setdefault(key, []).append(path)
+
+        return [
+            {'month': key, 'files': sorted(paths)}
+            for key, paths in sorted(archives.items(), reverse=True)
+        ]
+
+    @staticmethod
+    def _read_archive(path: str, user_id: Optional[int], start: Optional[datetime],
+                      end: Optional[datetime]) -> List[Dict[str, Any]]:
+        if path.endswith('.parquet'):
+            if not PARQUET_AVAILABLE:
+                print(f"Skipping {path}: pyarrow is not installed")
+                return []
+            filters = []
+            if user_id:
+                filters.append(('user_id', '=', user_id))
+            if start:
+                filters.append(('timestamp', '>=', start))
+            if end:
+                filters.append(('timestamp', '<', end))
+            return pq.read_table(path, filters=filters or None).to_pylist()
+
+        records = []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+                if user_id and record['user_id'] != user_id:
+                    continue
+                if start and record['timestamp'] < start:
+                    continue
+                if end and record['timestamp'] >= end:
+                    continue
+                records.append(record)
+        return records
+
+    @staticmethod
+    def query_archives(user_id: Optional[int] = None, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None, needed: int = 100) -> List[Dict[str, Any]]:
+        """
+        Read archived rows newest month first, stopping once `needed` rows are collected
+        """
+        records = []
+        for archive in AuditArchiveService.list_archives():
+            month = datetime.strptime(archive['month'], '%Y-%m')
+            if end and month >= end:
+                continue
+            if start and _add_months(month, 1) <= start:
+                break
+
+            month_records = []
+            for path in archive['files']:
+                month_records.extend(AuditArchiveService._read_archive(path, user_id, start, end))
+            month_records.sort(key=lambda r: r['timestamp'], reverse=True)
+            records.extend(month_records)
+
+            if len(records) >= needed:
+                break
+
+        return records
@@ -0,0 +1,170 @@
+"""
+Audit Log Sink
+Buffers audit events in memory and writes them to AuditLog with multi-row
+inserts from a background thread, so request handlers never commit for bookkeeping
+"""
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from database import engine
+import models
+
+
+class AuditSink:
+    """Queue audit events and flush them every N events or M milliseconds"""
+
+    def __init__(self, flush_events: int = 500, flush_interval_ms: int = 1000, synchronous: bool = False):
+        """
+        Args:
+            flush_events: Flush as soon as this many events are queued
+            flush_interval_ms: Flush at least this often while events are pending
+            synchronous: Write each event immediately (for serverless deployments
+                where background threads are frozen between requests)
+        """
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.synchronous = synchronous
+
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background writer (idempotent)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+            self._thread.start()
+
+    def emit(
+        self,
+        user_id: int,
+        action: str,
+        details: Optional[str] = None,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[int] = None
+    ):
+        """Enqueue an audit event; the timestamp is taken now, not at flush time"""
+        self._queue.put({
+            'user_id': user_id,
+            'action': action,
+            'entity_type': entity_type,
+            'entity_id': entity_id,
+            'details': details,
+            'timestamp': datetime.utcnow()
+        })
+
+        if self.synchronous:
+            self.flush()
+            return
+
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if self._queue.qsize() >= self.flush_events:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """
+        Write every queued event; returns the number of rows written. When the
+        database is unavailable (OperationalError) the unwritten events go back
+        on the queue for the next flush instead of being dropped.
+        """
+        with self._flush_lock:
+            rows = self._drain()
+            if not rows:
+                return 0
+
+            written = 0
+            for start in range(0, len(rows), self.flush_events):
+                batch = rows[start:start + self.flush_events]
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert(models.AuditLog.__table__), batch)
+                    written += len(batch)
+                except OperationalError as e:
+                    print(f"Audit sink flush failed, keeping {len(rows) - start} events queued: {e}")
+                    self._requeue(rows[start:])
+                    break
+                except Exception as e:
+                    print(f"Audit sink batch insert failed, retrying row by row: {e}")
+                    done, finished = self._write_rows_individually(batch)
+                    written += done
+                    if not finished:
+                        self._requeue(rows[start + self.flush_events:])
+                        break
+            return written
+
+    def stop(self):
+        """Stop the background writer and drain everything still queued"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(5.0, self.flush_interval * 2))
+            self._thread = None
+        self.flush()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _requeue(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self._queue.put(row)
+
+    def _write_rows_individually(self, rows: List[Dict[str, Any]]) -> Tuple[int, bool]:
+        """
+        Isolate bad rows (e.g. unknown user_id) so they don't block the rest
+
+        Returns:
+            Rows written, and False if the database became unavailable (the
+            rows not tried yet are queued again)
+        """
+        written = 0
+        for i, row in enumerate(rows):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(models.AuditLog.__table__), [row])
+                written += 1
+            except OperationalError as e:
+                print(f"Audit sink flush failed, keeping {len(rows) - i} events queued: {e}")
+                self._requeue(rows[i:])
+                return written, False
+            except Exception as e:
+                print(f"Dropping audit event {row['action']} for user {row['user_id']}: {e}")
+        return written, True
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Audit sink flush error: {e}")
+
+
+audit_sink = AuditSink(
+    flush_events=int(os.getenv("AUDIT_FLUSH_EVENTS", 500)),
+    flush_interval_ms=int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", 1000)),
+    synchronous=os.getenv("AUDIT_SINK_SYNC", "False").lower() == "true"
+)
+
+# Durable drain when the interpreter exits without a clean ASGI shutdown
+atexit.register(audit_sink.stop)
@@ -0,0 +1,271 @@
+"""
+Content-Addressed Blob Store
+Uploaded files are stored once under their SHA-256 (objects/ab/cd/<sha256>);
+the Blob and Dataset_Blob tables map datasets to that content, so uploading
+a file that is already stored only adds metadata.
+
+Blob.ref_count counts the datasets using the content plus uploads that have
+stored it but not created their dataset yet. An upload pins the row (and
+commits) under BlobStore.lock() before it trusts an existing file, and files
+are only removed under the same lock after re-checking that the row is gone,
+so a dataset delete can't remove content an upload is deduplicating against.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Optional, Set
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+import models
+from services.upload_stats import UploadStatsService
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialized
+    fcntl = None
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BlobStore:
+    """Files on local disk addressed by their SHA-256 hex digest"""
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self._lock = threading.Lock()
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    def new_temp_path(self) -> str:
+        """Staging path on the same filesystem, so committing is a rename"""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    @contextmanager
+    def lock(self):
+        """Exclusive across the threads and processes sharing this store"""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(os.path.join(self.root, ".lock"), 'a') as handle:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX)  # Released when the handle closes
+            yield
+
+    def commit_file(self, tmp_path: str, sha256: str, size: int, mime_type: Optional[str] = None) -> bool:
+        """
+        Pin the content's Blob row, then move a staged file into place under
+        its hash. Pass the result to bulk_create_datasets() with 'pinned': True
+        so the pin becomes the new dataset's reference.
+
+        Returns:
+            True if the content was new, False if it was already stored
+            (the staged copy is discarded)
+        """
+        final_path = self.path_for(sha256)
+        with self.lock():
+            db = SessionLocal()
+            try:
+                pin_blobs(db, [{'sha256': sha256, 'size': size, 'mime_type': mime_type}])
+                db.commit()
+            finally:
+                db.close()
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                return False
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            return True
+
+    def index_path_for(self, sha256: str, fmt: str) -> str:
+        """Row offset index sidecar (services.row_index); per format, since CSV rows differ from lines"""
+        return f"{self.path_for(sha256)}.{fmt}.rowidx"
+    
+    def commit_index(self, tmp_path: str, sha256: str, fmt: str):
+        """Move a staged row index next to its blob, unless one already exists"""
+        final_path = self.index_path_for(sha256, fmt)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, final_path)
+    
+    def delete(self, sha256: str):
+        path = self.path_for(sha256)
+        directory = os.path.dirname(path)
+        sidecars = [name for name in os.listdir(directory) if name.startswith(f"{sha256}.")] \
+            if os.path.isdir(directory) else []
+        for name in [sha256] + sidecars:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(BlobStore.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+blob_store = BlobStore(os.getenv("BLOB_STORE_DIR", os.path.join(BACKEND_DIR, "uploads", "blobs")))
+
+
+def find_existing_blobs(db: Session, hashes: Iterable[str]) -> Set[str]:
+    """Which of the given hashes already have a Blob row"""
+    hashes = list(set(hashes))
+    existing = set()
+    for start in range(0, len(hashes), 500):
+        existing.update(row.sha256 for row in db.query(models.Blob.sha256).filter(
+            models.Blob.sha256.in_(hashes[start:start + 500])
+        ))
+    return existing
+
+
+def _adjust_ref_counts(db: Session, counts: Dict[str, int], sign: int = 1) -> int:
+    """Add sign * count to each existing row's ref_count; returns the number of rows changed"""
+    table = models.Blob.__table__
+    by_count: Dict[int, List[str]] = {}
+    for sha256, count in counts.items():
+        by_count.setdefault(count, []).append(sha256)
+    changed = 0
+    for count, hashes in by_count.items():
+        for start in range(0, len(hashes), 500):
+            changed += db.execute(
+                update(table)
+                .where(table.c.sha256.in_(hashes[start:start + 500]))
+                .values(ref_count=table.c.ref_count + sign * count)
+            ).rowcount
+    return changed
+
+
+def pin_blobs(db: Session, files: List[Dict[str, Any]]):
+    """
+    Add one reference per entry to each file's Blob row, inserting the rows
+    that don't exist yet (no commit). Racing inserts of the same content bump
+    the count instead of failing on the primary key.
+
+    Args:
+        files: Dicts with 'sha256', 'size' and optionally 'mime_type'
+    """
+    counts = Counter(f['sha256'] for f in files)
+    if not counts:
+        return
+    unique = {f['sha256']: f for f in files}
+    table = models.Blob.__table__
+    now = datetime.utcnow()
+    rows = [{
+        'sha256': sha256,
+        'size': unique[sha256]['size'],
+        'mime_type': unique[sha256].get('mime_type'),
+        'ref_count': count,
+        'created_at': now
+    } for sha256, count in counts.items()]
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table)
+        db.execute(stmt.on_conflict_do_update(index_elements=['sha256'], set_={
+            'ref_count': table.c.ref_count + stmt.excluded.ref_count
+        }), rows)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        db.execute(stmt.on_duplicate_key_update({
+            'ref_count': table.c.ref_count + stmt.inserted.ref_count
+        }), rows)
+    else:
+        for row in rows:
+            existing = db.get(models.Blob, row['sha256'])
+            if existing is None:
+                db.add(models.Blob(**row))
+            else:
+                existing.ref_count += row['ref_count']
+        db.flush()
+
+    # Rows holding exactly what was just added are the ones this call created
+    # (rows are deleted when their count drops to zero)
+    hashes = list(counts)
+    new_sizes = []
+    for start in range(0, len(hashes), 500):
+        new_sizes.extend(
+            unique[sha256]['size'] for sha256, ref_count in db.query(models.Blob.sha256, models.Blob.ref_count).filter(
+                models.Blob.sha256.in_(hashes[start:start + 500])
+            ) if ref_count == counts[sha256]
+        )
+    UploadStatsService.record_blobs(db, new_sizes)
+
+
+def register_blobs(db: Session, files: List[Dict[str, Any]]):
+    """
+    Count a new dataset reference for each file (no commit). Files stored by
+    BlobStore.commit_file() ('pinned': True) already hold theirs; the others
+    name content that must still have a Blob row.
+
+    Raises:
+        ValueError: content was deleted since its hash was checked
+    """
+    counts = Counter(f['sha256'] for f in files if not f.get('pinned'))
+    if counts and _adjust_ref_counts(db, counts) != len(counts):
+        missing = set(counts) - find_existing_blobs(db, counts)
+        raise ValueError(f"Content no longer stored: {', '.join(sorted(missing))}")
+
+
+def release_blobs(db: Session, hashes: Iterable[str]) -> List[str]:
+    """
+    Drop one reference per hash and delete the Blob rows left without any
+    (no commit)
+
+    Returns:
+        Hashes to pass to remove_unreferenced() once the transaction commits
+    """
+    counts = Counter(hashes)
+    if not counts:
+        return []
+    _adjust_ref_counts(db, counts, sign=-1)
+    hashes = list(counts)
+    orphaned, sizes = [], []
+    for start in range(0, len(hashes), 500):
+        for sha256, size in db.query(models.Blob.sha256, models.Blob.size).filter(
+            models.Blob.sha256.in_(hashes[start:start + 500]), models.Blob.ref_count <= 0
+        ):
+            orphaned.append(sha256)
+            sizes.append(size)
+    for start in range(0, len(orphaned), 500):
+        db.query(models.Blob).filter(
+            models.Blob.sha256.in_(orphaned[start:start + 500])
+        ).delete(synchronize_session=False)
+    UploadStatsService.record_blobs(db, sizes, sign=-1)
+    return orphaned
+
+
+def remove_unreferenced(db: Session, hashes: Iterable[str]):
+    """
+    Remove the files of released content, skipping any an upload pinned again
+    after the release committed
+    """
+    hashes = list(hashes)
+    if not hashes:
+        return
+    with blob_store.lock():
+        pinned = find_existing_blobs(db, hashes)
+        for sha256 in hashes:
+            if sha256 not in pinned:
+                blob_store.delete(sha256)
@@ -3,12 +3,29 @@ Bulk Upload Service
 Handles multiple file uploads, ZIP extraction, and batch processing
 """
 import os
+import csv
+import queue
+import asyncio
+import hashlib
 import zipfile
-import shutil
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 import mimetypes
 from pathlib import Path
+from services.blob_store import blob_store
+from services import row_index
+from services.json_stream import iter_json_file
+
+
+class UploadTooLargeError(ValueError):
+    """Raised while streaming once an upload passes its size limit"""
+    
+    def __init__(self, size: int, limit: int):
+        self.size = size
+        self.limit = limit
+        super().__init__(f"Upload exceeds {limit / 1024 / 1024:.0f}MB limit")
 
 
 class BulkUploadService:
@@ -24,6 +41,141 @@ class BulkUploadService:
     
     MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB per file
     MAX_TOTAL_SIZE = 500 * 1024 * 1024  # 500MB total
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read/written per step while streaming
+    
+    # ZIP extraction limits (zip-bomb guards) and parallelism
+    MAX_ZIP_MEMBERS = 10000
+    MAX_ZIP_UNCOMPRESSED = 2 * 1024 * 1024 * 1024  # 2GB expanded
+    MAX_COMPRESSION_RATIO = 100
+    ZIP_EXTRACT_WORKERS = int(os.getenv("ZIP_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+    
+    @staticmethod
+    def _write_chunk(f, digest, chunk: bytes, index_builder=None):
+        digest.update(chunk)
+        if index_builder:
+            index_builder.feed(chunk)
+        f.write(chunk)
+    
+    @staticmethod
+    async def stream_to_file(
+        upload: UploadFile,
+        dest_path: str,
+        max_size: Optional[int] = None,
+        index_format: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Copy an upload to disk in UPLOAD_CHUNK_SIZE pieces, hashing as it goes
+        
+        Disk writes and hashing run in the threadpool so the event loop stays
+        free; memory use is one chunk regardless of file size. The data is
+        written to `dest_path + '.part'` and renamed once complete. For
+        line-oriented formats (`index_format` csv/jsonl/txt) a row offset
+        index is built in the same pass and written to `dest_path + '.rowidx'`.
+        
+        Raises:
+            UploadTooLargeError: as soon as more than `max_size` bytes arrive
+                (the partial file is removed)
+        
+        Returns:
+            Dict with 'path', 'size', 'sha256' and 'row_index' (index path or None)
+        """
+        if max_size is not None and upload.size is not None and upload.size > max_size:
+            raise UploadTooLargeError(upload.size, max_size)
+        
+        tmp_path = f"{dest_path}.part"
+        digest = hashlib.sha256()
+        index_builder = row_index.new_builder(index_format) if index_format else None
+        size = 0
+        
+        f = await run_in_threadpool(open, tmp_path, 'wb')
+        try:
+            while True:
+                chunk = await upload.read(BulkUploadService.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLargeError(size, max_size)
+                await run_in_threadpool(BulkUploadService._write_chunk, f, digest, chunk, index_builder)
+        except BaseException:
+            await run_in_threadpool(f.close)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        await run_in_threadpool(f.close)
+        os.replace(tmp_path, dest_path)
+        index_path = None
+        if index_builder:
+            index_path = f"{dest_path}{row_index.INDEX_SUFFIX}"
+            await run_in_threadpool(index_builder.write, index_path)
+        return {'path': dest_path, 'size': size, 'sha256': digest.hexdigest(), 'row_index': index_path}
+    
+    @staticmethod
+    def summarize_file(file_path: str, file_ext: str, preview_size: int = 5) -> Tuple[int, List[Any]]:
+        """
+        Count items and collect a short preview without holding the file in memory
+        (CSV rows and TXT lines are streamed, JSON array elements decoded one at a time)
+        
+        Returns:
+            (item_count, preview_items)
+        """
+        preview = []
+        count = 0
+        
+        if file_ext == 'csv':
+            with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    if count < preview_size:
+                        preview.append(row)
+                    count += 1
+        elif file_ext == 'json':
+            for item in iter_json_file(file_path):
+                if count < preview_size:
+                    preview.append(item)
+                count += 1
+        elif file_ext == 'txt':
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    text = line.strip()
+                    if not text:
+                        continue
+                    if count < preview_size:
+                        preview.append({'text': text, 'line_number': line_number})
+                    count += 1
+        else:
+            # Images and other files are a single item referencing the file
+            preview = [{'file_path': file_path, 'filename': os.path.basename(file_path)}]
+            count = 1
+        
+        return count, preview
+    
+    @staticmethod
+    async def stream_to_blob(upload: UploadFile, max_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Stream an upload into the content-addressed blob store, with a row
+        offset index for line-oriented files
+        
+        Returns:
+            Dict with 'sha256', 'size', 'path', 'deduplicated' (True when the
+            content was already stored and the new copy was discarded) and
+            'pinned' (see BlobStore.commit_file)
+        """
+        fmt = row_index.normalize_format(Path(upload.filename or '').suffix)
+        stored = await BulkUploadService.stream_to_file(upload, blob_store.new_temp_path(), max_size, fmt)
+        created = await run_in_threadpool(
+            blob_store.commit_file, stored['path'], stored['sha256'], stored['size'],
+            mimetypes.guess_type(upload.filename or '')[0]
+        )
+        if stored['row_index']:
+            await run_in_threadpool(blob_store.commit_index, stored['row_index'], stored['sha256'], fmt)
+        return {
+            'sha256': stored['sha256'],
+            'size': stored['size'],
+            'path': blob_store.path_for(stored['sha256']),
+            'deduplicated': not created,
+            'pinned': True
+        }
     
     @staticmethod
     def get_file_type(filename: str) -> str:
@@ -63,22 +215,16 @@ class BulkUploadService:
         }
     
     @staticmethod
-    async def upload_multiple_files(
-        files: List[UploadFile],
-        upload_dir: str = "backend/uploads/datasets"
-    ) -> Dict[str, Any]:
+    async def upload_multiple_files(files: List[UploadFile]) -> Dict[str, Any]:
         """
-        Upload multiple files at once
+        Upload multiple files at once into the blob store
         
         Args:
             files: List of UploadFile objects
-            upload_dir: Directory to save files
         
         Returns:
             Dict with upload results
         """
-        os.makedirs(upload_dir, exist_ok=True)
-        
         results = {
             'success': [],
             'failed': [],
@@ -99,48 +245,35 @@ class BulkUploadService:
                     })
                     continue
                 
-                # Read file content
-                content = await file.read()
-                file_size = len(content)
-                
-                # Check file size
-                if file_size > BulkUploadService.MAX_FILE_SIZE:
-                    results['failed'].append({
-                        'filename': file.filename,
-                        'reason': f'File too large: {file_size / 1024 / 1024:.2f}MB (max 100MB)'
-                    })
-                    continue
-                
-                # Check total size
-                if total_size + file_size > BulkUploadService.MAX_TOTAL_SIZE:
+                # Stream to the blob store, enforcing the per-file and remaining total limits
+                remaining = BulkUploadService.MAX_TOTAL_SIZE - total_size
+                try:
+                    stored = await BulkUploadService.stream_to_blob(
+                        file, min(BulkUploadService.MAX_FILE_SIZE, remaining)
+                    )
+                except UploadTooLargeError as e:
+                    if e.size > BulkUploadService.MAX_FILE_SIZE:
+                        reason = f'File too large: over {BulkUploadService.MAX_FILE_SIZE / 1024 / 1024:.0f}MB (max 100MB)'
+                    else:
+                        reason = 'Total upload size exceeded (max 500MB)'
                     results['failed'].append({
                         'filename': file.filename,
-                        'reason': 'Total upload size exceeded (max 500MB)'
+                        'reason': reason
                     })
                     continue
                 
-                # Save file
-                file_path = os.path.join(upload_dir, file.filename)
-                
-                # Handle duplicate filenames
-                if os.path.exists(file_path):
-                    name, ext = os.path.splitext(file.filename)
-                    counter = 1
-                    while os.path.exists(file_path):
-                        file_path = os.path.join(upload_dir, f"{name}_{counter}{ext}")
-                        counter += 1
-                
-                with open(file_path, "wb") as f:
-                    f.write(content)
-                
-                total_size += file_size
+                total_size += stored['size']
                 
                 results['success'].append({
-                    'filename': file.filename,
-                    'saved_as': os.path.basename(file_path),
-                    'size': file_size,
+                    'filename': os.path.basename(file.filename),
+                    'saved_as': stored['sha256'],
+                    'size': stored['size'],
+                    'sha256': stored['sha256'],
+                    'deduplicated': stored['deduplicated'],
+                    'pinned': stored['pinned'],
                     'file_type': validation['file_type'],
-                    'path': file_path
+                    'mime_type': validation['mime_type'],
+                    'path': stored['path']
                 })
                 
             except Exception as e:
@@ -156,22 +289,104 @@ class BulkUploadService:
         return results
     
     @staticmethod
-    async def extract_and_upload_zip(
-        zip_file: UploadFile,
-        upload_dir: str = "backend/uploads/datasets"
-    ) -> Dict[str, Any]:
+    def check_zip_limits(infos: List[zipfile.ZipInfo]) -> Optional[str]:
+        """
+        Reject archives that look like zip bombs, using the central directory
+        before anything is decompressed
+        
+        Returns:
+            Error message, or None if the archive is within limits
         """
-        Extract ZIP file and upload all contents
+        if len(infos) > BulkUploadService.MAX_ZIP_MEMBERS:
+            return f'ZIP has too many entries: {len(infos)} (max {BulkUploadService.MAX_ZIP_MEMBERS})'
+        
+        total = sum(info.file_size for info in infos)
+        if total > BulkUploadService.MAX_ZIP_UNCOMPRESSED:
+            return (f'ZIP expands to {total / 1024 / 1024:.0f}MB '
+                    f'(max {BulkUploadService.MAX_ZIP_UNCOMPRESSED / 1024 / 1024:.0f}MB)')
+        
+        for info in infos:
+            # Small files legitimately compress very well; only large ones are suspicious
+            ratio = info.file_size / max(info.compress_size, 1)
+            if info.file_size > BulkUploadService.UPLOAD_CHUNK_SIZE and ratio > BulkUploadService.MAX_COMPRESSION_RATIO:
+                return f'Suspicious compression ratio for {info.filename}: {ratio:.0f}:1'
+        
+        return None
+    
+    @staticmethod
+    def _extract_worker(zip_path: str, members: "queue.Queue") -> List[Tuple[int, bool, Dict[str, Any]]]:
+        """
+        Stream members from the queue straight into the blob store
+        
+        Each worker opens the archive once; decompression and hashing release
+        the GIL, so workers run in parallel.
+        
+        Returns:
+            (member_index, succeeded, result) tuples
+        """
+        outcomes = []
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            while True:
+                try:
+                    index, info = members.get_nowait()
+                except queue.Empty:
+                    return outcomes
+                
+                tmp_path = blob_store.new_temp_path()
+                fmt = row_index.normalize_format(Path(info.filename).suffix)
+                index_builder = row_index.new_builder(fmt)
+                try:
+                    digest = hashlib.sha256()
+                    size = 0
+                    with zip_ref.open(info) as src, open(tmp_path, 'wb') as dst:
+                        for chunk in iter(lambda: src.read(BulkUploadService.UPLOAD_CHUNK_SIZE), b''):
+                            size += len(chunk)
+                            # Never trust the declared size beyond what was checked
+                            if size > info.file_size:
+                                raise ValueError('Entry larger than declared size')
+                            BulkUploadService._write_chunk(dst, digest, chunk, index_builder)
+                    
+                    sha256 = digest.hexdigest()
+                    mime_type = mimetypes.guess_type(info.filename)[0]
+                    created = blob_store.commit_file(tmp_path, sha256, size, mime_type)
+                    if index_builder:
+                        index_tmp_path = blob_store.new_temp_path()
+                        index_builder.write(index_tmp_path)
+                        blob_store.commit_index(index_tmp_path, sha256, fmt)
+                    outcomes.append((index, True, {
+                        'filename': info.filename,
+                        'saved_as': sha256,
+                        'size': size,
+                        'sha256': sha256,
+                        'deduplicated': not created,
+                        'pinned': True,
+                        'file_type': BulkUploadService.get_file_type(info.filename),
+                        'mime_type': mime_type,
+                        'path': blob_store.path_for(sha256)
+                    }))
+                except Exception as e:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    outcomes.append((index, False, {
+                        'filename': info.filename,
+                        'reason': str(e)
+                    }))
+    
+    @staticmethod
+    async def extract_and_upload_zip(zip_file: UploadFile) -> Dict[str, Any]:
+        """
+        Extract ZIP file and store all contents in the blob store
+        
+        Members are decompressed straight into the blob store (no temp
+        extraction directory) by ZIP_EXTRACT_WORKERS threads, after the
+        archive passes check_zip_limits.
         
         Args:
             zip_file: ZIP file upload
-            upload_dir: Directory to save extracted files
         
         Returns:
             Dict with extraction results
         """
-        os.makedirs(upload_dir, exist_ok=True)
-        
         results = {
             'success': [],
             'failed': [],
@@ -179,73 +394,62 @@ class BulkUploadService:
             'extracted_files': 0
         }
         
-        # Create temporary directory for extraction
-        temp_dir = os.path.join(upload_dir, 'temp_extract')
-        os.makedirs(temp_dir, exist_ok=True)
+        # The archive itself must be on disk: reading members needs random access
+        zip_path = blob_store.new_temp_path()
         
         try:
-            # Save ZIP file temporarily
-            zip_path = os.path.join(temp_dir, zip_file.filename)
-            content = await zip_file.read()
+            await BulkUploadService.stream_to_file(zip_file, zip_path, BulkUploadService.MAX_TOTAL_SIZE)
             
-            with open(zip_path, "wb") as f:
-                f.write(content)
+            def read_directory():
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    return zip_ref.infolist()
             
-            # Extract ZIP
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                file_list = zip_ref.namelist()
-                results['total_files'] = len(file_list)
+            infos = await run_in_threadpool(read_directory)
+            results['total_files'] = len(infos)
+            
+            error = BulkUploadService.check_zip_limits(infos)
+            if error:
+                return {
+                    'error': error,
+                    'success': [],
+                    'failed': []
+                }
+            
+            members = queue.Queue()
+            for index, info in enumerate(infos):
+                # Skip directories and hidden files
+                name = os.path.basename(info.filename)
+                if info.is_dir() or name.startswith('.') or info.filename.startswith(('.', '__MACOSX/')):
+                    continue
                 
-                for file_name in file_list:
-                    # Skip directories and hidden files
-                    if file_name.endswith('/') or file_name.startswith('.'):
-                        continue
-                    
-                    try:
-                        # Extract file
-                        zip_ref.extract(file_name, temp_dir)
-                        extracted_path = os.path.join(temp_dir, file_name)
-                        
-                        # Validate file type
-                        file_type = BulkUploadService.get_file_type(file_name)
-                        if file_type == 'unknown':
-                            results['failed'].append({
-                                'filename': file_name,
-                                'reason': 'Unsupported file type'
-                            })
-                            continue
-                        
-                        # Move to final location
-                        final_filename = os.path.basename(file_name)
-                        final_path = os.path.join(upload_dir, final_filename)
-                        
-                        # Handle duplicates
-                        if os.path.exists(final_path):
-                            name, ext = os.path.splitext(final_filename)
-                            counter = 1
-                            while os.path.exists(final_path):
-                                final_path = os.path.join(upload_dir, f"{name}_{counter}{ext}")
-                                counter += 1
-                        
-                        shutil.move(extracted_path, final_path)
-                        
-                        file_size = os.path.getsize(final_path)
-                        
-                        results['success'].append({
-                            'filename': file_name,
-                            'saved_as': os.path.basename(final_path),
-                            'size': file_size,
-                            'file_type': file_type,
-                            'path': final_path
-                        })
-                        
-                        results['extracted_files'] += 1
-                        
-                    except Exception as e:
-                        results['failed'].append({
-                            'filename': file_name,
-                            'reason': str(e)
-                        })
+                if BulkUploadService.get_file_type(info.filename) == 'unknown':
+                    results['failed'].append({
+                        'filename': info.filename,
+                        'reason': 'Unsupported file type'
+                    })
+                elif info.file_size > BulkUploadService.MAX_FILE_SIZE:
+                    results['failed'].append({
+                        'filename': info.filename,
+                        'reason': f'File too large: {info.file_size / 1024 / 1024:.2f}MB (max 100MB)'
+                    })
+                elif info.flag_bits & 0x1:
+                    results['failed'].append({
+                        'filename': info.filename,
+                        'reason': 'Encrypted entries are not supported'
+                    })
+                else:
+                    members.put((index, info))
+            
+            workers = min(BulkUploadService.ZIP_EXTRACT_WORKERS, members.qsize())
+            loop = asyncio.get_running_loop()
+            outcomes = await asyncio.gather(*[
+                loop.run_in_executor(_zip_executor, BulkUploadService._extract_worker, zip_path, members)
+                for _ in range(workers)
+            ])
+            
+            for index, succeeded, outcome in sorted(o for batch in outcomes for o in batch):
+                results['success' if succeeded else 'failed'].append(outcome)
+            results['extracted_files'] = len(results['success'])
             
         except zipfile.BadZipFile:
             return {
@@ -262,49 +466,12 @@ class BulkUploadService:
             }
         
         finally:
-            # Clean up temporary directory
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
+            # Remove the uploaded archive
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
         
         return results
-    
-    @staticmethod
-    def get_upload_statistics(upload_dir: str = "backend/uploads/datasets") -> Dict[str, Any]:
-        """
-        Get statistics about uploaded files
-        
-        Returns:
-            Dict with file counts by type and total size
-        """
-        if not os.path.exists(upload_dir):
-            return {
-                'total_files': 0,
-                'total_size': 0,
-                'by_type': {}
-            }
-        
-        stats = {
-            'total_files': 0,
-            'total_size': 0,
-            'by_type': {}
-        }
-        
-        for root, dirs, files in os.walk(upload_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_size = os.path.getsize(file_path)
-                file_type = BulkUploadService.get_file_type(file)
-                
-                stats['total_files'] += 1
-                stats['total_size'] += file_size
-                
-                if file_type not in stats['by_type']:
-                    stats['by_type'][file_type] = {
-                        'count': 0,
-                        'size': 0
-                    }
-                
-                stats['by_type'][file_type]['count'] += 1
-                stats['by_type'][file_type]['size'] += file_size
-        
-        return stats
+
+
+# Shared pool for ZIP member decompression, separate from the request threadpool
+_zip_executor = ThreadPoolExecutor(max_workers=BulkUploadService.ZIP_EXTRACT_WORKERS, thread_name_prefix="zip-extract")
@@ -4,84 +4,189 @@ Similar to Appen's global crowd management system
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, case, delete, insert
+from sqlalchemy.exc import IntegrityError
 from typing import List, Dict, Optional, Any
+import os
 import models
 import schemas
+from database import SessionLocal
+from services.annotator_stats import AnnotatorStatsService
+from services.refresh_cache import RefreshingCache
 from datetime import datetime, timedelta
+import threading
+
+_leaderboard_refresh_lock = threading.Lock()
 
 class CrowdManagementService:
     """
     Manage annotator crowd, performance tracking, and task distribution
     """
     
+    # Leaderboard periods and their look-back windows (None = all time)
+    LEADERBOARD_PERIODS = {'week': 7, 'month': 30, 'all_time': None}
+    LEADERBOARD_SIZE = 1000  # Ranks kept per snapshot; larger limits fall back to a live query
+    LEADERBOARD_REFRESH_INTERVAL = timedelta(seconds=int(os.getenv("LEADERBOARD_REFRESH_SECONDS", 300)))
+    
     @staticmethod
-    def get_annotator_leaderboard(
+    def normalize_period(time_period: str) -> str:
+        """Known leaderboard period, or 'all_time' for anything else"""
+        return time_period if time_period in CrowdManagementService.LEADERBOARD_PERIODS else 'all_time'
+    
+    @staticmethod
+    def compute_leaderboard(
         db: Session,
-        time_period: str = 'week',  # week, month, all_time
+        time_period: str = 'week',
         limit: int = 100
     ) -> List[Dict[str, Any]]:
-        """Get top performing annotators"""
+        """
+        Rank annotators live with a single grouped query; approval counts are
+        folded into the aggregate with a conditional sum
+        """
+        days = CrowdManagementService.LEADERBOARD_PERIODS[CrowdManagementService.normalize_period(time_period)]
         
-        # Calculate date range
-        now = datetime.utcnow()
-        if time_period == 'week':
-            start_date = now - timedelta(days=7)
-        elif time_period == 'month':
-            start_date = now - timedelta(days=30)
-        else:
-            start_date = datetime(2000, 1, 1)
-        
-        # Query annotator stats
-        annotators = db.query(
+        total_annotations = func.count(func.distinct(models.Annotation.annotation_id))
+        query = db.query(
             models.User.user_id,
             models.User.username,
-            models.User.email,
-            func.count(models.Annotation.annotation_id).label('total_annotations'),
+            total_annotations.label('total_annotations'),
             func.count(models.Review.review_id).label('reviews_received'),
+            func.sum(case((models.Review.status == models.ReviewStatus.APPROVED, 1), else_=0)).label('approved_reviews'),
             func.avg(models.Review.quality_score).label('avg_quality_score')
         ).join(
             models.Annotation, models.User.user_id == models.Annotation.user_id
         ).outerjoin(
             models.Review, models.Annotation.annotation_id == models.Review.annotation_id
         ).filter(
-            models.User.role == models.UserRole.ANNOTATOR,
-            models.Annotation.create_date >= start_date
-        ).group_by(
-            models.User.user_id
+            models.User.role == models.UserRole.ANNOTATOR
+        )
+        if days is not None:
+            query = query.filter(models.Annotation.create_date >= datetime.utcnow() - timedelta(days=days))
+        
+        annotators = query.group_by(
+            models.User.user_id, models.User.username
         ).order_by(
-            func.count(models.Annotation.annotation_id).desc()
+            total_annotations.desc(), models.User.user_id
         ).limit(limit).all()
         
         leaderboard = []
         for rank, annotator in enumerate(annotators, 1):
+            reviews = annotator.reviews_received or 0
+            approved = int(annotator.approved_reviews or 0)
             leaderboard.append({
                 'rank': rank,
                 'user_id': annotator.user_id,
                 'username': annotator.username,
                 'total_annotations': annotator.total_annotations,
-                'reviews_received': annotator.reviews_received or 0,
+                'reviews_received': reviews,
+                'approved_reviews': approved,
                 'avg_quality_score': round(annotator.avg_quality_score or 0.0, 2),
-                'approval_rate': CrowdManagementService._calculate_approval_rate(db, annotator.user_id, start_date)
+                'approval_rate': round((approved / reviews) * 100, 2) if reviews else 0.0
             })
         
         return leaderboard
     
     @staticmethod
-    def _calculate_approval_rate(db: Session, user_id: int, start_date: datetime) -> float:
-        """Calculate approval rate for an annotator"""
-        reviews = db.query(models.Review).join(
-            models.Annotation
-        ).filter(
-            models.Annotation.user_id == user_id,
-            models.Annotation.create_date >= start_date
-        ).all()
+    def refresh_leaderboard(db: Session, periods: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Rebuild the Leaderboard_Snapshot rows of each period in one transaction,
+        so readers see either the old or the new ranking, never a mix, and
+        stamp the period's Leaderboard_Refresh row (kept even when no
+        annotator is ranked, so an empty period counts as fresh)
+        
+        Returns:
+            Number of ranked annotators per period
+        """
+        periods = periods or list(CrowdManagementService.LEADERBOARD_PERIODS)
+        table = models.LeaderboardSnapshot.__table__
+        now = datetime.utcnow()
+        
+        refreshed = {}
+        for period in periods:
+            rows = CrowdManagementService.compute_leaderboard(db, period, CrowdManagementService.LEADERBOARD_SIZE)
+            db.execute(delete(table).where(table.c.time_period == period))
+            if rows:
+                db.execute(insert(table), [dict(row, time_period=period, computed_at=now) for row in rows])
+            db.merge(models.LeaderboardRefresh(time_period=period, computed_at=now, annotator_count=len(rows)))
+            refreshed[period] = len(rows)
+        
+        db.commit()
+        return refreshed
+    
+    @staticmethod
+    def refresh_leaderboard_background(periods: Optional[List[str]] = None):
+        """Refresh snapshots with a dedicated session (for background tasks)"""
+        # Several stale reads may schedule a refresh; one rebuild is enough
+        if not _leaderboard_refresh_lock.acquire(blocking=False):
+            return
+        db = SessionLocal()
+        try:
+            CrowdManagementService.refresh_leaderboard(db, periods)
+        except Exception as e:
+            db.rollback()
+            print(f"Leaderboard refresh failed: {e}")
+        finally:
+            db.close()
+            _leaderboard_refresh_lock.release()
+    
+    @staticmethod
+    def get_leaderboard_computed_at(db: Session, time_period: str) -> Optional[datetime]:
+        return db.query(models.LeaderboardRefresh.computed_at).filter(
+            models.LeaderboardRefresh.time_period == time_period
+        ).scalar()
+    
+    @staticmethod
+    def is_leaderboard_stale(computed_at: Optional[datetime]) -> bool:
+        return computed_at is None or \
+            datetime.utcnow() - computed_at > CrowdManagementService.LEADERBOARD_REFRESH_INTERVAL
+    
+    @staticmethod
+    def get_annotator_leaderboard(
+        db: Session,
+        time_period: str = 'week',  # week, month, all_time
+        limit: int = 100,
+        refresh_if_stale: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Get top performing annotators from the precomputed snapshot
         
-        if not reviews:
-            return 0.0
+        The snapshot is built on first use and, with refresh_if_stale, rebuilt
+        inline once older than LEADERBOARD_REFRESH_INTERVAL. Inline rebuilds
+        take the background refresh's lock, so concurrent first readers wait
+        for one rebuild instead of each inserting the same ranks.
+        """
+        period = CrowdManagementService.normalize_period(time_period)
+        if limit > CrowdManagementService.LEADERBOARD_SIZE:
+            return CrowdManagementService.compute_leaderboard(db, period, limit)
         
-        approved = sum(1 for r in reviews if r.status == models.ReviewStatus.APPROVED)
-        return round((approved / len(reviews)) * 100, 2)
+        def needs_refresh():
+            computed_at = CrowdManagementService.get_leaderboard_computed_at(db, period)
+            return computed_at is None or (refresh_if_stale and CrowdManagementService.is_leaderboard_stale(computed_at))
+        
+        if needs_refresh():
+            with _leaderboard_refresh_lock:
+                # Another reader or the background refresh may have rebuilt it meanwhile
+                if needs_refresh():
+                    try:
+                        CrowdManagementService.refresh_leaderboard(db, [period])
+                    except IntegrityError:
+                        # Another server process rebuilt the same period first; serve its snapshot
+                        db.rollback()
+        
+        snapshot = db.query(models.LeaderboardSnapshot).filter(
+            models.LeaderboardSnapshot.time_period == period
+        ).order_by(models.LeaderboardSnapshot.rank).limit(limit).all()
+        
+        return [{
+            'rank': row.rank,
+            'user_id': row.user_id,
+            'username': row.username,
+            'total_annotations': row.total_annotations,
+            'reviews_received': row.reviews_received,
+            'approved_reviews': row.approved_reviews,
+            'avg_quality_score': row.avg_quality_score,
+            'approval_rate': row.approval_rate
+        } for row in snapshot]
     
     @staticmethod
     def get_annotator_stats(
@@ -89,40 +194,22 @@ class CrowdManagementService:
         user_id: int,
         days: int = 30
     ) -> Dict[str, Any]:
-        """Get detailed statistics for an annotator"""
+        """Get detailed statistics for an annotator (summed from the daily rollup)"""
         
-        start_date = datetime.utcnow() - timedelta(days=days)
+        totals = AnnotatorStatsService.get_window_totals(db, user_id, days)
         
-        # Total annotations
-        total_annotations = db.query(func.count(models.Annotation.annotation_id)).filter(
-            models.Annotation.user_id == user_id,
-            models.Annotation.create_date >= start_date
-        ).scalar()
-        
-        # Reviews received
-        reviews = db.query(models.Review).join(
-            models.Annotation
-        ).filter(
-            models.Annotation.user_id == user_id,
-            models.Annotation.create_date >= start_date
-        ).all()
-        
-        approved = sum(1 for r in reviews if r.status == models.ReviewStatus.APPROVED)
-        rejected = sum(1 for r in reviews if r.status == models.ReviewStatus.REJECTED)
-        pending = sum(1 for r in reviews if r.status == models.ReviewStatus.PENDING)
+        total_annotations = totals['annotations']
+        total_reviews = totals['reviews']
+        approved = totals['approved']
         
         # Quality scores
-        quality_scores = [r.quality_score for r in reviews if r.quality_score is not None]
-        avg_quality = sum(quality_scores) / len(quality_scores) if quality_scores else 0.0
+        avg_quality = totals['quality_sum'] / totals['quality_count'] if totals['quality_count'] else 0.0
         
-        # Tasks completed
-        completed_tasks = db.query(func.count(func.distinct(models.Annotation.task_id))).filter(
-            models.Annotation.user_id == user_id,
-            models.Annotation.create_date >= start_date
-        ).scalar()
+        # Tasks started in the period
+        completed_tasks = totals['tasks_started']
         
         # Accuracy metrics
-        accuracy = (approved / len(reviews) * 100) if reviews else 0.0
+        accuracy = (approved / total_reviews * 100) if total_reviews else 0.0
         
         return {
             'user_id': user_id,
@@ -130,15 +217,15 @@ class CrowdManagementService:
             'total_annotations': total_annotations,
             'completed_tasks': completed_tasks,
             'reviews': {
-                'total': len(reviews),
+                'total': total_reviews,
                 'approved': approved,
-                'rejected': rejected,
-                'pending': pending
+                'rejected': totals['rejected'],
+                'pending': totals['pending']
             },
             'quality': {
                 'avg_score': round(avg_quality, 2),
                 'accuracy_rate': round(accuracy, 2),
-                'approval_rate': round((approved / len(reviews) * 100) if reviews else 0.0, 2)
+                'approval_rate': round(accuracy, 2)
             },
             'productivity': {
                 'annotations_per_day': round(total_annotations / days, 2),
@@ -146,6 +233,11 @@ class CrowdManagementService:
             }
         }
     
+    @staticmethod
+    def get_annotator_daily_stats(db: Session, user_id: int, days: int = 30) -> List[Dict[str, Any]]:
+        """Day-by-day annotation and review counts for productivity charts"""
+        return AnnotatorStatsService.get_daily_series(db, user_id, days)
+    
     @staticmethod
     def get_language_support(db: Session) -> List[Dict[str, Any]]:
         """Get supported languages (simulated - in production, this would be from a languages table)"""
@@ -167,6 +259,232 @@ class CrowdManagementService:
             {'code': 'tr', 'name': 'Turkish', 'annotators': 55}
         ]
     
+    # Expert matching thresholds
+    MIN_EXPERT_QUALITY = 7.0
+    DEFAULT_LANGUAGES = ['en']
+    PROFILE_MAX_AGE = timedelta(hours=1)
+    
+    @staticmethod
+    def refresh_annotator_profiles(db: Session, user_ids: Optional[List[int]] = None) -> int:
+        """
+        Recompute annotator profiles with three grouped queries (annotations,
+        review quality, pending workload) instead of per-annotator lookups.
+        Languages, skills and capacity are managed by hand and left untouched.
+        
+        Returns:
+            Number of profiles refreshed
+        """
+        annotator_query = db.query(models.User.user_id).filter(models.User.role == models.UserRole.ANNOTATOR)
+        if user_ids:
+            annotator_query = annotator_query.filter(models.User.user_id.in_(user_ids))
+        annotator_ids = [row.user_id for row in annotator_query]
+        if not annotator_ids:
+            return 0
+        
+        annotation_counts = dict(db.query(
+            models.Annotation.user_id, func.count(models.Annotation.annotation_id)
+        ).filter(
+            models.Annotation.user_id.in_(annotator_ids)
+        ).group_by(models.Annotation.user_id).all())
+        
+        quality = {row.user_id: row for row in db.query(
+            models.Annotation.user_id,
+            func.count(models.Review.review_id).label('reviewed'),
+            func.avg(models.Review.quality_score).label('avg_quality')
+        ).join(
+            models.Review, models.Review.annotation_id == models.Annotation.annotation_id
+        ).filter(
+            models.Annotation.user_id.in_(annotator_ids)
+        ).group_by(models.Annotation.user_id).all()}
+        
+        pending = dict(db.query(
+            models.TaskAssignment.user_id, func.count(models.TaskAssignment.assignment_id)
+        ).filter(
+            models.TaskAssignment.user_id.in_(annotator_ids),
+            models.TaskAssignment.status == 'Pending'
+        ).group_by(models.TaskAssignment.user_id).all())
+        
+        profiles = {p.user_id: p for p in db.query(models.AnnotatorProfile).filter(
+            models.AnnotatorProfile.user_id.in_(annotator_ids)
+        )}
+        
+        now = datetime.utcnow()
+        changed = []  # Only these can have entered or left a pool
+        for user_id in annotator_ids:
+            profile = profiles.get(user_id)
+            reviewed = quality.get(user_id)
+            stats = (
+                annotation_counts.get(user_id, 0),
+                reviewed.reviewed if reviewed else 0,
+                float(reviewed.avg_quality) if reviewed and reviewed.avg_quality is not None else None,
+                pending.get(user_id, 0)
+            )
+            if profile is None:
+                profile = models.AnnotatorProfile(user_id=user_id, max_pending=10)
+                db.add(profile)
+                changed.append(profile)
+            elif stats != (profile.total_annotations, profile.reviewed_count,
+                           profile.avg_quality, profile.pending_assignments):
+                changed.append(profile)
+            (profile.total_annotations, profile.reviewed_count,
+             profile.avg_quality, profile.pending_assignments) = stats
+            profile.updated_at = now
+        
+        db.flush()
+        CrowdManagementService.sync_pool_members(db, changed)
+        db.commit()
+        return len(annotator_ids)
+    
+    @staticmethod
+    def ensure_fresh_profiles(db: Session):
+        """Refresh profiles when an annotator has none or the oldest is past PROFILE_MAX_AGE"""
+        missing = db.query(models.User.user_id).outerjoin(
+            models.AnnotatorProfile, models.AnnotatorProfile.user_id == models.User.user_id
+        ).filter(
+            models.User.role == models.UserRole.ANNOTATOR,
+            models.AnnotatorProfile.user_id.is_(None)
+        ).first()
+        oldest = db.query(func.min(models.AnnotatorProfile.updated_at)).scalar()
+        if missing or oldest is None or datetime.utcnow() - oldest > CrowdManagementService.PROFILE_MAX_AGE:
+            CrowdManagementService.refresh_annotator_profiles(db)
+    
+    @staticmethod
+    def update_annotator_profile(db: Session, user_id: int, data: Dict[str, Any]) -> Optional[models.AnnotatorProfile]:
+        """Set the hand-maintained parts of a profile (languages, skills, capacity)"""
+        user = db.query(models.User).filter(models.User.user_id == user_id).first()
+        if not user:
+            return None
+        
+        profile = user.annotator_profile
+        if profile is None:
+            CrowdManagementService.refresh_annotator_profiles(db, [user_id])
+            profile = db.query(models.AnnotatorProfile).filter(models.AnnotatorProfile.user_id == user_id).first()
+            if profile is None:
+                profile = models.AnnotatorProfile(user_id=user_id, updated_at=datetime.utcnow())
+                db.add(profile)
+        
+        if 'languages' in data:
+            profile.languages = [str(code).lower() for code in data['languages'] or []]
+        if 'skills' in data:
+            profile.skills = [str(skill).lower() for skill in data['skills'] or []]
+        if 'max_pending' in data:
+            profile.max_pending = int(data['max_pending'])
+        
+        db.flush()
+        CrowdManagementService.sync_pool_members(db, [profile])
+        db.commit()
+        return profile
+    
+    @staticmethod
+    def match_experts(
+        db: Session,
+        task_ids: List[int],
+        expertise_required: str = 'general',
+        language: str = 'en',
+        per_task: int = 3
+    ) -> Dict[int, List[int]]:
+        """
+        Match experts to many tasks in one pass over the annotator profiles
+        
+        Candidates must meet MIN_EXPERT_QUALITY, speak `language` and (unless
+        expertise is 'general') list the skill. Each task gets up to `per_task`
+        of the best-rated candidates that still have capacity
+        (max_pending - pending_assignments) and aren't already on the task.
+        
+        Nothing is written; assign_experts() creates the assignments and
+        reserves the capacity they use.
+        
+        Returns:
+            Mapping of task_id to the selected user_ids
+        """
+        CrowdManagementService.ensure_fresh_profiles(db)
+        task_ids = list(task_ids)
+        
+        language = (language or 'en').lower()
+        expertise = (expertise_required or 'general').lower()
+        
+        profiles = db.query(models.AnnotatorProfile).join(
+            models.User, models.User.user_id == models.AnnotatorProfile.user_id
+        ).filter(
+            models.User.role == models.UserRole.ANNOTATOR,
+            models.AnnotatorProfile.avg_quality >= CrowdManagementService.MIN_EXPERT_QUALITY
+        ).order_by(
+            models.AnnotatorProfile.avg_quality.desc(),
+            models.AnnotatorProfile.pending_assignments
+        ).all()
+        
+        candidates = []
+        capacity = {}
+        for profile in profiles:
+            if language not in (profile.languages or CrowdManagementService.DEFAULT_LANGUAGES):
+                continue
+            if expertise != 'general' and expertise not in (profile.skills or []):
+                continue
+            remaining = profile.max_pending - profile.pending_assignments
+            if remaining > 0:
+                candidates.append(profile)
+                capacity[profile.user_id] = remaining
+        
+        # Batched so a whole project's tasks stay under driver parameter limits
+        already_assigned = set()
+        for start in range(0, len(task_ids), 500):
+            already_assigned.update(db.query(
+                models.TaskAssignment.task_id, models.TaskAssignment.user_id
+            ).filter(models.TaskAssignment.task_id.in_(task_ids[start:start + 500])).all())
+        
+        matches = {}
+        for task_id in task_ids:
+            selected = []
+            for profile in candidates:
+                if len(selected) >= per_task:
+                    break
+                if capacity[profile.user_id] <= 0 or (task_id, profile.user_id) in already_assigned:
+                    continue
+                selected.append(profile.user_id)
+                capacity[profile.user_id] -= 1
+            matches[task_id] = selected
+            candidates = [p for p in candidates if capacity[p.user_id] > 0]
+        
+        return matches
+    
+    @staticmethod
+    def assign_experts(
+        db: Session,
+        task_ids: List[int],
+        expertise_required: str = 'general',
+        language: str = 'en',
+        per_task: int = 3,
+        assigned_by: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Match experts to the tasks and create the assignments; the assigned
+        annotators' pending_assignments (and their pool membership) are
+        updated for the pairs actually inserted, in the same transaction
+        
+        Returns:
+            Dict with 'matches' (task_id to user_ids), created 'assignments' and 'errors'
+        """
+        from services import annotation_service
+        
+        matches = CrowdManagementService.match_experts(db, task_ids, expertise_required, language, per_task)
+        pairs = [(task_id, user_id) for task_id, user_ids in matches.items() for user_id in user_ids]
+        result = annotation_service.bulk_create_task_assignments(db, pairs, assigned_by, commit=False)
+        
+        assigned = {}
+        for assignment in result["assignments"]:
+            assigned[assignment["user_id"]] = assigned.get(assignment["user_id"], 0) + 1
+        if assigned:
+            profiles = db.query(models.AnnotatorProfile).filter(
+                models.AnnotatorProfile.user_id.in_(list(assigned))
+            ).all()
+            for profile in profiles:
+                profile.pending_assignments += assigned[profile.user_id]
+            db.flush()
+            CrowdManagementService.sync_pool_members(db, profiles)
+        db.commit()
+        
+        return {"matches": matches, **result}
+    
     @staticmethod
     def assign_expert_annotators(
         db: Session,
@@ -182,45 +500,13 @@ class CrowdManagementService:
         - Language proficiency
         - Current workload
         """
-        
-        # Get top performing annotators
-        annotators = db.query(
-            models.User.user_id,
-            func.count(models.Annotation.annotation_id).label('total_annotations'),
-            func.avg(models.Review.quality_score).label('avg_quality')
-        ).join(
-            models.Annotation, models.User.user_id == models.Annotation.user_id
-        ).outerjoin(
-            models.Review, models.Annotation.annotation_id == models.Review.annotation_id
-        ).filter(
-            models.User.role == models.UserRole.ANNOTATOR
-        ).group_by(
-            models.User.user_id
-        ).having(
-            func.avg(models.Review.quality_score) >= 7.0  # High quality threshold
-        ).order_by(
-            func.avg(models.Review.quality_score).desc()
-        ).limit(count * 2).all()  # Get more candidates
-        
-        # Filter by workload (annotators with fewer current assignments)
-        selected = []
-        for annotator in annotators:
-            current_workload = db.query(func.count(models.TaskAssignment.assignment_id)).filter(
-                models.TaskAssignment.user_id == annotator.user_id,
-                models.TaskAssignment.status == 'Pending'
-            ).scalar()
-            
-            if current_workload < 10:  # Max 10 pending tasks
-                selected.append(annotator.user_id)
-            
-            if len(selected) >= count:
-                break
-        
-        return selected
+        return CrowdManagementService.match_experts(
+            db, [task_id], expertise_required, language, count
+        ).get(task_id, [])
     
     @staticmethod
-    def get_crowd_metrics(db: Session) -> Dict[str, Any]:
-        """Get overall crowd performance metrics"""
+    def compute_crowd_metrics(db: Session) -> Dict[str, Any]:
+        """Compute overall crowd performance metrics from the raw tables"""
         
         total_annotators = db.query(func.count(models.User.user_id)).filter(
             models.User.role == models.UserRole.ANNOTATOR
@@ -243,59 +529,260 @@ class CrowdManagementService:
             'avg_quality_score': round(avg_quality, 2),
             'languages_supported': 235,  # Simulated, like Appen
             'countries': 170,  # Simulated
-            'success_rate': 95.5  # Simulated
+            'success_rate': 95.5,  # Simulated
+            'computed_at': datetime.utcnow().isoformat()
+        }
+    
+    @staticmethod
+    def _load_crowd_metrics() -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            return CrowdManagementService.compute_crowd_metrics(db)
+        finally:
+            db.close()
+    
+    @staticmethod
+    def get_crowd_metrics(db: Session) -> Dict[str, Any]:
+        """
+        Get overall crowd performance metrics from the shared cache
+        
+        Fresh for CROWD_METRICS_TTL seconds, then served stale while a single
+        background refresh runs (the cache uses its own session, not `db`).
+        """
+        return crowd_metrics_cache.get()
+    
+    # Pool criteria defaults
+    DEFAULT_POOL_CRITERIA = {
+        'min_quality_score': 7.0,
+        'min_annotations': 100,
+        'language': 'en',
+        'expertise': None,  # Domain/skill, None = any
+        'available_only': False  # Only annotators below their max_pending
+    }
+    
+    @staticmethod
+    def _pool_criteria(criteria: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        merged = dict(CrowdManagementService.DEFAULT_POOL_CRITERIA)
+        merged.update({key: value for key, value in (criteria or {}).items() if key in merged})
+        return merged
+    
+    @staticmethod
+    def _profile_in_pool(profile: models.AnnotatorProfile, criteria: Dict[str, Any]) -> bool:
+        """Apply pool criteria to one profile (same rules as the indexed pool query)"""
+        if profile.avg_quality is None or profile.avg_quality < criteria['min_quality_score']:
+            return False
+        if (profile.total_annotations or 0) < criteria['min_annotations']:
+            return False
+        language = criteria.get('language')
+        if language and language.lower() not in (profile.languages or CrowdManagementService.DEFAULT_LANGUAGES):
+            return False
+        expertise = criteria.get('expertise')
+        if expertise and expertise.lower() not in (profile.skills or []):
+            return False
+        if criteria.get('available_only') and profile.pending_assignments >= profile.max_pending:
+            return False
+        return True
+    
+    @staticmethod
+    def find_pool_candidates(db: Session, criteria: Optional[Dict[str, Any]] = None) -> List[models.AnnotatorProfile]:
+        """
+        Annotator profiles matching the criteria, best quality first
+        
+        Quality and experience are range-filtered on the profile index; the
+        language, expertise and availability checks run on that short list.
+        """
+        criteria = CrowdManagementService._pool_criteria(criteria)
+        profiles = db.query(models.AnnotatorProfile).join(
+            models.User, models.User.user_id == models.AnnotatorProfile.user_id
+        ).filter(
+            models.User.role == models.UserRole.ANNOTATOR,
+            models.AnnotatorProfile.avg_quality >= criteria['min_quality_score'],
+            models.AnnotatorProfile.total_annotations >= criteria['min_annotations']
+        ).order_by(
+            models.AnnotatorProfile.avg_quality.desc(),
+            models.AnnotatorProfile.total_annotations.desc()
+        ).all()
+        return [p for p in profiles if CrowdManagementService._profile_in_pool(p, criteria)]
+    
+    @staticmethod
+    def _pool_response(pool: Optional[models.AnnotatorPool], project_id: Optional[int], criteria: Dict[str, Any], members: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            'pool_id': pool.pool_id if pool else None,
+            'project_id': project_id,
+            'criteria': criteria,
+            'refreshed_at': pool.refreshed_at.isoformat() if pool and pool.refreshed_at else None,
+            'qualified_annotators': len(members),
+            'annotator_pool': members
         }
     
     @staticmethod
     def create_annotator_pool(
         db: Session,
         project_id: int,
-        criteria: Dict[str, Any]
+        criteria: Dict[str, Any],
+        save: bool = True
     ) -> Dict[str, Any]:
         """
         Create a pool of qualified annotators for a project based on criteria:
         - Minimum quality score
+        - Minimum experience (annotation count)
         - Language requirements
         - Expertise domain
         - Availability
+        
+        With save=False the pool is only previewed, so criteria can be tuned
+        without storing anything.
         """
+        CrowdManagementService.ensure_fresh_profiles(db)
+        criteria = CrowdManagementService._pool_criteria(criteria)
         
-        min_quality = criteria.get('min_quality_score', 7.0)
-        language = criteria.get('language', 'en')
-        min_annotations = criteria.get('min_annotations', 100)
+        candidates = CrowdManagementService.find_pool_candidates(db, criteria)
+        usernames = dict(db.query(models.User.user_id, models.User.username).filter(
+            models.User.user_id.in_([p.user_id for p in candidates])
+        ).all()) if candidates else {}
         
-        qualified_annotators = db.query(
-            models.User.user_id,
-            models.User.username,
-            func.count(models.Annotation.annotation_id).label('experience'),
-            func.avg(models.Review.quality_score).label('quality')
-        ).join(
-            models.Annotation
-        ).outerjoin(
-            models.Review, models.Annotation.annotation_id == models.Review.annotation_id
-        ).filter(
-            models.User.role == models.UserRole.ANNOTATOR
-        ).group_by(
-            models.User.user_id
-        ).having(
-            and_(
-                func.count(models.Annotation.annotation_id) >= min_annotations,
-                func.avg(models.Review.quality_score) >= min_quality
+        members = [{
+            'user_id': profile.user_id,
+            'username': usernames.get(profile.user_id),
+            'experience': profile.total_annotations,
+            'quality_score': round(profile.avg_quality or 0.0, 2)
+        } for profile in candidates]
+        
+        pool = None
+        if save:
+            now = datetime.utcnow()
+            pool = models.AnnotatorPool(
+                project_id=project_id, criteria=criteria, member_count=len(members),
+                created_at=now, refreshed_at=now
             )
-        ).all()
+            db.add(pool)
+            db.flush()
+            if members:
+                db.execute(insert(models.AnnotatorPoolMember.__table__), [{
+                    'pool_id': pool.pool_id,
+                    'user_id': member['user_id'],
+                    'experience': member['experience'],
+                    'quality_score': member['quality_score'],
+                    'added_at': now
+                } for member in members])
+            db.commit()
         
-        pool = []
-        for annotator in qualified_annotators:
-            pool.append({
-                'user_id': annotator.user_id,
-                'username': annotator.username,
-                'experience': annotator.experience,
-                'quality_score': round(annotator.quality or 0.0, 2)
-            })
+        return CrowdManagementService._pool_response(pool, project_id, criteria, members)
+    
+    @staticmethod
+    def sync_pool_members(
+        db: Session,
+        profiles: List[models.AnnotatorProfile],
+        pools: Optional[List[models.AnnotatorPool]] = None
+    ):
+        """
+        Incrementally re-evaluate stored pools (all, or `pools`) for the given
+        (changed) profiles: add newly qualifying annotators, drop those who no
+        longer qualify and update member stats. Does not commit.
+        """
+        if not profiles:
+            return
+        pools = db.query(models.AnnotatorPool).all() if pools is None else pools
+        if not pools:
+            return
         
-        return {
-            'project_id': project_id,
-            'criteria': criteria,
-            'qualified_annotators': len(pool),
-            'annotator_pool': pool
-        }
+        user_ids = [profile.user_id for profile in profiles]
+        annotators = {row.user_id for row in db.query(models.User.user_id).filter(
+            models.User.user_id.in_(user_ids),
+            models.User.role == models.UserRole.ANNOTATOR
+        )}
+        existing = {(m.pool_id, m.user_id): m for m in db.query(models.AnnotatorPoolMember).filter(
+            models.AnnotatorPoolMember.user_id.in_(user_ids)
+        )}
+        
+        now = datetime.utcnow()
+        for pool in pools:
+            criteria = CrowdManagementService._pool_criteria(pool.criteria)
+            changed = False
+            for profile in profiles:
+                member = existing.get((pool.pool_id, profile.user_id))
+                qualifies = profile.user_id in annotators and \
+                    CrowdManagementService._profile_in_pool(profile, criteria)
+                if qualifies and member is None:
+                    db.add(models.AnnotatorPoolMember(
+                        pool_id=pool.pool_id, user_id=profile.user_id, added_at=now,
+                        experience=profile.total_annotations, quality_score=round(profile.avg_quality, 2)
+                    ))
+                    pool.member_count = (pool.member_count or 0) + 1
+                    changed = True
+                elif qualifies:
+                    member.experience = profile.total_annotations
+                    member.quality_score = round(profile.avg_quality, 2)
+                elif member is not None:
+                    db.delete(member)
+                    pool.member_count = max((pool.member_count or 0) - 1, 0)
+                    changed = True
+            if changed:
+                pool.refreshed_at = now
+    
+    @staticmethod
+    def refresh_annotator_pool(db: Session, pool_id: int) -> Optional[Dict[str, Any]]:
+        """Refresh the profiles of a pool's candidates and members, then re-sync the pool"""
+        pool = db.query(models.AnnotatorPool).filter(models.AnnotatorPool.pool_id == pool_id).first()
+        if not pool:
+            return None
+        
+        # refresh_annotator_profiles syncs every pool for annotators whose stats
+        # changed; an explicit refresh also re-checks this pool against everyone
+        CrowdManagementService.refresh_annotator_profiles(db)
+        CrowdManagementService.sync_pool_members(db, db.query(models.AnnotatorProfile).all(), [pool])
+        pool.refreshed_at = datetime.utcnow()
+        db.commit()
+        return CrowdManagementService.get_annotator_pool(db, pool_id)
+    
+    @staticmethod
+    def get_annotator_pool(db: Session, pool_id: int) -> Optional[Dict[str, Any]]:
+        pool = db.query(models.AnnotatorPool).filter(models.AnnotatorPool.pool_id == pool_id).first()
+        if not pool:
+            return None
+        
+        rows = db.query(models.AnnotatorPoolMember, models.User.username).join(
+            models.User, models.User.user_id == models.AnnotatorPoolMember.user_id
+        ).filter(
+            models.AnnotatorPoolMember.pool_id == pool_id
+        ).order_by(
+            models.AnnotatorPoolMember.quality_score.desc(), models.AnnotatorPoolMember.user_id
+        ).all()
+        
+        members = [{
+            'user_id': member.user_id,
+            'username': username,
+            'experience': member.experience,
+            'quality_score': member.quality_score
+        } for member, username in rows]
+        return CrowdManagementService._pool_response(pool, pool.project_id, pool.criteria, members)
+    
+    @staticmethod
+    def list_annotator_pools(db: Session, project_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        query = db.query(models.AnnotatorPool)
+        if project_id is not None:
+            query = query.filter(models.AnnotatorPool.project_id == project_id)
+        return [{
+            'pool_id': pool.pool_id,
+            'project_id': pool.project_id,
+            'criteria': pool.criteria,
+            'member_count': pool.member_count,
+            'created_at': pool.created_at.isoformat() if pool.created_at else None,
+            'refreshed_at': pool.refreshed_at.isoformat() if pool.refreshed_at else None
+        } for pool in query.order_by(models.AnnotatorPool.pool_id.desc())]
+    
+    @staticmethod
+    def delete_annotator_pool(db: Session, pool_id: int) -> bool:
+        pool = db.query(models.AnnotatorPool).filter(models.AnnotatorPool.pool_id == pool_id).first()
+        if not pool:
+            return False
+        db.delete(pool)
+        db.commit()
+        return True
+
+crowd_metrics_cache = RefreshingCache(
+    CrowdManagementService._load_crowd_metrics,
+    ttl=float(os.getenv("CROWD_METRICS_TTL", 60)),
+    max_stale=float(os.getenv("CROWD_METRICS_MAX_STALE", 600)),
+    name="crowd-metrics"
+)
@@ -0,0 +1,218 @@
+"""
+Dataset Items
+CSV rows, JSON array elements and TXT lines are parsed once after upload
+(by services.ingestion_pipeline) into Dataset_Item rows, so a page of data
+is an index range scan on (dataset_id, ordinal) instead of a re-parse of
+the whole file
+"""
+import csv
+import json
+import os
+from contextlib import nullcontext
+from typing import List, Dict, Any, Iterator, Iterable, Callable, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import models
+from services import row_index
+from services.json_stream import iter_json_file
+
+
+ITEM_FORMATS = ('csv', 'json', 'jsonl', 'txt')
+ITEM_INSERT_BATCH_SIZE = 1000
+# Larger line-oriented files stay on disk and are paged through their row index
+ITEMS_MAX_FILE_SIZE = int(os.getenv("DATASET_ITEMS_MAX_FILE_SIZE", 50 * 1024 * 1024))
+
+
+def normalize_format(fmt: str) -> str:
+    """Bulk uploads store the suffix (".csv"), single uploads the extension ("csv")"""
+    return (fmt or '').lower().lstrip('.')
+
+
+def should_ingest(fmt: str, size: int) -> bool:
+    """Copy records into Dataset_Item unless the file is large and has a row index instead"""
+    fmt = normalize_format(fmt)
+    if fmt not in ITEM_FORMATS:
+        return False
+    return size <= ITEMS_MAX_FILE_SIZE or not row_index.is_indexed(fmt)
+
+
+def iter_records(file_path: str, fmt: str) -> Iterator[Any]:
+    """Yield the records of a dataset file in file order"""
+    fmt = normalize_format(fmt)
+    if fmt == 'csv':
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    elif fmt == 'json':
+        yield from iter_json_file(file_path)
+    elif fmt == 'jsonl':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif fmt == 'txt':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                text = line.strip()
+                if text:
+                    yield {'text': text, 'line_number': line_number}
+
+
+def delete_items(db: Session, dataset_id: int, below: Optional[int] = None):
+    """
+    Remove a dataset's items (no commit), or only those with ordinal < below;
+    not left to FK cascades, which SQLite skips
+    """
+    query = db.query(models.DatasetItem).filter(models.DatasetItem.dataset_id == dataset_id)
+    if below is not None:
+        query = query.filter(models.DatasetItem.ordinal < below)
+    query.delete(synchronize_session=False)
+
+
+def ingest_dataset_items(
+    db: Session,
+    dataset_id: int,
+    records: Iterable[Any],
+    on_batch: Optional[Callable[[int], None]] = None,
+    write_lock=None
+) -> int:
+    """
+    Replace a dataset's items with `records` and record the count in
+    Dataset.row_count
+
+    Each batch is one multi-row insert committed on its own, so progress is
+    visible while a large file is ingested; if the records fail to parse,
+    the batches this call committed are removed again (and nothing else).
+    Callers must not run two ingestions of one dataset at once.
+
+    Args:
+        on_batch: Called with the running item count after each commit
+        write_lock: Held around each batch write (bounds concurrent DB writers)
+
+    Returns:
+        Number of items written
+    """
+    write_lock = write_lock or nullcontext()
+    table = models.DatasetItem.__table__
+    count = 0
+    committed = 0  # Items [0, committed) are written by this call
+    batch = []
+
+    def flush(final: bool = False):
+        nonlocal committed
+        with write_lock:
+            if batch:
+                db.execute(insert(table), batch)
+            if final:
+                set_row_count(db, dataset_id, count)
+            db.commit()
+        committed = count
+        if on_batch:
+            on_batch(count)
+
+    try:
+        with write_lock:
+            delete_items(db, dataset_id)
+            set_row_count(db, dataset_id, None)
+            db.commit()
+        for record in records:
+            batch.append({'dataset_id': dataset_id, 'ordinal': count, 'payload': record})
+            count += 1
+            if len(batch) >= ITEM_INSERT_BATCH_SIZE:
+                flush()
+                batch = []
+        flush(final=True)
+    except Exception:
+        db.rollback()
+        if committed:
+            with write_lock:
+                delete_items(db, dataset_id, below=committed)
+                db.commit()
+        raise
+    return count
+
+
+def set_row_count(db: Session, dataset_id: int, count: Optional[int]):
+    db.query(models.Dataset).filter(models.Dataset.dataset_id == dataset_id).update(
+        {'row_count': count}, synchronize_session=False
+    )
+
+
+def has_items(db: Session, dataset_id: int) -> bool:
+    return db.query(models.DatasetItem.item_id).filter(
+        models.DatasetItem.dataset_id == dataset_id
+    ).first() is not None
+
+
+def get_item_page(db: Session, dataset_id: int, skip: int = 0, limit: int = 100) -> List[Any]:
+    """Items [skip, skip + limit) by ordinal range, so deep pages cost the same as the first"""
+    rows = db.query(models.DatasetItem.payload).filter(
+        models.DatasetItem.dataset_id == dataset_id,
+        models.DatasetItem.ordinal >= skip,
+        models.DatasetItem.ordinal < skip + limit
+    ).order_by(models.DatasetItem.ordinal)
+    return [row.payload for row in rows]
+
+
+def iter_dataset_records(db: Session, dataset: models.Dataset) -> Iterator[Tuple[int, Any]]:
+    """
+    Stream (ordinal, record) pairs of a dataset in order: from Dataset_Item
+    when ingested, otherwise through the row index of its file (large
+    line-oriented files), where the ordinal is the record's index position
+    as used by get_items_by_ordinals() and Dataset.row_count
+    """
+    if has_items(db, dataset.dataset_id):
+        rows = db.query(models.DatasetItem.ordinal, models.DatasetItem.payload).filter(
+            models.DatasetItem.dataset_id == dataset.dataset_id
+        ).order_by(models.DatasetItem.ordinal).yield_per(ITEM_INSERT_BATCH_SIZE)
+        for row in rows:
+            yield row.ordinal, row.payload
+        return
+
+    from services.dataset_storage import dataset_path, row_index_path
+    path = dataset_path(dataset)
+    if not path or not os.path.exists(path):
+        return
+    index_path = row_index_path(dataset)
+    if not index_path:
+        yield from enumerate(iter_records(path, dataset.format))
+        return
+    total = row_index.row_count(index_path, dataset.format)
+    for skip in range(0, total, ITEM_INSERT_BATCH_SIZE):
+        records = row_index.read_records(path, index_path, dataset.format, skip, ITEM_INSERT_BATCH_SIZE)
+        for i, record in enumerate(records):
+            if record is not None:
+                yield skip + i, record
+
+
+def get_items_by_ordinals(db: Session, dataset: models.Dataset, ordinals: List[int]) -> List[Dict[str, Any]]:
+    """
+    Items at the given ordinals as {'ordinal', 'data'}; row-indexed files are
+    read one contiguous run of ordinals at a time (blank lines have no item)
+    """
+    ordinals = sorted(set(ordinals))
+    if not ordinals:
+        return []
+    if has_items(db, dataset.dataset_id):
+        found = {}
+        for start in range(0, len(ordinals), 500):
+            found.update(db.query(models.DatasetItem.ordinal, models.DatasetItem.payload).filter(
+                models.DatasetItem.dataset_id == dataset.dataset_id,
+                models.DatasetItem.ordinal.in_(ordinals[start:start + 500])
+            ).all())
+        return [{'ordinal': ordinal, 'data': found[ordinal]} for ordinal in ordinals if ordinal in found]
+
+    from services.dataset_storage import dataset_path, row_index_path
+    index_path = row_index_path(dataset)
+    if not index_path:
+        return []
+    items = []
+    run_start = previous = ordinals[0]
+    for ordinal in ordinals[1:] + [None]:
+        if ordinal is not None and ordinal == previous + 1:
+            previous = ordinal
+            continue
+        records = row_index.read_records(dataset_path(dataset), index_path, dataset.format, run_start, previous - run_start + 1)
+        items.extend({'ordinal': run_start + i, 'data': record} for i, record in enumerate(records) if record is not None)
+        if ordinal is not None:
+            run_start = previous = ordinal
+    return items
@@ -0,0 +1,224 @@
+"""
+Dataset Sampling
+Deterministic selection of dataset items. Every item gets a key from a hash
+of (seed, ordinal); an item is in a rate-r sample when its key is below r,
+and in a size-k sample when its key is among the k smallest. A seed always
+reproduces the same sample, a smaller rate gives a subset of a larger one,
+and each is one streaming pass that holds a single record at a time.
+
+Stratified samples apply this per value of a field, keeping only counters
+and at most k candidate keys per stratum beside the sample itself.
+"""
+import hashlib
+import heapq
+from typing import Any, Dict, Iterator, List, Optional
+from sqlalchemy.orm import Session
+import models
+from services import dataset_items
+
+
+_HASH_SCALE = float(1 << 64)
+
+MAX_STRATA = 10000
+
+
+def sample_key(seed: int, ordinal: int) -> float:
+    """Uniform value in [0, 1) fixed by (seed, ordinal)"""
+    digest = hashlib.blake2b(f"{seed}:{ordinal}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / _HASH_SCALE
+
+
+def field_value(record: Any, field: str) -> Any:
+    """Value of `field` in a record; dots reach into nested objects ("meta.label")"""
+    value = record
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def matches(record: Any, filters: Dict[str, Any]) -> bool:
+    """
+    Whether every field equals its filter value (or one of a list of values);
+    compared as strings, since CSV fields are always text
+    """
+    for field, accepted in filters.items():
+        value = field_value(record, field)
+        if value is None:
+            return False
+        accepted = accepted if isinstance(accepted, list) else [accepted]
+        if str(value) not in {str(option) for option in accepted}:
+            return False
+    return True
+
+
+def select_ordinals(
+    db: Session,
+    dataset: models.Dataset,
+    filters: Optional[Dict[str, Any]] = None,
+    rate: Optional[float] = None,
+    seed: int = 0,
+    limit: Optional[int] = None
+) -> Iterator[int]:
+    """
+    Yield the ordinals of the items matching `filters`, kept with probability
+    `rate`, in dataset order and at most `limit` of them
+
+    Without filters no record is read; the ordinals come from Dataset.row_count.
+    """
+    if filters:
+        candidates = (
+            ordinal for ordinal, record in dataset_items.iter_dataset_records(db, dataset)
+            if matches(record, filters)
+        )
+    else:
+        candidates = iter(range(dataset.row_count or 0))
+
+    selected = 0
+    for ordinal in candidates:
+        if limit is not None and selected >= limit:
+            return
+        if rate is not None and rate < 1 and sample_key(seed, ordinal) >= rate:
+            continue
+        yield ordinal
+        selected += 1
+
+
+def _allocate(sizes: List[int], total: int) -> List[int]:
+    """
+    Split `total` slots over strata of the given sizes: one per stratum first
+    (largest strata first), the rest in proportion to what each has left
+    """
+    quotas = [0] * len(sizes)
+    remaining = total
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        if remaining and sizes[i]:
+            quotas[i] = 1
+            remaining -= 1
+    spare = [size - quota for size, quota in zip(sizes, quotas)]
+    spare_total = sum(spare)
+    if remaining and spare_total:
+        shares = [remaining * left / spare_total for left in spare]
+        for i, share in enumerate(shares):
+            quotas[i] += int(share)
+        remaining -= sum(int(share) for share in shares)
+        for i in sorted(range(len(sizes)), key=lambda i: int(shares[i]) - shares[i]):
+            if not remaining:
+                break
+            if quotas[i] < sizes[i]:
+                quotas[i] += 1
+                remaining -= 1
+    return quotas
+
+
+class _Stratum:
+    """Counts and bottom-k candidates of one stratum"""
+    __slots__ = ('population', 'selected', 'smallest')
+
+    def __init__(self):
+        self.population = 0
+        self.selected: List[int] = []  # Ordinals under the rate threshold
+        self.smallest: List[tuple] = []  # Max-heap of (-key, ordinal), at most k entries
+
+    def offer(self, key: float, ordinal: int, k: int):
+        if len(self.smallest) < k:
+            heapq.heappush(self.smallest, (-key, ordinal))
+        elif -self.smallest[0][0] > key:
+            heapq.heapreplace(self.smallest, (-key, ordinal))
+
+
+def stratified_sample(
+    db: Session,
+    dataset: models.Dataset,
+    stratify_by: Optional[str] = None,
+    rate: Optional[float] = None,
+    per_stratum: Optional[int] = None,
+    min_per_stratum: int = 0,
+    seed: int = 0,
+    filters: Optional[Dict[str, Any]] = None,
+    max_items: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Sample a dataset's items within each value of `stratify_by` (or as a
+    single stratum without it)
+
+    Args:
+        rate: Keep this fraction of every stratum (proportional allocation)
+        per_stratum: Keep this many items of every stratum instead
+        min_per_stratum: With `rate`, also keep the smallest-keyed items of a
+            stratum until it has this many, so rare values are represented
+        filters: Only items matching these fields (see matches())
+        max_items: Cap the whole sample; each stratum keeps the smallest-keyed
+            items of its share (at least one while the cap allows, the rest
+            proportional to its sample), so no stratum is dropped
+
+    Returns:
+        Dict with the sorted sampled 'ordinals' and per-stratum 'strata'
+        ({'value', 'population', 'sampled'}, largest first)
+
+    Raises:
+        ValueError: neither or both of rate / per_stratum, or too many strata
+    """
+    if (rate is None) == (per_stratum is None):
+        raise ValueError("Give exactly one of rate or per_stratum")
+    if rate is not None and not 0 < rate <= 1:
+        raise ValueError("rate must be in (0, 1]")
+    if per_stratum is not None and per_stratum < 1:
+        raise ValueError("per_stratum must be at least 1")
+    if max_items is not None and max_items < 1:
+        raise ValueError("max_items must be at least 1")
+    k = per_stratum if per_stratum is not None else max(min_per_stratum, 0)
+
+    strata: Dict[Any, _Stratum] = {}
+    for ordinal, record in dataset_items.iter_dataset_records(db, dataset):
+        if filters and not matches(record, filters):
+            continue
+        value = field_value(record, stratify_by) if stratify_by else None
+        value = None if value is None else str(value)
+        stratum = strata.get(value)
+        if stratum is None:
+            if len(strata) >= MAX_STRATA:
+                raise ValueError(f"{stratify_by} has more than {MAX_STRATA} distinct values; stratify by a coarser field")
+            stratum = strata[value] = _Stratum()
+        stratum.population += 1
+
+        key = sample_key(seed, ordinal)
+        if rate is not None and key < rate:
+            stratum.selected.append(ordinal)
+        elif k:
+            stratum.offer(key, ordinal, k)
+
+    samples = []
+    for stratum in strata.values():
+        chosen = stratum.selected
+        if k:
+            # Heap entries are all keyed at or above the threshold, so topping up never duplicates
+            extra = sorted(stratum.smallest, reverse=True)[:max(k - len(chosen), 0)]
+            chosen = chosen + [ordinal for _, ordinal in extra]
+        samples.append(chosen)
+
+    if max_items is not None and sum(len(chosen) for chosen in samples) > max_items:
+        quotas = _allocate([len(chosen) for chosen in samples], max_items)
+        samples = [
+            sorted(chosen, key=lambda ordinal: sample_key(seed, ordinal))[:quota]
+            for chosen, quota in zip(samples, quotas)
+        ]
+
+    ordinals = []
+    summary = []
+    for (value, stratum), chosen in zip(strata.items(), samples):
+        ordinals.extend(chosen)
+        summary.append({'value': value, 'population': stratum.population, 'sampled': len(chosen)})
+
+    summary.sort(key=lambda entry: (-entry['population'], str(entry['value'])))
+    ordinals.sort()
+    return {
+        'dataset_id': dataset.dataset_id,
+        'stratify_by': stratify_by,
+        'seed': seed,
+        'population': sum(entry['population'] for entry in summary),
+        'sample_size': len(ordinals),
+        'strata': summary,
+        'ordinals': ordinals
+    }
@@ -0,0 +1,219 @@
+"""
+Dataset Storage
+Each dataset records where its file lives in Dataset.storage_key, so reads
+and deletes resolve it in O(1) instead of scanning upload directories:
+
+    blob:<sha256>   content in the blob store (every current upload path)
+    file:<path>     a file saved before the blob store; relative paths are
+                    anchored at the backend directory, not the working directory
+"""
+import os
+from typing import Optional, List
+from sqlalchemy import inspect, text, select, func
+from sqlalchemy.orm import Session
+import models
+from services.blob_store import blob_store, release_blobs, remove_unreferenced, BACKEND_DIR
+from services import row_index
+from services.upload_stats import UploadStatsService
+
+
+BLOB_PREFIX = 'blob:'
+FILE_PREFIX = 'file:'
+
+# Where single-file uploads used to be written (relative to wherever uvicorn was started)
+LEGACY_UPLOAD_DIRS = list(dict.fromkeys([
+    os.path.join(BACKEND_DIR, 'uploads', 'datasets'),
+    os.path.abspath(os.path.join('uploads', 'datasets')),
+    os.path.abspath(os.path.join('backend', 'uploads', 'datasets'))
+]))
+
+STORAGE_COLUMNS = ('storage_key', 'file_size', 'checksum', 'row_count')
+
+
+def blob_key(sha256: str) -> str:
+    return f"{BLOB_PREFIX}{sha256}"
+
+
+def file_key(path: str) -> str:
+    path = os.path.abspath(path)
+    if path.startswith(BACKEND_DIR + os.sep):
+        path = os.path.relpath(path, BACKEND_DIR)
+    return f"{FILE_PREFIX}{path}"
+
+
+def resolve_path(storage_key: Optional[str]) -> Optional[str]:
+    """Absolute path of the file behind a storage key"""
+    if not storage_key:
+        return None
+    if storage_key.startswith(BLOB_PREFIX):
+        return blob_store.path_for(storage_key[len(BLOB_PREFIX):])
+    if storage_key.startswith(FILE_PREFIX):
+        return os.path.join(BACKEND_DIR, storage_key[len(FILE_PREFIX):])
+    return None
+
+
+def dataset_path(dataset: models.Dataset) -> Optional[str]:
+    return resolve_path(dataset.storage_key)
+
+
+def row_index_path(dataset: models.Dataset, build: bool = True) -> Optional[str]:
+    """
+    Row offset index of a line-oriented dataset, built on first use if missing
+    (hash-registered content and files stored before indexing); with
+    build=False a missing index is None instead
+    """
+    fmt = row_index.normalize_format(dataset.format)
+    path = dataset_path(dataset)
+    if not path or not row_index.is_indexed(fmt):
+        return None
+    if dataset.storage_key.startswith(BLOB_PREFIX):
+        index_path = blob_store.index_path_for(dataset.storage_key[len(BLOB_PREFIX):], fmt)
+    else:
+        index_path = f"{path}{row_index.INDEX_SUFFIX}"
+    if not os.path.exists(index_path):
+        if not build:
+            return None
+        row_index.build_index(path, index_path, fmt)
+    return index_path
+
+
+def delete_dataset(db: Session, dataset: models.Dataset):
+    """
+    Delete a dataset with its items and ingestion jobs and release its stored
+    file; blob content is removed only once no other dataset references it
+    (a job still running notices its row is gone and stops)
+    """
+    from services.dataset_items import delete_items
+
+    blob_hashes = [blob.sha256 for blob in dataset.blobs]
+    legacy_path = dataset_path(dataset) if (dataset.storage_key or '').startswith(FILE_PREFIX) else None
+
+    delete_items(db, dataset.dataset_id)
+    db.query(models.IngestionJob).filter(
+        models.IngestionJob.dataset_id == dataset.dataset_id
+    ).delete(synchronize_session=False)
+    if dataset.storage_key:
+        UploadStatsService.record_files(db, [(dataset.format, dataset.file_size)], sign=-1)
+    db.delete(dataset)
+    db.flush()
+    orphaned = release_blobs(db, blob_hashes)
+    db.commit()
+
+    remove_unreferenced(db, orphaned)
+    if legacy_path:
+        for path in (legacy_path, f"{legacy_path}{row_index.INDEX_SUFFIX}"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Warning: Could not delete file {path}: {str(e)}")
+
+
+# ---------- Upgrading existing databases ----------
+
+def prepare_schema(engine):
+    """
+    Add the storage columns to an existing Dataset table and Blob.ref_count,
+    counted from Dataset_Blob, to an existing Blob table (create_all skips
+    existing tables)
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    if inspector.has_table(models.Dataset.__tablename__):
+        existing = {column['name'] for column in inspector.get_columns(models.Dataset.__tablename__)}
+        table = models.Dataset.__table__
+        with engine.begin() as conn:
+            for name in STORAGE_COLUMNS:
+                if name in existing:
+                    continue
+                column = table.c[name]
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}"
+                ))
+
+    if inspector.has_table(models.Blob.__tablename__) and 'ref_count' not in {
+        column['name'] for column in inspector.get_columns(models.Blob.__tablename__)
+    }:
+        blobs = models.Blob.__table__
+        links = models.DatasetBlob.__table__
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"ALTER TABLE {preparer.format_table(blobs)} ADD COLUMN "
+                f"{preparer.format_column(blobs.c.ref_count)} INTEGER DEFAULT 0 NOT NULL"
+            ))
+            conn.execute(blobs.update().values(ref_count=(
+                select(func.count()).select_from(links).where(links.c.sha256 == blobs.c.sha256).scalar_subquery()
+            )))
+
+
+def _match_legacy_files(datasets: List[models.Dataset], listings: List[tuple]) -> dict:
+    """
+    Map dataset ids to files in the legacy upload directories: an exact name
+    (or name without extension) match first, then a substring match only when
+    it points at a single file no other dataset claimed
+    """
+    files = [
+        (filename, os.path.join(directory, filename))
+        for directory, filenames in listings
+        for filename in filenames if not filename.endswith(row_index.INDEX_SUFFIX)
+    ]
+    matches = {}
+    claimed = set()
+    for dataset in datasets:
+        for filename, path in files:
+            if dataset.dataset_name in (filename, os.path.splitext(filename)[0]):
+                matches[dataset.dataset_id] = path
+                claimed.add(path)
+                break
+    for dataset in datasets:
+        if dataset.dataset_id in matches:
+            continue
+        candidates = [path for filename, path in files if dataset.dataset_name in filename and path not in claimed]
+        if len(candidates) == 1:
+            matches[dataset.dataset_id] = candidates[0]
+            claimed.add(candidates[0])
+    return matches
+
+
+def backfill_storage_keys(db: Session) -> int:
+    """
+    Give datasets created before storage keys existed their key, size and
+    checksum, so no request has to scan upload directories again. Datasets
+    whose file can't be found keep a NULL key and read as missing.
+
+    Returns:
+        Number of datasets updated
+    """
+    pending = db.query(models.Dataset).filter(models.Dataset.storage_key.is_(None)).all()
+    if not pending:
+        return 0
+
+    listings = [
+        (directory, sorted(os.listdir(directory)))
+        for directory in LEGACY_UPLOAD_DIRS if os.path.isdir(directory)
+    ]
+    hashes = [dataset.blobs[0].sha256 for dataset in pending if dataset.blobs]
+    blob_sizes = dict(db.query(models.Blob.sha256, models.Blob.size).filter(
+        models.Blob.sha256.in_(hashes)
+    )) if hashes else {}
+
+    legacy_files = _match_legacy_files([dataset for dataset in pending if not dataset.blobs], listings)
+
+    updated = 0
+    for dataset in pending:
+        if dataset.blobs:
+            sha256 = dataset.blobs[0].sha256
+            dataset.storage_key = blob_key(sha256)
+            dataset.checksum = sha256
+            dataset.file_size = blob_sizes.get(sha256)
+        else:
+            path = legacy_files.get(dataset.dataset_id)
+            if not path:
+                continue
+            dataset.storage_key = file_key(path)
+            dataset.file_size = os.path.getsize(path)
+        updated += 1
+    db.commit()
+    return updated
@@ -0,0 +1,453 @@
+"""
+Ingestion Pipeline
+Upload endpoints only store the file and register its dataset; everything
+that reads the content runs afterwards as an Ingestion_Job in a worker
+process, so uploads return at once and parsing never holds an API worker:
+
+    sniff         format from the content when the extension doesn't say
+    write_items   records parsed and validated as they stream into batched
+                  Dataset_Item inserts (large line-oriented files skip this)
+    build_index   row offset index for CSV/JSONL/TXT, and the row count
+    create_tasks  tasks in options["project_id"], if requested: one per dataset,
+                  or one per options["items_per_task"] items
+
+Jobs run on a process pool of INGESTION_WORKERS (0 runs them on one thread
+in the API process). Database writes from all workers share a semaphore of
+INGESTION_DB_WRITERS slots, so parsing runs in parallel while SQLite still
+sees one writer at a time. Progress is committed to the job row after every
+batch; GET /api/ingestion/jobs/{job_id} reads it.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, BrokenExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+import models
+from services import annotation_service, dataset_items, dataset_storage, row_index
+from services.upload_stats import file_category
+
+
+STAGES = ('sniff', 'write_items', 'build_index', 'create_tasks')
+# Share of overall progress each stage accounts for
+STAGE_WEIGHTS = {'sniff': 0.05, 'write_items': 0.8, 'build_index': 0.1, 'create_tasks': 0.05}
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", min(2, os.cpu_count() or 1)))
+INGESTION_DB_WRITERS = int(os.getenv(
+    "INGESTION_DB_WRITERS", 1 if engine.dialect.name == 'sqlite' else max(INGESTION_WORKERS, 1)
+))
+
+ACTIVE_STATUSES = ("queued", "running")
+# A running job's updated_at is its heartbeat; only jobs silent for longer are taken over on restart
+INGESTION_LEASE = timedelta(seconds=int(os.getenv("INGESTION_LEASE_SECONDS", 300)))
+HEARTBEAT_INTERVAL = INGESTION_LEASE / 5
+
+SNIFF_BYTES = 64 * 1024
+MAX_WARNINGS = 20
+
+_executor = None
+_executor_lock = threading.Lock()
+_pool_write_lock = None  # Kept referenced while the pool may still start workers with it
+_write_lock = None  # Set in each worker by _init_worker
+
+
+class JobCancelled(Exception):
+    """The job's row (or its dataset) was deleted while it ran"""
+
+
+# ---------- Stages ----------
+
+def sniff_format(path: str, declared: Optional[str]) -> str:
+    """
+    Format to parse a file as: the declared extension when it is a known
+    file type, otherwise json, jsonl, csv or txt judged from the first bytes
+    (binary or undecodable content keeps the declared format)
+    """
+    fmt = row_index.normalize_format(declared)
+    if file_category(fmt) != 'unknown':
+        return fmt
+
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    if b'\0' in head:
+        return fmt
+    try:
+        text = head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:  # Not just a multi-byte character cut off by the read
+            return fmt
+        text = head[:e.start].decode('utf-8')
+    text = text.lstrip('\ufeff \t\r\n')
+    if not text:
+        return fmt
+
+    if text[0] == '[':
+        return 'json'
+    lines = [line for line in text.splitlines() if line.strip()]
+    if text[0] == '{':
+        if len(lines) > 1 and lines[1].lstrip().startswith('{'):
+            try:
+                json.loads(lines[0])
+                return 'jsonl'
+            except ValueError:
+                pass
+        return 'json'
+    sample = text[:text.rfind('\n')] if '\n' in text else text
+    try:
+        if csv.Sniffer().sniff(sample, delimiters=',').delimiter == ',' and len(lines) > 1:
+            return 'csv'
+    except csv.Error:
+        pass
+    return 'txt'
+
+
+def record_problem(record: Any, fmt: str) -> Optional[str]:
+    """Why a parsed record is suspect, or None; suspect records are still kept so ordinals match the file"""
+    if fmt == 'csv':
+        if None in record:
+            return "More fields than the header"
+        if None in record.values():
+            return "Fewer fields than the header"
+        if not any(value.strip() for value in record.values()):
+            return "Empty row"
+    elif fmt in ('json', 'jsonl'):
+        if record is None or record == {} or record == []:
+            return "Empty record"
+    return None
+
+
+def validate_records(records: Iterable[Any], fmt: str, report: Dict[str, Any]) -> Iterator[Any]:
+    """Pass records through, counting suspect ones in report['invalid_count'] / report['warnings']"""
+    for ordinal, record in enumerate(records):
+        problem = record_problem(record, fmt)
+        if problem:
+            report['invalid_count'] += 1
+            if len(report['warnings']) < MAX_WARNINGS:
+                report['warnings'].append({'ordinal': ordinal, 'problem': problem})
+        yield record
+
+
+def _stage_start(stage: str) -> float:
+    return sum(STAGE_WEIGHTS[name] for name in STAGES[:STAGES.index(stage)])
+
+
+def _report(db: Session, job_id: int, **fields):
+    """Commit job fields; raises JobCancelled once the job row is gone"""
+    fields['updated_at'] = datetime.utcnow()
+    with _write_lock or nullcontext():
+        updated = db.query(models.IngestionJob).filter(
+            models.IngestionJob.job_id == job_id
+        ).update(fields, synchronize_session=False)
+        db.commit()
+    if not updated:
+        raise JobCancelled(f"Ingestion job {job_id} no longer exists")
+
+
+def _enter_stage(db: Session, job_id: int, stage: str, **fields):
+    _report(db, job_id, stage=stage, progress=_stage_start(stage), **fields)
+
+
+def _run_stages(db: Session, job: models.IngestionJob):
+    dataset = db.get(models.Dataset, job.dataset_id)
+    if dataset is None:
+        raise JobCancelled(f"Dataset {job.dataset_id} no longer exists")
+    path = dataset_storage.dataset_path(dataset)
+    if not path or not os.path.exists(path):
+        raise FileNotFoundError("Dataset file not found")
+    declared = row_index.normalize_format(dataset.format)
+
+    _enter_stage(db, job.job_id, 'sniff')
+    fmt = sniff_format(path, declared)
+    # The upload's row index was built for the declared format
+    index_usable = fmt == declared and row_index.is_indexed(fmt)
+    index_path = dataset_storage.row_index_path(dataset, build=False) if index_usable else None
+    items_total = row_index.row_count(index_path, fmt) if index_path else None
+
+    ingested = False
+    if dataset_items.should_ingest(fmt, os.path.getsize(path)):
+        _enter_stage(db, job.job_id, 'write_items', detected_format=fmt, items_total=items_total)
+        report = {'invalid_count': 0, 'warnings': []}
+        start, weight = _stage_start('write_items'), STAGE_WEIGHTS['write_items']
+
+        def on_batch(count: int):
+            fields = {'items_processed': count, 'invalid_count': report['invalid_count'],
+                      'warnings': list(report['warnings']) or None}
+            if items_total:
+                fields['progress'] = start + weight * min(count / items_total, 1.0)
+            _report(db, job.job_id, **fields)
+
+        records = validate_records(dataset_items.iter_records(path, fmt), fmt, report)
+        dataset_items.ingest_dataset_items(db, dataset.dataset_id, records, on_batch, _write_lock)
+        ingested = True
+    else:
+        _report(db, job.job_id, detected_format=fmt, items_total=items_total)
+
+    _enter_stage(db, job.job_id, 'build_index')
+    if index_usable:
+        index_path = dataset_storage.row_index_path(dataset)
+    if not ingested:
+        # Large line-oriented files are paged through the index; other files are one item
+        count = row_index.row_count(index_path, fmt) if index_path else 1
+        with _write_lock or nullcontext():
+            dataset_items.set_row_count(db, dataset.dataset_id, count)
+            db.commit()
+
+    options = job.options or {}
+    project_id = options.get('project_id')
+    if project_id:
+        _enter_stage(db, job.job_id, 'create_tasks')
+        with _write_lock or nullcontext():
+            exists = db.query(models.AnnotationTask.task_id).filter(
+                models.AnnotationTask.project_id == project_id,
+                models.AnnotationTask.dataset_id == dataset.dataset_id
+            ).first()
+            # Existing tasks mean a restart interrupted the job after this stage committed
+            if not exists and options.get('items_per_task'):
+                db.refresh(dataset)
+                annotation_service.generate_tasks(db, project_id, dataset, items_per_task=int(options['items_per_task']))
+            elif not exists:
+                db.add(models.AnnotationTask(project_id=project_id, dataset_id=dataset.dataset_id))
+                db.commit()
+
+
+def _claim(db: Session, job_id: int) -> str:
+    """
+    Mark a queued job running (no commit), unless another job of the same
+    dataset is running: two ingestions would overwrite each other's items,
+    so the later one is refused
+
+    Returns:
+        'running', 'refused', or 'skipped' when the job is no longer queued
+    """
+    job = db.get(models.IngestionJob, job_id)
+    if job is None or job.status != "queued":
+        return "skipped"
+    # Serializes claims per dataset where row locks exist (SQLite has a single writer anyway)
+    db.query(models.Dataset.dataset_id).filter(
+        models.Dataset.dataset_id == job.dataset_id
+    ).with_for_update().first()
+    busy = db.query(models.IngestionJob.job_id).filter(
+        models.IngestionJob.dataset_id == job.dataset_id,
+        models.IngestionJob.status == "running",
+        models.IngestionJob.job_id != job_id
+    ).first()
+
+    now = datetime.utcnow()
+    if busy:
+        job.status = "failed"
+        job.error = f"Ingestion job {busy.job_id} is already running for this dataset"
+        job.finished_at = now
+        job.updated_at = now
+        return "refused"
+    claimed = db.query(models.IngestionJob).filter(
+        models.IngestionJob.job_id == job_id,
+        models.IngestionJob.status == "queued"
+    ).update({'status': "running", 'started_at': now, 'updated_at': now, 'error': None},
+             synchronize_session=False)
+    return "running" if claimed else "skipped"
+
+
+def _heartbeat(job_id: int, stop: threading.Event):
+    """Bump a running job's updated_at every HEARTBEAT_INTERVAL until `stop` is set"""
+    db = SessionLocal()
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+            with _write_lock or nullcontext():
+                db.query(models.IngestionJob).filter(
+                    models.IngestionJob.job_id == job_id,
+                    models.IngestionJob.status == "running"
+                ).update({'updated_at': datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Heartbeat of ingestion job {job_id} failed: {e}")
+    finally:
+        db.close()
+
+
+def run_job(job_id: int) -> str:
+    """
+    Run one queued job to completion in the calling worker
+
+    Returns:
+        The job's final status ('skipped' when another worker claimed it
+        first, 'refused' while another job of its dataset runs)
+    """
+    db = SessionLocal()
+    stop = threading.Event()
+    try:
+        with _write_lock or nullcontext():
+            claimed = _claim(db, job_id)
+            db.commit()
+        if claimed != "running":
+            return claimed
+
+        # Stages such as indexing a large file report nothing for a while; keep the lease alive meanwhile
+        threading.Thread(target=_heartbeat, args=(job_id, stop), daemon=True).start()
+        _run_stages(db, db.get(models.IngestionJob, job_id))
+        _report(db, job_id, status="complete", stage=None, progress=1.0, finished_at=datetime.utcnow())
+        return "complete"
+    except JobCancelled:
+        db.rollback()
+        return "cancelled"
+    except Exception as e:
+        db.rollback()
+        print(f"Ingestion job {job_id} failed: {e}")
+        try:
+            _report(db, job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+        except Exception as report_error:
+            db.rollback()
+            print(f"Could not record failure of ingestion job {job_id}: {report_error}")
+        return "failed"
+    finally:
+        stop.set()
+        db.close()
+
+
+# ---------- Scheduling ----------
+
+def _init_worker(write_lock):
+    global _write_lock
+    _write_lock = write_lock
+
+
+def _get_executor():
+    global _executor, _pool_write_lock
+    with _executor_lock:
+        if _executor is None:
+            if INGESTION_WORKERS > 0:
+                # spawn: workers start clean instead of inheriting the server's threads and connections
+                context = multiprocessing.get_context('spawn')
+                _pool_write_lock = _pool_write_lock or context.BoundedSemaphore(INGESTION_DB_WRITERS)
+                _executor = ProcessPoolExecutor(
+                    max_workers=INGESTION_WORKERS,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(_pool_write_lock,)
+                )
+            else:
+                _init_worker(threading.BoundedSemaphore(INGESTION_DB_WRITERS))
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestion")
+        return _executor
+
+
+def _submit(job_ids: List[int]):
+    global _executor
+    for job_id in job_ids:
+        try:
+            _get_executor().submit(run_job, job_id)
+        except BrokenExecutor:
+            # A worker died (e.g. killed for memory); start a fresh pool
+            with _executor_lock:
+                _executor = None
+            _get_executor().submit(run_job, job_id)
+
+
+def active_jobs(db: Session, dataset_ids: List[int]) -> Dict[int, models.IngestionJob]:
+    """Queued or running job per dataset, for datasets that have one"""
+    active = {}
+    dataset_ids = list(dict.fromkeys(dataset_ids))
+    for start in range(0, len(dataset_ids), 500):
+        for job in db.query(models.IngestionJob).filter(
+            models.IngestionJob.dataset_id.in_(dataset_ids[start:start + 500]),
+            models.IngestionJob.status.in_(ACTIVE_STATUSES)
+        ):
+            active[job.dataset_id] = job
+    return active
+
+
+def enqueue(db: Session, dataset_ids: List[int], options: Optional[Dict[str, Any]] = None) -> List[models.IngestionJob]:
+    """
+    Queue a job per dataset (one commit) and hand them to the workers; a
+    dataset that already has a queued or running job gets that job back
+    (with its own options) instead of a second one
+    """
+    active = active_jobs(db, dataset_ids)
+    jobs = []
+    new_jobs = []
+    for dataset_id in dataset_ids:
+        job = active.get(dataset_id)
+        if job is None:
+            job = active[dataset_id] = models.IngestionJob(dataset_id=dataset_id, options=options or None)
+            new_jobs.append(job)
+        jobs.append(job)
+    if new_jobs:
+        db.add_all(new_jobs)
+        db.commit()
+        _submit([job.job_id for job in new_jobs])
+    return jobs
+
+
+def enqueue_created(db: Session, created: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None):
+    """Queue ingestion for bulk_create_datasets() results, adding 'job_id' to each entry"""
+    jobs = enqueue(db, [dataset['dataset_id'] for dataset in created], options)
+    for dataset, job in zip(created, jobs):
+        dataset['job_id'] = job.job_id
+
+
+def resume_pending(db: Session) -> int:
+    """
+    Requeue jobs a restart interrupted: queued ones, and running ones whose
+    heartbeat is older than INGESTION_LEASE (their worker is gone). Jobs
+    still running in another server process keep running there.
+    """
+    cutoff = datetime.utcnow() - INGESTION_LEASE
+    stale_running = and_(models.IngestionJob.status == "running", models.IngestionJob.updated_at < cutoff)
+    with _write_lock or nullcontext():
+        db.query(models.IngestionJob).filter(stale_running).update(
+            {'status': "queued", 'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    pending = [row.job_id for row in db.query(models.IngestionJob.job_id).filter(
+        models.IngestionJob.status == "queued"
+    ).order_by(models.IngestionJob.job_id)]
+    # A queued job submitted by several processes is still claimed by only one of them
+    _submit(pending)
+    return len(pending)
+
+
+def shutdown():
+    """Stop the workers without waiting; unfinished jobs are resumed on the next start"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+# ---------- Queries ----------
+
+def get_job(db: Session, job_id: int) -> Optional[models.IngestionJob]:
+    return db.get(models.IngestionJob, job_id)
+
+
+def latest_job(db: Session, dataset_id: int) -> Optional[models.IngestionJob]:
+    return db.query(models.IngestionJob).filter(
+        models.IngestionJob.dataset_id == dataset_id
+    ).order_by(models.IngestionJob.job_id.desc()).first()
+
+
+def describe_job(job: models.IngestionJob) -> Dict[str, Any]:
+    return {
+        'job_id': job.job_id,
+        'dataset_id': job.dataset_id,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': round(job.progress or 0.0, 4),
+        'detected_format': job.detected_format,
+        'items_processed': job.items_processed,
+        'items_total': job.items_total,
+        'invalid_count': job.invalid_count,
+        'warnings': job.warnings or [],
+        'options': job.options,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at
+    }
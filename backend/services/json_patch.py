@@ -0,0 +1,82 @@
+"""
+Minimal JSON Patch (RFC 6902) support
+Generates and applies add/remove/replace operations between JSON documents
+"""
+import copy
+from typing import Any, Dict, List
+
+
+def _escape(token: str) -> str:
+    return token.replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token: str) -> str:
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(source: Any, target: Any, path: str = '') -> List[Dict[str, Any]]:
+    """
+    Build a JSON patch that turns `source` into `target`
+
+    Objects are diffed key by key; lists and scalars are replaced wholesale,
+    which keeps patches small for the annotation documents we version.
+    """
+    if isinstance(source, dict) and isinstance(target, dict):
+        ops = []
+        for key in source:
+            if key not in target:
+                ops.append({'op': 'remove', 'path': f"{path}/{_escape(str(key))}"})
+        for key, value in target.items():
+            child_path = f"{path}/{_escape(str(key))}"
+            if key not in source:
+                ops.append({'op': 'add', 'path': child_path, 'value': value})
+            else:
+                ops.extend(make_patch(source[key], value, child_path))
+        return ops
+
+    if source == target and type(source) is type(target):
+        return []
+
+    return [{'op': 'replace', 'path': path, 'value': target}]
+
+
+def apply_patch(document: Any, patch: List[Dict[str, Any]]) -> Any:
+    """Apply a JSON patch and return the patched copy of `document`"""
+    result = copy.deepcopy(document)
+
+    for operation in patch:
+        op = operation['op']
+        path = operation['path']
+        value = copy.deepcopy(operation.get('value'))
+
+        if path == '':
+            if op in ('add', 'replace'):
+                result = value
+                continue
+            raise ValueError("Cannot remove the document root")
+
+        tokens = [_unescape(t) for t in path.split('/')[1:]]
+        parent = result
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == '-' else int(last)
+            if op == 'add':
+                parent.insert(index, value)
+            elif op == 'replace':
+                parent[index] = value
+            elif op == 'remove':
+                del parent[index]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op}")
+        else:
+            if op in ('add', 'replace'):
+                parent[last] = value
+            elif op == 'remove':
+                del parent[last]
+            else:
+                raise ValueError(f"Unsupported patch operation: {op}")
+
+    return result
@@ -0,0 +1,105 @@
+"""
+Streaming JSON Arrays
+Yield the elements of a top-level JSON array one at a time from buffered
+reads, using the stdlib decoder's raw_decode on each element, so memory is
+bounded by the largest single element instead of the whole document
+"""
+import json
+from typing import Any, Iterator, TextIO
+
+
+READ_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]}'
+
+_decoder = json.JSONDecoder()
+
+
+class _Buffer:
+    """Text read so far from `f`, trimmed as elements are consumed"""
+
+    def __init__(self, f: TextIO, read_size: int):
+        self.f = f
+        self.read_size = read_size
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read more text, growing reads with the buffer so a huge element isn't re-decoded quadratically"""
+        if self.eof:
+            return False
+        chunk = self.f.read(max(self.read_size, len(self.text) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input), without consuming it"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def decode_value(self) -> Any:
+        """
+        Decode the value at the current position
+
+        A value is only accepted once a delimiter follows it in the buffer,
+        so numbers split across reads ("1." + "5") aren't cut short.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            if end < len(self.text) and self.text[end] in _DELIMITERS or not self.fill():
+                self.pos = end
+                return value
+
+
+def iter_json_items(f: TextIO, read_size: int = READ_SIZE) -> Iterator[Any]:
+    """
+    Yield the elements of a JSON array; any other top-level value is yielded
+    as the only item (the same items json.load + "list or [data]" gives)
+
+    Raises:
+        json.JSONDecodeError / ValueError: on malformed input, when reached
+    """
+    buffer = _Buffer(f, read_size)
+    first = buffer.peek()
+    if first == '':
+        raise ValueError("Empty JSON document")
+
+    if first != '[':
+        yield buffer.decode_value()
+    else:
+        buffer.pos += 1
+        if buffer.peek() == ']':
+            buffer.pos += 1
+        else:
+            while True:
+                yield buffer.decode_value()
+                separator = buffer.peek()
+                buffer.pos += 1
+                if separator == ']':
+                    break
+                if separator != ',':
+                    raise ValueError(f"Expected ',' or ']' in JSON array, found {separator or 'end of input'!r}")
+
+    if buffer.peek() != '':
+        raise ValueError("Extra data after JSON document")
+
+
+def iter_json_file(path: str) -> Iterator[Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_json_items(f)
@@ -1,8 +1,14 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import insert
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+from pathlib import Path
 from fastapi import HTTPException
 import models
 import schemas
+from services.blob_store import register_blobs, release_blobs, remove_unreferenced
+from services.dataset_storage import blob_key
+from services.upload_stats import UploadStatsService
 
 def create_project(db: Session, project: schemas.ProjectCreate):
     db_project = models.Project(**project.dict())
@@ -49,6 +55,87 @@ def create_dataset(db: Session, dataset: schemas.DatasetCreate):
     db.refresh(db_dataset)
     return db_dataset
 
+DATASET_INSERT_BATCH_SIZE = 1000
+
+def insert_returning_ids(db: Session, model, rows: List[Dict[str, Any]], batch_size: int = DATASET_INSERT_BATCH_SIZE) -> List[int]:
+    """
+    Insert rows of `model` and return their primary keys in input order
+    
+    Uses INSERT ... RETURNING with ids sorted by parameter order where the
+    dialect supports it; SQLAlchemy batches that into multi-row statements on
+    PostgreSQL and runs it row by row on SQLite. Dialects without RETURNING
+    (MySQL) fall back to an ORM flush. Either way it is one transaction.
+    """
+    table = model.__table__
+    id_column = list(table.primary_key.columns)[0]
+    dialect = db.get_bind().dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        stmt = insert(table).returning(id_column, sort_by_parameter_order=True)
+        ids = []
+        for start in range(0, len(rows), batch_size):
+            ids.extend(db.execute(stmt, rows[start:start + batch_size]).scalars().all())
+        return ids
+    
+    objects = [model(**row) for row in rows]
+    db.add_all(objects)
+    db.flush()
+    return [getattr(obj, id_column.key) for obj in objects]
+
+def bulk_create_datasets(db: Session, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Register one dataset per stored file in a single transaction
+    
+    Args:
+        files: Upload results with 'filename', 'sha256', 'size' (None to take it
+            from an existing Blob row), 'pinned' (stored by BlobStore.commit_file,
+            whose pin becomes the dataset's reference) and optionally
+            'dataset_name' / 'description' / 'format'
+    
+    Returns:
+        [{'dataset_id', 'filename'}] in input order; nothing is written if any
+        row fails, and the pins of the files are released
+    """
+    if not files:
+        return []
+    
+    now = datetime.utcnow()
+    unknown_sizes = [f['sha256'] for f in files if f.get('size') is None]
+    blob_sizes = dict(db.query(models.Blob.sha256, models.Blob.size).filter(
+        models.Blob.sha256.in_(unknown_sizes)
+    )) if unknown_sizes else {}
+    try:
+        dataset_rows = [{
+            'dataset_name': f.get('dataset_name') or f['filename'],
+            'description': f.get('description'),
+            'format': f.get('format') or Path(f['filename']).suffix,
+            'storage_key': blob_key(f['sha256']),
+            'file_size': f['size'] if f.get('size') is not None else blob_sizes.get(f['sha256']),
+            'checksum': f['sha256'],
+            'create_date': now
+        } for f in files]
+        dataset_ids = insert_returning_ids(db, models.Dataset, dataset_rows)
+        register_blobs(db, files)
+        link_rows = [{
+            'dataset_id': dataset_id,
+            'sha256': f['sha256'],
+            'filename': Path(f['filename']).name,
+            'added_at': now
+        } for dataset_id, f in zip(dataset_ids, files)]
+        for start in range(0, len(link_rows), DATASET_INSERT_BATCH_SIZE):
+            db.execute(insert(models.DatasetBlob.__table__), link_rows[start:start + DATASET_INSERT_BATCH_SIZE])
+        UploadStatsService.record_files(db, [(row['format'], row['file_size']) for row in dataset_rows])
+        db.commit()
+    except Exception:
+        db.rollback()
+        pinned = [f['sha256'] for f in files if f.get('pinned')]
+        if pinned:
+            orphaned = release_blobs(db, pinned)
+            db.commit()
+            remove_unreferenced(db, orphaned)
+        raise
+    
+    return [{'dataset_id': dataset_id, 'filename': f['filename']} for dataset_id, f in zip(dataset_ids, files)]
+
 def get_dataset(db: Session, dataset_id: int):
     return db.query(models.Dataset).filter(models.Dataset.dataset_id == dataset_id).first()
 
@@ -0,0 +1,95 @@
+"""
+Refreshing Cache
+Single-value cache with a TTL and stale-while-revalidate: stale values are
+served while one background thread recomputes them, and concurrent misses
+wait for a single in-flight computation instead of each hitting the database
+"""
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class RefreshingCache:
+    """Cache one expensive value, recomputed by `loader` at most once at a time"""
+
+    def __init__(self, loader: Callable[[], Any], ttl: float = 60.0, max_stale: float = 600.0,
+                 name: str = "cache"):
+        """
+        Args:
+            loader: Computes the value; called without arguments
+            ttl: Seconds a value is served as fresh
+            max_stale: Extra seconds a stale value may be served while it is
+                refreshed in the background; older values are recomputed inline
+            name: Used for the refresh thread name and error messages
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._value: Any = None
+        self._loaded_at: Optional[float] = None
+        self._refreshing = False
+        self._generation = 0  # Bumped by invalidate(), so a refresh already running isn't kept
+
+    def get(self) -> Any:
+        """Return the cached value, refreshing it as described above"""
+        with self._cond:
+            while True:
+                if self._loaded_at is not None:
+                    age = time.monotonic() - self._loaded_at
+                    if age < self.ttl:
+                        return self._value
+                    if age < self.ttl + self.max_stale:
+                        self._start_background_refresh()
+                        return self._value
+
+                if not self._refreshing:
+                    self._refreshing = True
+                    break
+
+                # Another caller is already computing; wait for its result
+                self._cond.wait(timeout=self.ttl or 1.0)
+
+        return self._refresh()
+
+    def invalidate(self):
+        """Drop the cached value so the next call recomputes it"""
+        with self._cond:
+            self._loaded_at = None
+            self._value = None
+            self._generation += 1
+
+    def _start_background_refresh(self):
+        # Caller holds self._cond
+        if self._refreshing:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name=f"{self.name}-refresh", daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            print(f"{self.name} background refresh failed: {e}")
+
+    def _refresh(self) -> Any:
+        """Run the loader; the caller must have set self._refreshing"""
+        with self._cond:
+            generation = self._generation
+        try:
+            value = self.loader()
+        except Exception:
+            with self._cond:
+                self._refreshing = False
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            if self._generation == generation:
+                self._value = value
+                self._loaded_at = time.monotonic()
+            self._refreshing = False
+            self._cond.notify_all()
+        return value
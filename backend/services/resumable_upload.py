@@ -0,0 +1,341 @@
+"""
+Resumable Chunked Uploads
+Create a session, PUT numbered chunks (in any order, in parallel, retried as
+needed) and complete it. Chunks are written at their offset in a sparse
+staging file next to the blob store, so completing is a hash and a rename.
+"""
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, AsyncIterator
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+import models
+from services.blob_store import blob_store
+from services import row_index
+
+
+class ResumableUploadService:
+    """Chunked upload sessions tracked in Upload_Session / Upload_Chunk"""
+
+    DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+    MIN_CHUNK_SIZE = 256 * 1024
+    MAX_CHUNK_SIZE = 64 * 1024 * 1024
+    MAX_UPLOAD_SIZE = int(os.getenv("MAX_RESUMABLE_UPLOAD_SIZE", 100 * 1024 * 1024 * 1024))  # 100GB
+    SESSION_TTL = timedelta(days=7)
+    WRITE_BUFFER_SIZE = 1024 * 1024
+
+    @staticmethod
+    def staging_path(upload_id: str) -> str:
+        return os.path.join(blob_store.tmp_dir, f"upload_{upload_id}")
+
+    @staticmethod
+    def create_session(
+        db: Session,
+        filename: str,
+        total_size: int,
+        chunk_size: Optional[int] = None,
+        sha256: Optional[str] = None,
+        created_by: Optional[int] = None
+    ) -> models.UploadSession:
+        """
+        Start an upload; the staging file is allocated sparse at its final size
+
+        Raises:
+            ValueError: for invalid sizes
+        """
+        chunk_size = chunk_size or ResumableUploadService.DEFAULT_CHUNK_SIZE
+        if total_size <= 0:
+            raise ValueError("total_size must be positive")
+        if total_size > ResumableUploadService.MAX_UPLOAD_SIZE:
+            raise ValueError(f"Upload exceeds {ResumableUploadService.MAX_UPLOAD_SIZE / 1024 ** 3:.0f}GB limit")
+        if not ResumableUploadService.MIN_CHUNK_SIZE <= chunk_size <= ResumableUploadService.MAX_CHUNK_SIZE:
+            raise ValueError(
+                f"chunk_size must be between {ResumableUploadService.MIN_CHUNK_SIZE} "
+                f"and {ResumableUploadService.MAX_CHUNK_SIZE} bytes"
+            )
+
+        upload_id = uuid.uuid4().hex
+        os.makedirs(blob_store.tmp_dir, exist_ok=True)
+        with open(ResumableUploadService.staging_path(upload_id), 'wb') as f:
+            f.truncate(total_size)
+
+        now = datetime.utcnow()
+        session = models.UploadSession(
+            upload_id=upload_id,
+            filename=os.path.basename(filename),
+            total_size=total_size,
+            chunk_size=chunk_size,
+            total_chunks=(total_size + chunk_size - 1) // chunk_size,
+            sha256=sha256.lower() if sha256 else None,
+            status="open",
+            created_by=created_by,
+            created_at=now,
+            updated_at=now
+        )
+        db.add(session)
+        db.commit()
+        return session
+
+    @staticmethod
+    def get_session(db: Session, upload_id: str) -> Optional[models.UploadSession]:
+        return db.query(models.UploadSession).filter(models.UploadSession.upload_id == upload_id).first()
+
+    @staticmethod
+    def expected_chunk_size(session: models.UploadSession, index: int) -> int:
+        if index == session.total_chunks - 1:
+            return session.total_size - index * session.chunk_size
+        return session.chunk_size
+
+    @staticmethod
+    async def write_chunk(
+        db: Session,
+        session: models.UploadSession,
+        index: int,
+        body: AsyncIterator[bytes],
+        checksum: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Stream one chunk into its byte range of the staging file
+
+        The chunk is buffered in its own temp file and copied into place only
+        after its size (and checksum, when given) match, so a failed re-send
+        never overwrites bytes of a chunk that was already received.
+
+        Raises:
+            ValueError: wrong index/size, checksum mismatch or closed session
+        """
+        if session.status != "open":
+            raise ValueError(f"Upload is {session.status}")
+        if not 0 <= index < session.total_chunks:
+            raise ValueError(f"Chunk index must be between 0 and {session.total_chunks - 1}")
+
+        expected = ResumableUploadService.expected_chunk_size(session, index)
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+
+        chunk_path = blob_store.new_temp_path()
+        try:
+            f = await run_in_threadpool(open, chunk_path, 'wb')
+            try:
+                async for data in body:
+                    size += len(data)
+                    if size > expected:
+                        raise ValueError(f"Chunk {index} must be {expected} bytes")
+                    digest.update(data)
+                    buffer.extend(data)
+                    if len(buffer) >= ResumableUploadService.WRITE_BUFFER_SIZE:
+                        await run_in_threadpool(f.write, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await run_in_threadpool(f.write, bytes(buffer))
+            finally:
+                await run_in_threadpool(f.close)
+
+            if size != expected:
+                raise ValueError(f"Chunk {index} must be {expected} bytes, received {size}")
+            chunk_sha256 = digest.hexdigest()
+            if checksum and checksum.lower() != chunk_sha256:
+                raise ValueError(f"Checksum mismatch for chunk {index}")
+
+            await run_in_threadpool(
+                ResumableUploadService._copy_into_place, chunk_path,
+                ResumableUploadService.staging_path(session.upload_id), index * session.chunk_size
+            )
+        finally:
+            try:
+                os.remove(chunk_path)
+            except FileNotFoundError:
+                pass
+
+        return await run_in_threadpool(ResumableUploadService._record_chunk, db, session, index, size, chunk_sha256)
+
+    @staticmethod
+    def _copy_into_place(chunk_path: str, staging_path: str, offset: int):
+        with open(chunk_path, 'rb') as src, open(staging_path, 'r+b') as dst:
+            dst.seek(offset)
+            while True:
+                data = src.read(ResumableUploadService.WRITE_BUFFER_SIZE)
+                if not data:
+                    break
+                dst.write(data)
+
+    @staticmethod
+    def _record_chunk(db: Session, session: models.UploadSession, index: int, size: int, sha256: str) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        db.merge(models.UploadChunk(
+            upload_id=session.upload_id, chunk_index=index, size=size, sha256=sha256, received_at=now
+        ))
+        session.updated_at = now
+        db.commit()
+        received = db.query(models.UploadChunk).filter(models.UploadChunk.upload_id == session.upload_id).count()
+        return {
+            'upload_id': session.upload_id,
+            'chunk_index': index,
+            'size': size,
+            'sha256': sha256,
+            'received_chunks': received,
+            'total_chunks': session.total_chunks
+        }
+
+    @staticmethod
+    def _ranges(indices: List[int]) -> List[List[int]]:
+        """Collapse sorted chunk indices into inclusive [start, end] ranges"""
+        ranges = []
+        for index in indices:
+            if ranges and index == ranges[-1][1] + 1:
+                ranges[-1][1] = index
+            else:
+                ranges.append([index, index])
+        return ranges
+
+    @staticmethod
+    def get_status(db: Session, session: models.UploadSession) -> Dict[str, Any]:
+        """Received chunks as ranges, so clients know exactly what to resend"""
+        received = [row.chunk_index for row in db.query(models.UploadChunk.chunk_index).filter(
+            models.UploadChunk.upload_id == session.upload_id
+        ).order_by(models.UploadChunk.chunk_index)]
+        received_set = set(received)
+        missing = [i for i in range(session.total_chunks) if i not in received_set] \
+            if session.status in ("open", "completing") else []
+        return {
+            'upload_id': session.upload_id,
+            'filename': session.filename,
+            'status': session.status,
+            'total_size': session.total_size,
+            'chunk_size': session.chunk_size,
+            'total_chunks': session.total_chunks,
+            'received_chunks': len(received),
+            'received_ranges': ResumableUploadService._ranges(received),
+            'missing_ranges': ResumableUploadService._ranges(missing),
+            'dataset_id': session.dataset_id
+        }
+
+    @staticmethod
+    def _claim(db: Session, session: models.UploadSession) -> bool:
+        """Move an open session to completing; False if another request got there first"""
+        claimed = db.query(models.UploadSession).filter(
+            models.UploadSession.upload_id == session.upload_id,
+            models.UploadSession.status == "open"
+        ).update({'status': "completing", 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+
+    @staticmethod
+    def _completed_result(db: Session, session: models.UploadSession, deduplicated: Optional[bool] = None) -> Dict[str, Any]:
+        job = db.query(models.IngestionJob).filter(
+            models.IngestionJob.dataset_id == session.dataset_id
+        ).order_by(models.IngestionJob.job_id).first() if session.dataset_id else None
+        return {
+            'upload_id': session.upload_id,
+            'dataset_id': session.dataset_id,
+            'filename': session.filename,
+            'size': session.total_size,
+            'sha256': session.sha256,
+            'deduplicated': deduplicated,
+            'ingestion_job_id': job.job_id if job else None
+        }
+
+    @staticmethod
+    def complete(db: Session, session: models.UploadSession) -> Dict[str, Any]:
+        """
+        Verify every chunk arrived, hash and index the staging file and rename
+        it into the blob store (no copy), then register the dataset and queue
+        its ingestion
+
+        The session is claimed (open -> completing) with a conditional UPDATE
+        first, so concurrent calls can't both complete it; repeating the call
+        on a completed session returns its result ('deduplicated' is None then).
+
+        Raises:
+            ValueError: missing chunks, digest mismatch, closed session or a
+                completion already in progress
+        """
+        from services import project_service, ingestion_pipeline
+
+        if not ResumableUploadService._claim(db, session):
+            db.refresh(session)
+            if session.status == "complete":
+                return ResumableUploadService._completed_result(db, session)
+            raise ValueError(f"Upload is {session.status}")
+
+        try:
+            status = ResumableUploadService.get_status(db, session)
+            if status['missing_ranges']:
+                raise ValueError(f"Missing chunks: {status['missing_ranges']}")
+
+            # Chunks arrive out of order, so hashing and row indexing share one pass here
+            path = ResumableUploadService.staging_path(session.upload_id)
+            fmt = row_index.normalize_format(os.path.splitext(session.filename)[1])
+            sha256, index_builder = row_index.scan_file(path, fmt)
+            if session.sha256 and session.sha256 != sha256:
+                raise ValueError("File checksum mismatch; re-send the chunks whose checksums differ")
+
+            created = blob_store.commit_file(path, sha256, session.total_size)
+        except Exception:
+            # Nothing was stored yet: reopen the session so the client can fix it and retry
+            db.rollback()
+            db.query(models.UploadSession).filter(
+                models.UploadSession.upload_id == session.upload_id,
+                models.UploadSession.status == "completing"
+            ).update({'status': "open"}, synchronize_session=False)
+            db.commit()
+            raise
+
+        if index_builder:
+            index_path = blob_store.new_temp_path()
+            index_builder.write(index_path)
+            blob_store.commit_index(index_path, sha256, fmt)
+        stored_file = {
+            'filename': session.filename,
+            'sha256': sha256,
+            'size': session.total_size,
+            'pinned': True,
+            'description': f"Uploaded in {session.total_chunks} chunks"
+        }
+        dataset = project_service.bulk_create_datasets(db, [stored_file])[0]
+
+        session.status = "complete"
+        session.sha256 = sha256
+        session.dataset_id = dataset['dataset_id']
+        session.updated_at = datetime.utcnow()
+        db.query(models.UploadChunk).filter(
+            models.UploadChunk.upload_id == session.upload_id
+        ).delete(synchronize_session=False)
+        db.commit()
+        ingestion_pipeline.enqueue(db, [dataset['dataset_id']])
+
+        return ResumableUploadService._completed_result(db, session, deduplicated=not created)
+
+    @staticmethod
+    def abort(db: Session, session: models.UploadSession):
+        """Discard an unfinished upload and its staging file"""
+        if session.status == "open":
+            try:
+                os.remove(ResumableUploadService.staging_path(session.upload_id))
+            except FileNotFoundError:
+                pass
+        session.status = "aborted" if session.status == "open" else session.status
+        db.query(models.UploadChunk).filter(
+            models.UploadChunk.upload_id == session.upload_id
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        """Abort open sessions (and completions that died) without activity for SESSION_TTL"""
+        cutoff = datetime.utcnow() - ResumableUploadService.SESSION_TTL
+        db.query(models.UploadSession).filter(
+            models.UploadSession.status == "completing",
+            models.UploadSession.updated_at < cutoff
+        ).update({'status': "open"}, synchronize_session=False)
+        db.commit()
+        expired = db.query(models.UploadSession).filter(
+            models.UploadSession.status == "open",
+            models.UploadSession.updated_at < cutoff
+        ).all()
+        for session in expired:
+            ResumableUploadService.abort(db, session)
+        return len(expired)
@@ -0,0 +1,203 @@
+"""
+Row Offset Index
+Sidecar file of record start offsets (array('Q'), native byte order) for
+line-oriented datasets, built while the upload streams through. Page N of a
+large CSV/JSONL/TXT file is then two seeks: one into the index for the
+offsets, one (via mmap) into the data for the bytes of those rows.
+
+Layout: the start offset of every record followed by the file size, so
+record i spans [offsets[i], offsets[i + 1]). For CSV, record 0 is the header.
+"""
+import csv
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+from array import array
+from typing import List, Any, Optional, Tuple
+
+
+INDEXED_FORMATS = ('csv', 'jsonl', 'txt')
+INDEX_SUFFIX = '.rowidx'
+READ_CHUNK_SIZE = 1024 * 1024
+
+_CSV_TOKEN = re.compile(rb'["\n,]')
+
+# CSV field states, as in the csv module: a quote opens a quoted field only as
+# the field's first character; anywhere else in an unquoted field it is data
+_FIELD_START, _UNQUOTED, _QUOTED, _QUOTE_IN_QUOTED = range(4)
+
+
+class RowIndexBuilder:
+    """Incrementally collect record offsets from consecutive chunks of a file"""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.offsets = array('Q')
+        self.size = 0
+        self._pending: Optional[int] = 0  # Start of a record whose first byte hasn't arrived yet
+        self._csv_state = _FIELD_START
+
+    def feed(self, chunk: bytes):
+        if not chunk:
+            return
+        base = self.size
+        if self._pending is not None:
+            self.offsets.append(self._pending)
+            self._pending = None
+
+        if self.fmt == 'csv' and (self._csv_state in (_QUOTED, _QUOTE_IN_QUOTED) or b'"' in chunk):
+            newlines = self._csv_newlines(chunk)
+        else:
+            newlines = []
+            position = chunk.find(b'\n')
+            while position != -1:
+                newlines.append(position)
+                position = chunk.find(b'\n', position + 1)
+            if self.fmt == 'csv':
+                self._csv_state = _FIELD_START if chunk[-1:] in (b'\n', b',') else _UNQUOTED
+
+        last = len(chunk) - 1
+        for position in newlines:
+            if position < last:
+                self.offsets.append(base + position + 1)
+            else:
+                self._pending = base + position + 1
+        self.size += len(chunk)
+
+    def _csv_newlines(self, chunk: bytes) -> List[int]:
+        """Positions of the newlines in `chunk` that end a CSV row (not those inside quoted fields)"""
+        newlines = []
+        state = self._csv_state
+        end = 0
+        for match in _CSV_TOKEN.finditer(chunk):
+            position = match.start()
+            if position > end:
+                # Other data since the last token: the field is unquoted from here, or stays quoted
+                if state != _QUOTED:
+                    state = _UNQUOTED
+            token = match.group()
+            if token == b'"':
+                if state == _FIELD_START or state == _QUOTE_IN_QUOTED:
+                    state = _QUOTED  # Opening quote, or the second quote of an escaped ""
+                elif state == _QUOTED:
+                    state = _QUOTE_IN_QUOTED
+            elif state != _QUOTED:
+                if token == b'\n':
+                    newlines.append(position)
+                state = _FIELD_START
+            end = position + 1
+        if end < len(chunk) and state != _QUOTED:
+            state = _UNQUOTED
+        self._csv_state = state
+        return newlines
+
+    def finish(self) -> array:
+        """Offsets with the end-of-file sentinel appended"""
+        offsets = array('Q', self.offsets)
+        offsets.append(self.size)
+        return offsets
+
+    def write(self, path: str):
+        tmp_path = f"{path}.part"
+        with open(tmp_path, 'wb') as f:
+            self.finish().tofile(f)
+        os.replace(tmp_path, path)
+
+
+def normalize_format(fmt: str) -> str:
+    return (fmt or '').lower().lstrip('.')
+
+
+def is_indexed(fmt: str) -> bool:
+    return normalize_format(fmt) in INDEXED_FORMATS
+
+
+def new_builder(fmt: str) -> Optional[RowIndexBuilder]:
+    """A builder for line-oriented formats, None for everything else"""
+    fmt = normalize_format(fmt)
+    return RowIndexBuilder(fmt) if fmt in INDEXED_FORMATS else None
+
+
+def scan_file(path: str, fmt: str) -> Tuple[str, Optional[RowIndexBuilder]]:
+    """Hash a file and build its row index in the same pass"""
+    digest = hashlib.sha256()
+    builder = new_builder(fmt)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            if builder:
+                builder.feed(chunk)
+    return digest.hexdigest(), builder
+
+
+def build_index(data_path: str, index_path: str, fmt: str):
+    """Index an existing file (datasets stored before indexing, or registered by hash)"""
+    _, builder = scan_file(data_path, fmt)
+    if builder:
+        builder.write(index_path)
+
+
+def _header_records(fmt: str) -> int:
+    return 1 if normalize_format(fmt) == 'csv' else 0
+
+
+def row_count(index_path: str, fmt: str) -> int:
+    entries = os.path.getsize(index_path) // 8
+    return max(entries - 1 - _header_records(fmt), 0)
+
+
+def _read_offsets(index_path: str, start: int, count: int) -> array:
+    offsets = array('Q')
+    with open(index_path, 'rb') as f:
+        f.seek(start * offsets.itemsize)
+        offsets.frombytes(f.read(count * offsets.itemsize))
+    return offsets
+
+
+def read_records(data_path: str, index_path: str, fmt: str, skip: int = 0, limit: int = 100) -> List[Optional[Any]]:
+    """
+    Parse the records at index positions [skip, skip + limit), one entry per
+    position and None for blank lines, so a position is a stable ordinal
+    """
+    fmt = normalize_format(fmt)
+    header = _header_records(fmt)
+    total = row_count(index_path, fmt)
+    skip = max(skip, 0)
+    if skip >= total or limit <= 0:
+        return []
+    limit = min(limit, total - skip)
+
+    offsets = _read_offsets(index_path, header + skip, limit + 1)
+    with open(data_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        texts = [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(limit)]
+        if fmt == 'csv':
+            header_offsets = _read_offsets(index_path, 0, 2)
+            header_text = data[header_offsets[0]:header_offsets[1]].decode('utf-8-sig')
+
+    present = [i for i, text in enumerate(texts) if text.strip()]
+    if fmt == 'csv':
+        # The index honours quotes, so every non-blank record is exactly one CSV row
+        parsed = list(csv.DictReader(io.StringIO(header_text + ''.join(texts[i] for i in present), newline='')))
+    elif fmt == 'jsonl':
+        parsed = [json.loads(texts[i]) for i in present]
+    else:
+        parsed = [{'text': texts[i].strip(), 'line_number': skip + i + 1} for i in present]
+
+    records: List[Optional[Any]] = [None] * limit
+    for i, record in zip(present, parsed):
+        records[i] = record
+    return records
+
+
+def read_rows(data_path: str, index_path: str, fmt: str, skip: int = 0, limit: int = 100) -> List[Any]:
+    """
+    Parse rows [skip, skip + limit) using the index; cost is independent of skip
+
+    CSV rows come back as dicts keyed by the header, JSONL rows as decoded
+    values and TXT lines as {'text', 'line_number'} (blank lines skipped),
+    matching what the full-file parsers return.
+    """
+    return [record for record in read_records(data_path, index_path, fmt, skip, limit) if record is not None]
@@ -0,0 +1,114 @@
+"""
+Task Scheduler Service
+Workload-aware distribution of unassigned project tasks across annotators
+"""
+import heapq
+from sqlalchemy.orm import Session
+from sqlalchemy import func, and_
+from typing import List, Dict, Any, Optional, Tuple
+import models
+from services import annotation_service
+
+
+class TaskSchedulerService:
+    """Balance new assignments against each annotator's current pending load"""
+
+    # Weight used for annotators without any reviewed work yet (scores are 0-10)
+    DEFAULT_QUALITY_WEIGHT = 5.0
+
+    @staticmethod
+    def get_unassigned_task_ids(db: Session, project_id: int) -> List[int]:
+        """All project tasks without any assignment, in one anti-join query"""
+        rows = db.query(models.AnnotationTask.task_id).filter(
+            models.AnnotationTask.project_id == project_id,
+            ~db.query(models.TaskAssignment.assignment_id).filter(
+                models.TaskAssignment.task_id == models.AnnotationTask.task_id
+            ).exists()
+        ).order_by(models.AnnotationTask.task_id).all()
+        return [row.task_id for row in rows]
+
+    @staticmethod
+    def get_pending_loads(db: Session, user_ids: List[int]) -> Dict[int, int]:
+        """Current number of pending assignments per user"""
+        loads = {user_id: 0 for user_id in user_ids}
+        rows = db.query(
+            models.TaskAssignment.user_id,
+            func.count(models.TaskAssignment.assignment_id)
+        ).filter(
+            models.TaskAssignment.user_id.in_(user_ids),
+            models.TaskAssignment.status == 'Pending'
+        ).group_by(models.TaskAssignment.user_id).all()
+        loads.update({user_id: count for user_id, count in rows})
+        return loads
+
+    @staticmethod
+    def get_quality_weights(db: Session, user_ids: List[int]) -> Dict[int, float]:
+        """Average review quality per annotator, used as a capacity weight"""
+        weights = {user_id: TaskSchedulerService.DEFAULT_QUALITY_WEIGHT for user_id in user_ids}
+        rows = db.query(
+            models.Annotation.user_id,
+            func.avg(models.Review.quality_score)
+        ).join(
+            models.Review, models.Review.annotation_id == models.Annotation.annotation_id
+        ).filter(
+            models.Annotation.user_id.in_(user_ids),
+            models.Review.quality_score.isnot(None)
+        ).group_by(models.Annotation.user_id).all()
+        weights.update({user_id: max(float(avg), 1.0) for user_id, avg in rows if avg is not None})
+        return weights
+
+    @staticmethod
+    def plan_distribution(
+        task_ids: List[int],
+        loads: Dict[int, int],
+        weights: Optional[Dict[int, float]] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        Assign each task to the user with the lowest (load / weight), using a min-heap
+
+        Returns:
+            List of (task_id, user_id) pairs
+        """
+        if not loads:
+            return []
+
+        weights = weights or {}
+        heap = [(load / weights.get(user_id, 1.0), user_id, load) for user_id, load in loads.items()]
+        heapq.heapify(heap)
+
+        plan = []
+        for task_id in task_ids:
+            _, user_id, load = heapq.heappop(heap)
+            plan.append((task_id, user_id))
+            load += 1
+            heapq.heappush(heap, (load / weights.get(user_id, 1.0), user_id, load))
+        return plan
+
+    @staticmethod
+    def auto_distribute(
+        db: Session,
+        project_id: int,
+        user_ids: List[int],
+        assigned_by: Optional[int] = None,
+        weight_by_quality: bool = False
+    ) -> Dict[str, Any]:
+        """Assign every unassigned task of a project, balancing pending workload"""
+        user_ids = list(dict.fromkeys(user_ids))
+        known_users = {row.user_id for row in db.query(models.User.user_id).filter(
+            models.User.user_id.in_(user_ids)
+        )}
+        errors = [f"User {user_id} not found" for user_id in user_ids if user_id not in known_users]
+        user_ids = [user_id for user_id in user_ids if user_id in known_users]
+
+        task_ids = TaskSchedulerService.get_unassigned_task_ids(db, project_id)
+        if not task_ids or not user_ids:
+            return {"assignments": [], "errors": errors, "unassigned_tasks": len(task_ids)}
+
+        loads = TaskSchedulerService.get_pending_loads(db, user_ids)
+        weights = TaskSchedulerService.get_quality_weights(db, user_ids) if weight_by_quality else None
+        plan = TaskSchedulerService.plan_distribution(task_ids, loads, weights)
+
+        result = annotation_service.bulk_create_task_assignments(db, plan, assigned_by)
+        result["errors"] = errors + result["errors"]
+        result["unassigned_tasks"] = len(task_ids)
+        return result
@@ -0,0 +1,190 @@
+"""
+Upload Statistics
+Per-category file counts and sizes (Upload_Stats) adjusted in the same
+transaction that registers or deletes a dataset, so /api/datasets/upload-stats
+reads a handful of rows instead of walking the upload tree. reconcile()
+recomputes them from Dataset and Blob to correct any drift.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Tuple, Optional
+from sqlalchemy import func, delete, insert
+from sqlalchemy.orm import Session
+from database import SessionLocal
+import models
+
+
+BLOB_STORE_CATEGORY = "blob_store"  # Deduplicated bytes actually stored
+
+RECONCILE_INTERVAL = timedelta(seconds=int(os.getenv("UPLOAD_STATS_RECONCILE_SECONDS", 86400)))
+
+Deltas = Dict[str, Tuple[int, int]]
+
+_reconcile_lock = threading.Lock()
+
+
+def file_category(fmt: Optional[str]) -> str:
+    """File type of a dataset format (".csv" and "csv" both map to "text")"""
+    from services.bulk_upload_service import BulkUploadService
+    return BulkUploadService.get_file_type(f"file.{(fmt or '').lower().lstrip('.')}")
+
+
+class UploadStatsService:
+    """Maintain and read the Upload_Stats counters"""
+
+    @staticmethod
+    def _apply_deltas(db: Session, deltas: Deltas):
+        """Add (count, size) deltas to their category rows with one upsert statement"""
+        deltas = {category: delta for category, delta in deltas.items() if delta != (0, 0)}
+        if not deltas:
+            return
+
+        table = models.UploadStats.__table__
+        now = datetime.utcnow()
+        rows = [
+            {'category': category, 'file_count': count, 'total_size': size, 'updated_at': now}
+            for category, (count, size) in deltas.items()
+        ]
+
+        dialect = db.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(table)
+            db.execute(stmt.on_conflict_do_update(index_elements=['category'], set_={
+                'file_count': table.c.file_count + stmt.excluded.file_count,
+                'total_size': table.c.total_size + stmt.excluded.total_size,
+                'updated_at': stmt.excluded.updated_at
+            }), rows)
+        elif dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+            stmt = mysql_insert(table)
+            db.execute(stmt.on_duplicate_key_update({
+                'file_count': table.c.file_count + stmt.inserted.file_count,
+                'total_size': table.c.total_size + stmt.inserted.total_size,
+                'updated_at': stmt.inserted.updated_at
+            }), rows)
+        else:
+            for row in rows:
+                existing = db.get(models.UploadStats, row['category'])
+                if existing is None:
+                    db.add(models.UploadStats(**row))
+                    continue
+                existing.file_count += row['file_count']
+                existing.total_size += row['total_size']
+                existing.updated_at = now
+            db.flush()
+
+    @staticmethod
+    def record_files(db: Session, files: Iterable[Tuple[str, Optional[int]]], sign: int = 1):
+        """
+        Count datasets' files in (sign=1) or out (sign=-1); call before commit
+
+        Args:
+            files: (format, size) pairs
+        """
+        deltas: Dict[str, list] = {}
+        for fmt, size in files:
+            entry = deltas.setdefault(file_category(fmt), [0, 0])
+            entry[0] += sign
+            entry[1] += sign * (size or 0)
+        UploadStatsService._apply_deltas(db, {category: tuple(entry) for category, entry in deltas.items()})
+
+    @staticmethod
+    def record_blobs(db: Session, sizes: Iterable[Optional[int]], sign: int = 1):
+        """Count stored blobs in or out; call before commit"""
+        sizes = list(sizes)
+        if sizes:
+            UploadStatsService._apply_deltas(db, {
+                BLOB_STORE_CATEGORY: (sign * len(sizes), sign * sum(size or 0 for size in sizes))
+            })
+
+    # ---------- Reconcile ----------
+
+    @staticmethod
+    def reconcile(db: Session) -> Dict[str, Any]:
+        """Recompute every category from Dataset and Blob with two grouped queries"""
+        totals: Dict[str, list] = {}
+        for fmt, count, size in db.query(
+            models.Dataset.format,
+            func.count(models.Dataset.dataset_id),
+            func.coalesce(func.sum(models.Dataset.file_size), 0)
+        ).filter(models.Dataset.storage_key.isnot(None)).group_by(models.Dataset.format):
+            entry = totals.setdefault(file_category(fmt), [0, 0])
+            entry[0] += count
+            entry[1] += size
+
+        blob_count, blob_size = db.query(
+            func.count(models.Blob.sha256), func.coalesce(func.sum(models.Blob.size), 0)
+        ).one()
+        totals[BLOB_STORE_CATEGORY] = [blob_count, blob_size]
+
+        now = datetime.utcnow()
+        table = models.UploadStats.__table__
+        db.execute(delete(table))
+        db.execute(insert(table), [
+            {'category': category, 'file_count': count, 'total_size': size,
+             'updated_at': now, 'reconciled_at': now}
+            for category, (count, size) in totals.items()
+        ])
+        db.commit()
+        return UploadStatsService.get_stats(db)
+
+    @staticmethod
+    def reconcile_if_empty(db: Session) -> bool:
+        """Build the counters once for databases that predate them"""
+        if db.query(models.UploadStats.category).first() is not None:
+            return False
+        UploadStatsService.reconcile(db)
+        return True
+
+    @staticmethod
+    def reconcile_background():
+        """Reconcile with a dedicated session (for background tasks)"""
+        if not _reconcile_lock.acquire(blocking=False):
+            return
+        db = SessionLocal()
+        try:
+            UploadStatsService.reconcile(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Upload stats reconcile failed: {e}")
+        finally:
+            db.close()
+            _reconcile_lock.release()
+
+    # ---------- Queries ----------
+
+    @staticmethod
+    def get_stats(db: Session) -> Dict[str, Any]:
+        """
+        Totals in the shape the upload-stats endpoint has always returned,
+        plus when the counters were last reconciled
+        """
+        stats = {
+            'total_files': 0,
+            'total_size': 0,
+            'by_type': {},
+            'stored_size': 0,
+            'reconciled_at': None
+        }
+        for row in db.query(models.UploadStats):
+            if row.reconciled_at and (stats['reconciled_at'] is None or row.reconciled_at < stats['reconciled_at']):
+                stats['reconciled_at'] = row.reconciled_at
+            if row.category == BLOB_STORE_CATEGORY:
+                stats['stored_size'] = row.total_size
+                continue
+            if row.file_count == 0:
+                continue
+            stats['total_files'] += row.file_count
+            stats['total_size'] += row.total_size
+            stats['by_type'][row.category] = {'count': row.file_count, 'size': row.total_size}
+        return stats
+
+    @staticmethod
+    def needs_reconcile(stats: Dict[str, Any]) -> bool:
+        reconciled_at = stats.get('reconciled_at')
+        return reconciled_at is None or datetime.utcnow() - reconciled_at > RECONCILE_INTERVAL
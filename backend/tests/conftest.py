@@ -0,0 +1,96 @@
+"""
+Shared fixtures: every test gets freshly created tables in a throwaway
+SQLite database (the app modules bind their engine at import time, so the
+URL is set before anything imports them)
+"""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="annotation-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["BLOB_STORE_DIR"] = os.path.join(_tmp, "blobs")
+os.environ["INGESTION_WORKERS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import event
+from database import engine, SessionLocal
+import models
+
+
+class StatementCounter:
+    """Statements and commits issued on the engine while active"""
+
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self.sql = []  # Statement texts, for reading a failed count
+        self.active = False
+
+    def reset(self):
+        self.statements = 0
+        self.commits = 0
+        self.sql = []
+
+
+_counter = StatementCounter()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, *args):
+    if _counter.active:
+        _counter.statements += 1
+        _counter.sql.append(statement)
+
+
+@event.listens_for(engine, "commit")
+def _count_commit(*args):
+    if _counter.active:
+        _counter.commits += 1
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def count_queries():
+    """Context manager counting statements and commits of the code inside it"""
+    from contextlib import contextmanager
+
+    @contextmanager
+    def counting():
+        _counter.reset()
+        _counter.active = True
+        try:
+            yield _counter
+        finally:
+            _counter.active = False
+
+    return counting
+
+
+@pytest.fixture
+def project_setup(db):
+    """A project with a dataset, three annotators, a reviewer and three labels"""
+    users = [
+        models.User(username=f"annotator{i}", email=f"annotator{i}@example.com", password="x",
+                    role=models.UserRole.ANNOTATOR)
+        for i in range(3)
+    ]
+    reviewer = models.User(username="reviewer", email="reviewer@example.com", password="x",
+                           role=models.UserRole.REVIEWER)
+    project = models.Project(project_name="Project")
+    dataset = models.Dataset(dataset_name="Dataset", format="csv")
+    labels = [models.Label(label_name=f"label{i}") for i in range(3)]
+    db.add_all(users + [reviewer, project, dataset] + labels)
+    db.commit()
+    return {"users": users, "reviewer": reviewer, "project": project, "dataset": dataset, "labels": labels}
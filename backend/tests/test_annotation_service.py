@@ -0,0 +1,185 @@
+import models
+import schemas
+from services import annotation_service
+
+
+def ids(db, setup):
+    """Plain ids of the fixture rows, read before counting starts"""
+    task = models.AnnotationTask(project_id=setup["project"].project_id, dataset_id=setup["dataset"].dataset_id)
+    db.add(task)
+    db.commit()
+    return {
+        "task": task.task_id,
+        "users": [user.user_id for user in setup["users"]],
+        "reviewer": setup["reviewer"].user_id,
+        "labels": [label.label_id for label in setup["labels"]],
+    }
+
+
+def annotation_for(ids):
+    return schemas.AnnotationCreate(task_id=ids["task"], user_id=ids["users"][0], label_ids=ids["labels"])
+
+
+def test_create_annotation_is_one_transaction(db, project_setup, count_queries):
+    setup = ids(db, project_setup)
+
+    with count_queries() as counter:
+        annotation = annotation_service.create_annotation(db, annotation_for(setup))
+        schemas.Annotation.model_validate(annotation)
+
+    assert (counter.statements, counter.commits) == (4, 1), counter.sql
+    assert db.query(models.AnnotationLabel).count() == 3
+
+
+def test_update_annotation_is_one_transaction(db, project_setup, count_queries):
+    setup = ids(db, project_setup)
+    annotation_id = annotation_service.create_annotation(db, annotation_for(setup)).annotation_id
+    db.expire_all()
+
+    with count_queries() as counter:
+        updated = annotation_service.update_annotation(db, annotation_id, schemas.AnnotationUpdate(
+            content="{}", label_ids=setup["labels"][:1]
+        ), setup["users"][0])
+        schemas.Annotation.model_validate(updated)
+
+    assert (counter.statements, counter.commits) == (4, 1), counter.sql
+    assert db.query(models.AnnotationLabel).count() == 1
+
+
+def test_create_review_is_one_transaction(db, project_setup, count_queries):
+    setup = ids(db, project_setup)
+    annotation_id = annotation_service.create_annotation(db, annotation_for(setup)).annotation_id
+
+    with count_queries() as counter:
+        review = annotation_service.create_review(db, schemas.ReviewCreate(
+            annotation_id=annotation_id, reviewer_id=setup["reviewer"],
+            status=models.ReviewStatus.APPROVED, quality_score=8.0
+        ))
+        schemas.Review.model_validate(review)
+
+    assert (counter.statements, counter.commits) == (4, 1), counter.sql
+    assert db.query(models.Notification).count() == 1
+
+
+def test_create_task_assignment_is_one_transaction(db, project_setup, count_queries):
+    setup = ids(db, project_setup)
+
+    with count_queries() as counter:
+        assignment = annotation_service.create_task_assignment(db, schemas.TaskAssignmentCreate(
+            task_id=setup["task"], user_id=setup["users"][1]
+        ))
+        assert assignment.assignment_id is not None
+
+    assert (counter.statements, counter.commits) == (3, 1), counter.sql
+
+
+def test_bulk_create_task_assignments_is_one_transaction(db, project_setup, count_queries):
+    setup = ids(db, project_setup)
+    task_ids = [setup["task"]] + [ids(db, project_setup)["task"] for _ in range(2)]
+    pairs = [(task_id, user_id) for task_id in task_ids for user_id in setup["users"]]
+
+    with count_queries() as counter:
+        result = annotation_service.bulk_create_task_assignments(db, pairs, assigned_by=setup["reviewer"])
+
+    assert len(result["assignments"]) == 9
+    assert (counter.statements, counter.commits) == (6, 1), counter.sql
+
+
+def test_commits_elsewhere_still_expire(db, project_setup):
+    annotation = annotation_service.create_annotation(db, annotation_for(ids(db, project_setup)))
+    assert "content" in annotation.__dict__
+
+    db.commit()
+
+    assert "content" not in annotation.__dict__
+
+
+def labels_by_annotation(db):
+    result = {}
+    for row in db.query(models.AnnotationLabel):
+        result.setdefault(row.annotation_id, []).append(row.label_id)
+    return {annotation_id: sorted(label_ids) for annotation_id, label_ids in result.items()}
+
+
+def test_bulk_create_annotations_skips_invalid_items(db, project_setup):
+    setup = ids(db, project_setup)
+    user, labels = setup["users"][0], setup["labels"]
+    items = [
+        {"task_id": setup["task"], "user_id": user, "content": "first", "label_ids": [labels[0], labels[0], labels[1]]},
+        {"task_id": 9999, "user_id": user, "label_ids": []},
+        {"task_id": setup["task"], "user_id": user, "label_ids": [labels[2], 9999]},
+        {"task_id": "not a number", "user_id": user},
+        ValueError("Invalid JSON: line 5"),
+        {"task_id": setup["task"], "user_id": setup["users"][1], "content": "second"},
+    ]
+
+    result = annotation_service.bulk_create_annotations(db, items, start_index=10)
+
+    assert result["created"] == 2
+    errors = {error["index"]: error["error"] for error in result["errors"]}
+    assert sorted(errors) == [11, 12, 13, 14]
+    assert errors[11] == "Task 9999 not found"
+    assert errors[12] == "Labels not found: [9999]"
+    assert errors[13].startswith("task_id:")
+    assert errors[14] == "Invalid JSON: line 5"
+
+    rows = db.query(models.Annotation).order_by(models.Annotation.annotation_id).all()
+    assert [(a.task_id, a.user_id, a.content) for a in rows] == [
+        (setup["task"], user, "first"), (setup["task"], setup["users"][1], "second")
+    ]
+    assert labels_by_annotation(db) == {rows[0].annotation_id: sorted(labels[:2])}
+
+
+def test_bulk_create_task_assignments_reports_duplicates_and_missing(db, project_setup):
+    setup = ids(db, project_setup)
+    other_task = ids(db, project_setup)["task"]
+    first, second, third = setup["users"]
+    annotation_service.bulk_create_task_assignments(db, [(setup["task"], first)])
+
+    result = annotation_service.bulk_create_task_assignments(db, [
+        (setup["task"], first),  # Already assigned
+        (setup["task"], second),
+        (setup["task"], second),  # Repeated in the request
+        (other_task, third),
+        (9999, third),
+        (other_task, 8888),
+    ], assigned_by=setup["reviewer"])
+
+    assert [(a["task_id"], a["user_id"]) for a in result["assignments"]] == [(setup["task"], second), (other_task, third)]
+    assert sorted(result["errors"]) == sorted([
+        "Task 9999 not found", "User 8888 not found", f"Task {setup['task']} already assigned to user {first}"
+    ])
+    assert sorted((a.task_id, a.user_id) for a in db.query(models.TaskAssignment)) == sorted([
+        (setup["task"], first), (setup["task"], second), (other_task, third)
+    ])
+    assert db.query(models.Notification).count() == 3
+    assert {a.assignment_id for a in db.query(models.TaskAssignment).filter(models.TaskAssignment.user_id != first)} == \
+        {a["assignment_id"] for a in result["assignments"]}
+
+
+def test_bulk_annotation_endpoint_streams_json_array(db, project_setup, monkeypatch):
+    import json
+    from fastapi.testclient import TestClient
+    import main
+
+    setup = ids(db, project_setup)
+    monkeypatch.setattr(annotation_service, "BULK_CHUNK_SIZE", 2)
+    items = [{"task_id": setup["task"], "user_id": user, "content": f"c{user}", "label_ids": setup["labels"][:1]}
+             for user in setup["users"]]
+    items.insert(1, {"task_id": 9999, "user_id": setup["users"][0]})
+    client = TestClient(main.app)
+
+    response = client.post("/api/annotations/bulk", content=json.dumps(items))
+    assert response.status_code == 200
+    assert response.json() == {"received": 4, "created": 3, "failed": 1, "errors_truncated": False,
+                               "errors": [{"index": 1, "error": "Task 9999 not found"}]}
+    assert sorted(a.content for a in db.query(models.Annotation)) == sorted(f"c{user}" for user in setup["users"])
+
+    # Items before a malformed tail are kept; the break is reported at its index
+    response = client.post("/api/annotations/bulk", content=json.dumps(items[:3])[:-1] + ', {"task_id": ')
+    summary = response.json()
+    assert (summary["received"], summary["created"], summary["failed"]) == (3, 2, 2)
+    assert summary["errors"][-1]["index"] == 3 and summary["errors"][-1]["error"].startswith("Invalid JSON")
+
+    assert client.post("/api/annotations/bulk", content='{"task_id": 1}').status_code == 400
+    assert client.post("/api/annotations/bulk", content='[{"task_id": ').status_code == 400
@@ -0,0 +1,107 @@
+from datetime import datetime, time, timedelta
+import pytest
+import models
+import schemas
+from services import annotation_service
+from services.annotator_stats import AnnotatorStatsService, COUNTERS
+
+
+@pytest.fixture
+def history(db, project_setup):
+    """Annotations spread over 60 days, some reviewed, by two annotators"""
+    project, dataset = project_setup["project"], project_setup["dataset"]
+    tasks = [models.AnnotationTask(project_id=project.project_id, dataset_id=dataset.dataset_id) for _ in range(4)]
+    db.add_all(tasks)
+    db.commit()
+    first, second = project_setup["users"][0].user_id, project_setup["users"][1].user_id
+    reviewer = project_setup["reviewer"].user_id
+
+    now = datetime.utcnow()
+    annotations = []
+    # Oldest first, as the write paths stamp annotations with the current time
+    for user_id, task, days_ago, review in [
+        (first, tasks[3], 40, (models.ReviewStatus.APPROVED, 7.0)),  # Reviewed now, annotated long ago
+        (first, tasks[2], 5, (models.ReviewStatus.APPROVED, None)),
+        (first, tasks[0], 2, None),
+        (first, tasks[1], 2, (models.ReviewStatus.REJECTED, 3.0)),
+        (second, tasks[0], 1, (models.ReviewStatus.PENDING, 5.0)),
+        (first, tasks[0], 0, (models.ReviewStatus.APPROVED, 9.0)),  # Same task again: started 2 days ago
+    ]:
+        annotation = models.Annotation(task_id=task.task_id, user_id=user_id, create_date=now - timedelta(days=days_ago))
+        db.add(annotation)
+        db.flush()
+        AnnotatorStatsService.record_annotations(db, [annotation])
+        db.commit()
+        annotations.append((annotation.annotation_id, review))
+
+    for annotation_id, review in annotations:
+        if review:
+            annotation_service.create_review(db, schemas.ReviewCreate(
+                annotation_id=annotation_id, reviewer_id=reviewer, status=review[0], quality_score=review[1]
+            ))
+    return {"first": first, "second": second, "restarted_task": tasks[0].task_id}
+
+
+def per_request_totals(db, user_id, days):
+    """What the per-request queries counted, with reviews windowed by annotation date"""
+    start = datetime.combine(AnnotatorStatsService._window_start(days), time.min)
+    annotations = db.query(models.Annotation).filter(
+        models.Annotation.user_id == user_id, models.Annotation.create_date >= start
+    ).all()
+    reviews = db.query(models.Review).join(
+        models.Annotation, models.Review.annotation_id == models.Annotation.annotation_id
+    ).filter(models.Annotation.user_id == user_id, models.Annotation.create_date >= start).all()
+    first_dates = {}
+    for annotation in db.query(models.Annotation).filter(models.Annotation.user_id == user_id):
+        first_dates[annotation.task_id] = min(first_dates.get(annotation.task_id, annotation.create_date), annotation.create_date)
+    scores = [r.quality_score for r in reviews if r.quality_score is not None]
+    return {
+        'annotations': len(annotations),
+        'tasks_started': sum(1 for first in first_dates.values() if first >= start),
+        'reviews': len(reviews),
+        'approved': sum(1 for r in reviews if r.status == models.ReviewStatus.APPROVED),
+        'rejected': sum(1 for r in reviews if r.status == models.ReviewStatus.REJECTED),
+        'pending': sum(1 for r in reviews if r.status == models.ReviewStatus.PENDING),
+        'quality_sum': sum(scores),
+        'quality_count': len(scores),
+    }
+
+
+@pytest.mark.parametrize("days", [1, 3, 7, 30, 60])
+def test_window_totals_match_per_request_queries(db, history, days):
+    for user_id in (history["first"], history["second"]):
+        assert AnnotatorStatsService.get_window_totals(db, user_id, days) == per_request_totals(db, user_id, days)
+
+
+def test_reviews_count_toward_the_annotation_day(db, history):
+    # The 40-day-old annotation was reviewed today but stays outside a 30-day window
+    assert AnnotatorStatsService.get_window_totals(db, history["first"], 30)['reviews'] == 3
+    assert AnnotatorStatsService.get_window_totals(db, history["first"], 60)['reviews'] == 4
+
+
+def test_incremental_rollup_equals_rebuild(db, history):
+    def snapshot():
+        db.expire_all()
+        return {
+            (row.user_id, row.day): tuple(getattr(row, counter) for counter in COUNTERS)
+            for row in db.query(models.AnnotatorDailyStats)
+        }
+
+    incremental = snapshot()
+    AnnotatorStatsService.rebuild(db)
+    assert snapshot() == incremental
+
+
+def test_delete_rebuilds_affected_days(db, history):
+    user_id = history["first"]
+    first_annotation = db.query(models.Annotation).filter(
+        models.Annotation.user_id == user_id, models.Annotation.task_id == history["restarted_task"]
+    ).order_by(models.Annotation.create_date).first()
+
+    # The task now counts as started today, on the remaining annotation
+    annotation_service.delete_annotation(db, first_annotation.annotation_id, user_id)
+
+    assert AnnotatorStatsService.get_window_totals(db, user_id, 1)['tasks_started'] == 1
+
+    for days in (1, 3, 30):
+        assert AnnotatorStatsService.get_window_totals(db, user_id, days) == per_request_totals(db, user_id, days)
@@ -0,0 +1,29 @@
+import pytest
+from fastapi import HTTPException
+from services.audit_archive import AuditArchiveService
+
+ADMIN = {"user_id": 1, "role": "Admin"}
+MANAGER = {"user_id": 2, "role": "Manager"}
+
+
+@pytest.mark.parametrize("retention_months", [0, -2])
+def test_retention_below_one_month_is_rejected(db, retention_months):
+    import main
+
+    with pytest.raises(ValueError, match="retention_months"):
+        AuditArchiveService.archive_expired(db, retention_months)
+    with pytest.raises(HTTPException) as error:
+        main.archive_audit_logs(retention_months, db, ADMIN)
+    assert error.value.status_code == 400
+
+
+def test_archives_are_admin_only(db):
+    import main
+
+    with pytest.raises(HTTPException) as error:
+        main.list_audit_archives(MANAGER)
+    assert error.value.status_code == 403
+    with pytest.raises(HTTPException) as error:
+        main.archive_audit_logs(None, db, MANAGER)
+    assert error.value.status_code == 403
+    assert "archives" in main.list_audit_archives(ADMIN)
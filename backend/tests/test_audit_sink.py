@@ -0,0 +1,64 @@
+import time
+import models
+from database import engine
+from services.audit_sink import AuditSink
+
+
+def logged(db):
+    """Actions emitted by these tests (the app-wide sink may flush other events meanwhile)"""
+    db.expire_all()
+    return sorted(row.action for row in db.query(models.AuditLog).filter(models.AuditLog.action.startswith("TEST_")))
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_flushes_when_batch_size_is_reached(db, project_setup):
+    user_id = project_setup["users"][0].user_id
+    sink = AuditSink(flush_events=3, flush_interval_ms=60000)
+    try:
+        sink.emit(user_id, "TEST_A1")
+        sink.emit(user_id, "TEST_A2")
+        time.sleep(0.1)
+        assert logged(db) == []
+
+        sink.emit(user_id, "TEST_A3")
+        assert wait_for(lambda: len(logged(db)) == 3)
+        assert sink.pending() == 0
+    finally:
+        sink.stop()
+
+
+def test_stop_drains_queued_events(db, project_setup):
+    user_id = project_setup["users"][0].user_id
+    sink = AuditSink(flush_events=1000, flush_interval_ms=60000)
+    for i in range(5):
+        sink.emit(user_id, f"TEST_S{i}")
+    assert logged(db) == []
+
+    sink.stop()
+
+    assert logged(db) == [f"TEST_S{i}" for i in range(5)]
+    assert sink.pending() == 0
+
+
+def test_failed_flush_keeps_events_for_the_next_one(db, project_setup):
+    user_id = project_setup["users"][0].user_id
+    sink = AuditSink(flush_events=2, flush_interval_ms=60000, synchronous=True)
+    table = models.AuditLog.__table__
+
+    table.drop(bind=engine)
+    try:
+        for i in range(5):
+            sink.emit(user_id, f"TEST_F{i}")  # Each emit flushes and fails
+        assert sink.pending() == 5
+    finally:
+        table.create(bind=engine)
+
+    assert sink.flush() == 5
+    assert logged(db) == [f"TEST_F{i}" for i in range(5)]
+    assert sink.pending() == 0
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+import uuid
+import pytest
+import models
+from services import dataset_storage, project_service
+from services.blob_store import blob_store, release_blobs, remove_unreferenced, register_blobs
+
+
+def stage(content: bytes):
+    """A staged copy of content, as an upload leaves it before commit_file()"""
+    path = blob_store.new_temp_path()
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path, hashlib.sha256(content).hexdigest()
+
+
+def upload(db, content: bytes, filename="data.txt"):
+    """Store content and create its dataset the way the upload endpoints do"""
+    path, sha256 = stage(content)
+    blob_store.commit_file(path, sha256, len(content))
+    dataset_id = project_service.bulk_create_datasets(db, [{
+        'filename': filename, 'sha256': sha256, 'size': len(content), 'pinned': True
+    }])[0]['dataset_id']
+    return db.get(models.Dataset, dataset_id), sha256
+
+
+def blob_refs(db, sha256):
+    db.expire_all()
+    blob = db.get(models.Blob, sha256)
+    return blob.ref_count if blob else None
+
+
+def test_concurrent_uploads_of_same_content_share_one_row(db):
+    content = uuid.uuid4().bytes * 100
+    staged = [stage(content) for _ in range(8)]
+    results, errors = [], []
+    barrier = threading.Barrier(len(staged))
+
+    def commit(path, sha256):
+        barrier.wait()
+        try:
+            results.append(blob_store.commit_file(path, sha256, len(content)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=commit, args=item) for item in staged]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sha256 = staged[0][1]
+    assert errors == []
+    assert sorted(results) == [False] * 7 + [True]
+    assert blob_refs(db, sha256) == 8
+    assert db.query(models.Blob).count() == 1
+    stats = db.get(models.UploadStats, "blob_store")
+    assert (stats.file_count, stats.total_size) == (1, len(content))
+
+
+def test_delete_keeps_file_an_upload_pinned_meanwhile(db):
+    content = uuid.uuid4().bytes
+    dataset, sha256 = upload(db, content)
+    assert blob_refs(db, sha256) == 1
+
+    # delete_dataset() releases the last reference and commits...
+    orphaned = release_blobs(db, [sha256])
+    db.commit()
+    assert orphaned == [sha256]
+    # ...an upload of the same content dedupes against the file before it is removed...
+    path, _ = stage(content)
+    assert blob_store.commit_file(path, sha256, len(content)) is False
+    # ...so the removal skips it
+    remove_unreferenced(db, orphaned)
+
+    assert os.path.exists(blob_store.path_for(sha256))
+    assert blob_refs(db, sha256) == 1
+
+
+def test_last_dataset_delete_removes_content(db):
+    content = uuid.uuid4().bytes
+    first, sha256 = upload(db, content, "a.txt")
+    second, _ = upload(db, content, "b.txt")
+    assert blob_refs(db, sha256) == 2
+
+    dataset_storage.delete_dataset(db, first)
+    assert blob_refs(db, sha256) == 1
+    assert os.path.exists(blob_store.path_for(sha256))
+
+    dataset_storage.delete_dataset(db, second)
+    assert blob_refs(db, sha256) is None
+    assert not os.path.exists(blob_store.path_for(sha256))
+
+
+def test_registering_released_content_fails(db):
+    content = uuid.uuid4().bytes
+    dataset, sha256 = upload(db, content)
+    dataset_storage.delete_dataset(db, dataset)
+
+    with pytest.raises(ValueError, match="no longer stored"):
+        register_blobs(db, [{'filename': 'again.txt', 'sha256': sha256, 'size': None}])
+
+
+def test_failed_dataset_creation_releases_pins(db):
+    content = uuid.uuid4().bytes
+    path, sha256 = stage(content)
+    blob_store.commit_file(path, sha256, len(content))
+    assert blob_refs(db, sha256) == 1
+
+    with pytest.raises(Exception):
+        project_service.bulk_create_datasets(db, [
+            {'filename': 'ok.txt', 'sha256': sha256, 'size': len(content), 'pinned': True},
+            {'filename': 'missing.txt', 'sha256': 'f' * 64, 'size': None}
+        ])
+
+    assert blob_refs(db, sha256) is None
+    assert not os.path.exists(blob_store.path_for(sha256))
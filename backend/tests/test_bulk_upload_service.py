@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import io
+import os
+import uuid
+import zipfile
+import pytest
+from fastapi import UploadFile
+import models
+from services import row_index
+from services.blob_store import blob_store
+from services.bulk_upload_service import BulkUploadService, UploadTooLargeError
+
+
+def upload_file(content: bytes, filename: str, size=None) -> UploadFile:
+    return UploadFile(io.BytesIO(content), size=size, filename=filename)
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(BulkUploadService, 'UPLOAD_CHUNK_SIZE', 7)
+
+
+def test_stream_to_file_hashes_and_indexes_in_chunks(tmp_path, small_chunks):
+    content = b"id,text\n1,\"a\nb\"\n2,c\n3,d\n"
+    dest = str(tmp_path / "data.csv")
+
+    stored = asyncio.run(BulkUploadService.stream_to_file(upload_file(content, "data.csv"), dest, None, 'csv'))
+
+    assert stored == {
+        'path': dest, 'size': len(content),
+        'sha256': hashlib.sha256(content).hexdigest(), 'row_index': dest + row_index.INDEX_SUFFIX
+    }
+    with open(dest, 'rb') as f:
+        assert f.read() == content
+    assert not os.path.exists(dest + '.part')
+    assert os.path.exists(stored['row_index'])
+
+
+def test_stream_to_file_stops_at_the_size_limit(tmp_path, small_chunks):
+    dest = str(tmp_path / "big.txt")
+
+    with pytest.raises(UploadTooLargeError) as raised:
+        asyncio.run(BulkUploadService.stream_to_file(upload_file(b"x" * 30, "big.txt"), dest, 20))
+
+    assert raised.value.size == 21
+    assert os.listdir(tmp_path) == []
+
+
+def test_stream_to_file_rejects_declared_size_before_reading(tmp_path):
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(BulkUploadService.stream_to_file(upload_file(b"", "big.txt", size=100), str(tmp_path / "f"), 10))
+    assert os.listdir(tmp_path) == []
+
+
+def test_stream_to_blob_deduplicates_and_pins(db, small_chunks):
+    content = uuid.uuid4().hex.encode() * 10
+
+    first = asyncio.run(BulkUploadService.stream_to_blob(upload_file(content, "a.txt")))
+    second = asyncio.run(BulkUploadService.stream_to_blob(upload_file(content, "b.txt")))
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert (first['sha256'], first['size'], first['deduplicated']) == (sha256, len(content), False)
+    assert (second['sha256'], second['deduplicated'], second['pinned']) == (sha256, True, True)
+    with open(blob_store.path_for(sha256), 'rb') as f:
+        assert f.read() == content
+    db.expire_all()
+    assert db.get(models.Blob, sha256).ref_count == 2
+
+
+def test_upload_multiple_files_reports_each_file(db, monkeypatch):
+    monkeypatch.setattr(BulkUploadService, 'MAX_FILE_SIZE', 16)
+    files = [
+        upload_file(uuid.uuid4().bytes[:10], "ok.txt"),
+        upload_file(b"x" * 17, "big.txt"),
+        upload_file(b"x", "run.exe"),
+    ]
+
+    results = asyncio.run(BulkUploadService.upload_multiple_files(files))
+
+    assert [r['filename'] for r in results['success']] == ["ok.txt"]
+    assert results['success'][0]['size'] == 10
+    assert [r['filename'] for r in results['failed']] == ["big.txt", "run.exe"]
+    assert results['failed'][0]['reason'].startswith('File too large')
+    assert results['total_size'] == 10
+
+
+def zip_upload(members) -> UploadFile:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+    return upload_file(buffer.getvalue(), "archive.zip")
+
+
+def test_zip_members_are_stored_in_archive_order(db, small_chunks):
+    contents = [uuid.uuid4().hex.encode() * (i + 1) for i in range(6)]
+    members = [(f"dir/file{i}.txt", content) for i, content in enumerate(contents)]
+    members += [("dir/", b""), (".hidden.txt", b"x"), ("__MACOSX/._file0.txt", b"x"), ("run.exe", b"x")]
+
+    results = asyncio.run(BulkUploadService.extract_and_upload_zip(zip_upload(members)))
+
+    assert [r['filename'] for r in results['success']] == [f"dir/file{i}.txt" for i in range(6)]
+    assert [r['filename'] for r in results['failed']] == ["run.exe"]
+    assert results['extracted_files'] == 6
+    for result, content in zip(results['success'], contents):
+        assert result['sha256'] == hashlib.sha256(content).hexdigest()
+        assert result['size'] == len(content)
+        with open(blob_store.path_for(result['sha256']), 'rb') as f:
+            assert f.read() == content
+
+
+def test_zip_limits_are_checked_before_extracting(db, monkeypatch):
+    monkeypatch.setattr(BulkUploadService, 'MAX_ZIP_MEMBERS', 2)
+    content = uuid.uuid4().hex.encode()
+    upload = zip_upload([("a.txt", content), ("b.txt", b"b"), ("c.txt", b"c")])
+
+    results = asyncio.run(BulkUploadService.extract_and_upload_zip(upload))
+
+    assert results['error'].startswith('ZIP has too many entries')
+    assert not os.path.exists(blob_store.path_for(hashlib.sha256(content).hexdigest()))
+
+
+def test_check_zip_limits_flags_high_compression_ratio():
+    info = zipfile.ZipInfo("bomb.txt")
+    info.file_size = BulkUploadService.UPLOAD_CHUNK_SIZE * 200
+    info.compress_size = BulkUploadService.UPLOAD_CHUNK_SIZE
+    assert BulkUploadService.check_zip_limits([info]).startswith('Suspicious compression ratio')
+
+    info.compress_size = info.file_size // 10
+    assert BulkUploadService.check_zip_limits([info]) is None
+
+
+def test_invalid_zip_is_reported():
+    results = asyncio.run(BulkUploadService.extract_and_upload_zip(upload_file(b"not a zip", "archive.zip")))
+    assert results['error'] == 'Invalid ZIP file'
@@ -0,0 +1,142 @@
+import threading
+from datetime import datetime
+import models
+from database import SessionLocal
+from services.crowd_management import CrowdManagementService
+from services.project_service import insert_returning_ids
+
+
+def test_empty_period_is_not_rebuilt_on_every_read(db, count_queries):
+    assert CrowdManagementService.get_annotator_leaderboard(db, 'week') == []
+    marker = db.get(models.LeaderboardRefresh, 'week')
+    assert marker.annotator_count == 0
+
+    with count_queries() as counter:
+        CrowdManagementService.get_annotator_leaderboard(db, 'week')
+
+    assert counter.commits == 0
+
+
+def test_concurrent_first_readers_build_one_snapshot(db, project_setup):
+    task = models.AnnotationTask(project_id=project_setup["project"].project_id,
+                                 dataset_id=project_setup["dataset"].dataset_id)
+    db.add(task)
+    db.flush()
+    db.add_all([models.Annotation(task_id=task.task_id, user_id=user.user_id) for user in project_setup["users"]])
+    db.commit()
+
+    results, errors = [], []
+
+    def read():
+        session = SessionLocal()
+        try:
+            results.append(CrowdManagementService.get_annotator_leaderboard(session, 'all_time'))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [len(result) for result in results] == [3] * 4
+    assert db.query(models.LeaderboardSnapshot).count() == 3
+
+
+def test_normalize_period_defaults_to_all_time():
+    assert CrowdManagementService.normalize_period('month') == 'month'
+    assert CrowdManagementService.normalize_period('decade') == 'all_time'
+
+
+def test_match_experts_over_many_tasks(db, project_setup):
+    user_ids = [user.user_id for user in project_setup["users"]]
+    db.add_all([
+        models.AnnotatorProfile(user_id=user_id, avg_quality=9.0 - i, max_pending=1000, updated_at=datetime.utcnow())
+        for i, user_id in enumerate(user_ids)
+    ])
+    task_ids = insert_returning_ids(db, models.AnnotationTask, [
+        {"project_id": project_setup["project"].project_id, "dataset_id": project_setup["dataset"].dataset_id}
+        for _ in range(1200)
+    ])
+    # Past the first batch of the already-assigned lookup
+    db.add(models.TaskAssignment(task_id=task_ids[900], user_id=user_ids[0], assign_date=datetime.utcnow()))
+    db.commit()
+
+    matches = CrowdManagementService.match_experts(db, task_ids, per_task=1)
+
+    assert matches[task_ids[900]] == [user_ids[1]]
+    assert matches[task_ids[0]] == [user_ids[0]]
+    # Matching alone reserves nothing
+    db.expire_all()
+    assert {p.pending_assignments for p in db.query(models.AnnotatorProfile)} == {0}
+
+
+def test_assign_experts_reserves_capacity_for_created_pairs_only(db, project_setup):
+    user_ids = [user.user_id for user in project_setup["users"]]
+    db.add_all([
+        models.AnnotatorProfile(user_id=user_id, avg_quality=9.0 - i, max_pending=1, updated_at=datetime.utcnow())
+        for i, user_id in enumerate(user_ids)
+    ])
+    task = models.AnnotationTask(project_id=project_setup["project"].project_id,
+                                 dataset_id=project_setup["dataset"].dataset_id)
+    db.add(task)
+    db.commit()
+    pool = CrowdManagementService.create_annotator_pool(
+        db, project_setup["project"].project_id, {'min_quality_score': 0, 'min_annotations': 0, 'available_only': True}
+    )
+    assert pool['qualified_annotators'] == 3
+    missing_task = task.task_id + 100
+
+    result = CrowdManagementService.assign_experts(db, [task.task_id, missing_task], per_task=1,
+                                                   assigned_by=project_setup["reviewer"].user_id)
+
+    assert result["matches"] == {task.task_id: [user_ids[0]], missing_task: [user_ids[1]]}
+    assert [(a["task_id"], a["user_id"]) for a in result["assignments"]] == [(task.task_id, user_ids[0])]
+    assert result["errors"] == [f"Task {missing_task} not found"]
+    other = SessionLocal()
+    try:
+        pending = dict(other.query(models.AnnotatorProfile.user_id, models.AnnotatorProfile.pending_assignments))
+    finally:
+        other.close()
+    assert pending == {user_ids[0]: 1, user_ids[1]: 0, user_ids[2]: 0}
+    # At capacity now, so out of the available-only pool
+    members = CrowdManagementService.get_annotator_pool(db, pool['pool_id'])['annotator_pool']
+    assert sorted(member['user_id'] for member in members) == user_ids[1:]
+
+
+def test_profile_refresh_syncs_only_changed_annotators(db, project_setup, monkeypatch):
+    users = project_setup["users"]
+    task = models.AnnotationTask(project_id=project_setup["project"].project_id,
+                                 dataset_id=project_setup["dataset"].dataset_id)
+    db.add(task)
+    db.commit()
+    CrowdManagementService.refresh_annotator_profiles(db)
+    pool = CrowdManagementService.create_annotator_pool(
+        db, project_setup["project"].project_id, {'min_quality_score': 0, 'min_annotations': 1}
+    )
+    assert pool['annotator_pool'] == []
+
+    synced = []
+    sync = CrowdManagementService.sync_pool_members
+    monkeypatch.setattr(CrowdManagementService, "sync_pool_members",
+                        staticmethod(lambda db, profiles, pools=None: (synced.append(
+                            sorted(p.user_id for p in profiles)), sync(db, profiles, pools))))
+
+    CrowdManagementService.refresh_annotator_profiles(db)
+    assert synced == [[]]
+
+    annotation = models.Annotation(task_id=task.task_id, user_id=users[0].user_id, create_date=datetime.utcnow())
+    db.add(annotation)
+    db.flush()
+    db.add(models.Review(annotation_id=annotation.annotation_id, reviewer_id=project_setup["reviewer"].user_id,
+                         quality_score=8.0, review_date=datetime.utcnow()))
+    db.commit()
+    CrowdManagementService.refresh_annotator_profiles(db)
+
+    assert synced[-1] == [users[0].user_id]
+    pool = CrowdManagementService.get_annotator_pool(db, pool['pool_id'])
+    assert [member['user_id'] for member in pool['annotator_pool']] == [users[0].user_id]
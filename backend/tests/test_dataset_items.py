@@ -0,0 +1,113 @@
+import json
+import pytest
+import models
+from services import annotation_service, dataset_items, dataset_storage, row_index
+
+
+def indexed_dataset(db, path, fmt):
+    """A dataset left on disk and paged through its row index (not ingested)"""
+    dataset = models.Dataset(dataset_name=path.name, format=fmt, storage_key=dataset_storage.file_key(str(path)))
+    db.add(dataset)
+    db.commit()
+    dataset.row_count = row_index.row_count(dataset_storage.row_index_path(dataset), fmt)
+    db.commit()
+    return dataset
+
+
+@pytest.fixture
+def jsonl_dataset(db, tmp_path):
+    path = tmp_path / "rows.jsonl"
+    lines = [json.dumps({"id": i, "label": "a" if i % 2 else "b"}) for i in range(6)]
+    lines.insert(2, "")  # A blank line still takes an index position
+    path.write_text("\n".join(lines) + "\n")
+    return indexed_dataset(db, path, "jsonl")
+
+
+@pytest.fixture
+def csv_dataset(db, tmp_path):
+    path = tmp_path / "rows.csv"
+    path.write_text('id,text\n0,plain\n\n1,"two\nlines"\n2,last\n')
+    return indexed_dataset(db, path, "csv")
+
+
+def test_ordinals_are_index_positions(db, jsonl_dataset):
+    records = list(dataset_items.iter_dataset_records(db, jsonl_dataset))
+    ordinals = [ordinal for ordinal, _ in records]
+
+    assert jsonl_dataset.row_count == 7
+    assert ordinals == [0, 1, 3, 4, 5, 6]
+    items = dataset_items.get_items_by_ordinals(db, jsonl_dataset, ordinals)
+    assert [(item['ordinal'], item['data']) for item in items] == records
+
+
+def test_csv_blank_lines_and_quoted_newlines(db, csv_dataset):
+    records = list(dataset_items.iter_dataset_records(db, csv_dataset))
+
+    assert [(ordinal, record['id']) for ordinal, record in records] == [(0, '0'), (2, '1'), (3, '2')]
+    assert records[1][1]['text'] == "two\nlines"
+    assert dataset_items.get_items_by_ordinals(db, csv_dataset, [1, 2]) == [{'ordinal': 2, 'data': records[1][1]}]
+
+
+def test_filtered_tasks_link_matching_items(db, jsonl_dataset):
+    project = models.Project(project_name="Project")
+    db.add(project)
+    db.commit()
+
+    result = annotation_service.generate_tasks(db, project.project_id, jsonl_dataset, filters={"label": "a"})
+
+    linked = [annotation_service.get_task_item_ordinals(db, task_id)[0]
+              for task_id in range(result["first_task_id"], result["last_task_id"] + 1)]
+    items = dataset_items.get_items_by_ordinals(db, jsonl_dataset, linked)
+    assert [item['data']['id'] for item in items] == [1, 3, 5]
+
+
+@pytest.mark.parametrize("fmt, text, expected", [
+    ("csv", 'a,b\n1,"x,y"\n2,z\n', [{'a': '1', 'b': 'x,y'}, {'a': '2', 'b': 'z'}]),
+    (".json", '[{"a": 1}, [2], "three"]', [{'a': 1}, [2], "three"]),
+    ("jsonl", '{"a": 1}\n\n{"a": 2}\n', [{'a': 1}, {'a': 2}]),
+    ("TXT", 'first\n\n  second  \n', [{'text': 'first', 'line_number': 1}, {'text': 'second', 'line_number': 3}]),
+])
+def test_iter_records_parses_each_format(tmp_path, fmt, text, expected):
+    path = tmp_path / "data"
+    path.write_text(text)
+    assert list(dataset_items.iter_records(str(path), fmt)) == expected
+
+
+def test_ingest_pages_by_ordinal(db, monkeypatch):
+    monkeypatch.setattr(dataset_items, 'ITEM_INSERT_BATCH_SIZE', 4)
+    dataset = models.Dataset(dataset_name="items", format="json")
+    db.add(dataset)
+    db.commit()
+    batches = []
+
+    count = dataset_items.ingest_dataset_items(
+        db, dataset.dataset_id, ({'n': i} for i in range(10)), on_batch=batches.append
+    )
+
+    assert count == 10
+    assert batches == [4, 8, 10]
+    db.refresh(dataset)
+    assert dataset.row_count == 10
+    assert dataset_items.get_item_page(db, dataset.dataset_id, skip=3, limit=4) == [{'n': i} for i in range(3, 7)]
+    assert dataset_items.get_item_page(db, dataset.dataset_id, skip=8, limit=100) == [{'n': 8}, {'n': 9}]
+    assert dataset_items.get_item_page(db, dataset.dataset_id, skip=10) == []
+
+
+def test_reingest_replaces_items(db):
+    dataset = models.Dataset(dataset_name="items", format="json")
+    db.add(dataset)
+    db.commit()
+    dataset_items.ingest_dataset_items(db, dataset.dataset_id, [{'n': i} for i in range(5)])
+
+    dataset_items.ingest_dataset_items(db, dataset.dataset_id, ["only"])
+
+    assert dataset_items.get_item_page(db, dataset.dataset_id) == ["only"]
+    assert db.query(models.DatasetItem).filter(models.DatasetItem.dataset_id == dataset.dataset_id).count() == 1
+
+
+def test_should_ingest_leaves_large_indexed_files_on_disk(monkeypatch):
+    monkeypatch.setattr(dataset_items, 'ITEMS_MAX_FILE_SIZE', 100)
+    assert dataset_items.should_ingest('.csv', 100)
+    assert not dataset_items.should_ingest('.csv', 101)
+    assert dataset_items.should_ingest('json', 101)  # No row index for JSON arrays
+    assert not dataset_items.should_ingest('png', 1)
@@ -0,0 +1,105 @@
+import pytest
+import models
+from services import annotation_service, dataset_items, dataset_sampling
+
+
+@pytest.fixture
+def dataset(db):
+    """2000 items whose 'label' is a (400), b (1000) or c (600), in file order"""
+    dataset = models.Dataset(dataset_name="labelled", format="jsonl")
+    db.add(dataset)
+    db.commit()
+    labels = ["a"] * 400 + ["b"] * 1000 + ["c"] * 600
+    dataset_items.ingest_dataset_items(db, dataset.dataset_id, ({"id": i, "label": label} for i, label in enumerate(labels)))
+    db.refresh(dataset)
+    return dataset
+
+
+def selected(db, dataset, **kwargs):
+    return list(dataset_sampling.select_ordinals(db, dataset, **kwargs))
+
+
+def test_sample_is_reproducible_by_seed(db, dataset):
+    first = selected(db, dataset, rate=0.1, seed=7)
+
+    assert selected(db, dataset, rate=0.1, seed=7) == first
+    assert selected(db, dataset, rate=0.1, seed=8) != first
+    assert 120 < len(first) < 280
+
+
+def test_smaller_rate_is_subset_of_larger(db, dataset):
+    for filters in (None, {"label": ["a", "c"]}):
+        small = set(selected(db, dataset, rate=0.05, seed=3, filters=filters))
+        large = set(selected(db, dataset, rate=0.2, seed=3, filters=filters))
+        assert small and small < large
+
+
+def test_stratified_sample_is_reproducible_and_nested(db, dataset):
+    def sample(rate, seed=1):
+        return dataset_sampling.stratified_sample(db, dataset, "label", rate=rate, seed=seed)
+
+    assert sample(0.1)["ordinals"] == sample(0.1)["ordinals"]
+    assert set(sample(0.05)["ordinals"]) < set(sample(0.2)["ordinals"])
+
+
+def test_stratified_max_items_keeps_every_stratum(db, dataset):
+    full = dataset_sampling.stratified_sample(db, dataset, "label", rate=0.5, seed=2)
+    capped = dataset_sampling.stratified_sample(db, dataset, "label", rate=0.5, seed=2, max_items=100)
+
+    assert capped["sample_size"] == 100
+    assert set(capped["ordinals"]) < set(full["ordinals"])
+    # Shares follow each stratum's sample size (about 500:300:200 of 1000)
+    sampled = {entry["value"]: entry["sampled"] for entry in capped["strata"]}
+    assert abs(sampled["b"] - 50) <= 3 and abs(sampled["c"] - 30) <= 3 and abs(sampled["a"] - 20) <= 3
+
+
+def test_generated_tasks_cover_every_stratum_under_max_items(db, dataset):
+    project = models.Project(project_name="Project")
+    db.add(project)
+    db.commit()
+
+    result = annotation_service.generate_tasks(db, project.project_id, dataset, sample_rate=0.5, seed=2,
+                                               max_items=30, stratify_by="label")
+
+    ordinals = [ordinal for (ordinal,) in db.query(models.AnnotationTaskItem.ordinal)]
+    labels = {item["data"]["label"] for item in dataset_items.get_items_by_ordinals(db, dataset, ordinals)}
+    assert result["items_assigned"] == 30
+    assert labels == {"a", "b", "c"}
+
+
+@pytest.mark.parametrize("stratify_by", [None, "label"])
+@pytest.mark.parametrize("max_items", [0, -1])
+def test_generate_tasks_rejects_max_items_below_one(db, dataset, stratify_by, max_items):
+    with pytest.raises(ValueError, match="max_items"):
+        annotation_service.generate_tasks(db, 1, dataset, max_items=max_items, stratify_by=stratify_by)
+    assert db.query(models.AnnotationTask).count() == 0
+
+
+def test_select_ordinals_limit_is_exact(db, dataset):
+    assert selected(db, dataset, limit=0) == []
+    assert selected(db, dataset, rate=0.1, seed=7, limit=5) == selected(db, dataset, rate=0.1, seed=7)[:5]
+
+
+def test_allocate_gives_small_strata_one_slot():
+    assert dataset_sampling._allocate([1000, 5, 3], 10) == [8, 1, 1]
+    assert dataset_sampling._allocate([10, 10], 1) == [1, 0]
+
+
+def test_sample_endpoint_pages_ordinals(db, dataset):
+    import main
+    import schemas
+
+    def sample(**kwargs):
+        return main.sample_dataset(dataset.dataset_id, schemas.DatasetSampleRequest(
+            stratify_by="label", rate=0.1, seed=4, **kwargs
+        ), db)
+
+    everything = dataset_sampling.stratified_sample(db, dataset, "label", rate=0.1, seed=4)["ordinals"]
+    first = sample(limit=50)
+    second = sample(offset=50, limit=50, include_data=True)
+
+    assert first["sample_size"] == second["sample_size"] == len(everything) > 100
+    assert first["ordinals"] == everything[:50]
+    assert second["ordinals"] == everything[50:100]
+    assert [item["ordinal"] for item in second["items"]] == second["ordinals"]
+    assert "items" not in first
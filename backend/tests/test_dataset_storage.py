@@ -0,0 +1,97 @@
+import hashlib
+import os
+import uuid
+from sqlalchemy import create_engine, inspect, text
+import models
+from services import dataset_storage, project_service
+from services.blob_store import blob_store, BACKEND_DIR
+
+
+def test_storage_keys_resolve_to_their_files(tmp_path):
+    sha256 = 'a' * 64
+    assert dataset_storage.resolve_path(dataset_storage.blob_key(sha256)) == blob_store.path_for(sha256)
+
+    inside = os.path.join(BACKEND_DIR, 'uploads', 'datasets', 'old.csv')
+    assert dataset_storage.file_key(inside) == f"file:{os.path.join('uploads', 'datasets', 'old.csv')}"
+    assert dataset_storage.resolve_path(dataset_storage.file_key(inside)) == inside
+
+    outside = str(tmp_path / "elsewhere.csv")
+    assert dataset_storage.resolve_path(dataset_storage.file_key(outside)) == outside
+
+    assert dataset_storage.resolve_path(None) is None
+    assert dataset_storage.resolve_path("s3:bucket/key") is None
+
+
+def test_legacy_files_match_exact_names_before_substrings():
+    datasets = [models.Dataset(dataset_id=i, dataset_name=name) for i, name in enumerate(
+        ["reviews", "reviews.csv", "tweets", "ambiguous", "gone"], 1
+    )]
+    listings = [("/old", ["reviews.csv", "reviews.csv.rowidx", "tweets_2023.json", "ambiguous_a.txt", "ambiguous_b.txt"])]
+
+    matches = dataset_storage._match_legacy_files(datasets, listings)
+
+    assert matches == {1: "/old/reviews.csv", 2: "/old/reviews.csv", 3: "/old/tweets_2023.json"}
+
+
+def test_backfill_sets_keys_from_blobs_and_legacy_files(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_storage, 'LEGACY_UPLOAD_DIRS', [str(tmp_path)])
+    (tmp_path / "legacy.csv").write_bytes(b"a,b\n1,2\n")
+    content = uuid.uuid4().bytes
+    path = blob_store.new_temp_path()
+    with open(path, 'wb') as f:
+        f.write(content)
+    sha256 = hashlib.sha256(content).hexdigest()
+    blob_store.commit_file(path, sha256, len(content))
+    blob_dataset_id = project_service.bulk_create_datasets(db, [
+        {'filename': 'blob.txt', 'sha256': sha256, 'size': len(content), 'pinned': True}
+    ])[0]['dataset_id']
+    db.query(models.Dataset).update({'storage_key': None, 'checksum': None, 'file_size': None})
+    db.add_all([models.Dataset(dataset_name="legacy", format="csv"), models.Dataset(dataset_name="lost", format="csv")])
+    db.commit()
+
+    assert dataset_storage.backfill_storage_keys(db) == 2
+
+    datasets = {dataset.dataset_name: dataset for dataset in db.query(models.Dataset)}
+    blob_dataset = db.get(models.Dataset, blob_dataset_id)
+    assert (blob_dataset.storage_key, blob_dataset.checksum, blob_dataset.file_size) == (
+        dataset_storage.blob_key(sha256), sha256, len(content)
+    )
+    assert dataset_storage.dataset_path(datasets["legacy"]) == str(tmp_path / "legacy.csv")
+    assert datasets["legacy"].file_size == 8
+    assert datasets["lost"].storage_key is None
+    assert dataset_storage.backfill_storage_keys(db) == 0
+
+
+def test_deleting_legacy_dataset_removes_file_and_index(db, tmp_path):
+    path = tmp_path / "legacy.csv"
+    path.write_text("a\n1\n2\n")
+    dataset = models.Dataset(dataset_name="legacy", format="csv", storage_key=dataset_storage.file_key(str(path)))
+    db.add(dataset)
+    db.commit()
+    index_path = dataset_storage.row_index_path(dataset)
+    assert os.path.exists(index_path)
+
+    dataset_storage.delete_dataset(db, dataset)
+
+    assert not path.exists() and not os.path.exists(index_path)
+    assert db.query(models.Dataset).count() == 0
+
+
+def test_prepare_schema_upgrades_old_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE "Dataset" (dataset_id INTEGER PRIMARY KEY, dataset_name VARCHAR(255))'))
+        conn.execute(text('CREATE TABLE "Blob" (sha256 VARCHAR(64) PRIMARY KEY, size INTEGER)'))
+        conn.execute(text('CREATE TABLE "Dataset_Blob" (dataset_blob_id INTEGER PRIMARY KEY, '
+                          'dataset_id INTEGER, sha256 VARCHAR(64), filename VARCHAR(255))'))
+        conn.execute(text("""INSERT INTO "Blob" VALUES ('x', 1), ('y', 2)"""))
+        conn.execute(text("""INSERT INTO "Dataset_Blob" (dataset_id, sha256, filename) VALUES (1, 'x', 'a'), (2, 'x', 'b')"""))
+
+    dataset_storage.prepare_schema(engine)
+    dataset_storage.prepare_schema(engine)
+
+    columns = {column['name'] for column in inspect(engine).get_columns("Dataset")}
+    assert set(dataset_storage.STORAGE_COLUMNS) <= columns
+    with engine.connect() as conn:
+        assert dict(conn.execute(text('SELECT sha256, ref_count FROM "Blob"')).all()) == {'x': 2, 'y': 0}
+    engine.dispose()
@@ -0,0 +1,113 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+import models
+from services import dataset_items, dataset_storage, ingestion_pipeline
+
+
+@pytest.fixture
+def csv_dataset(db, tmp_path):
+    path = tmp_path / "rows.csv"
+    path.write_text("id,label\n" + "".join(f"{i},l{i % 3}\n" for i in range(2500)))
+    dataset = models.Dataset(dataset_name="rows", format="csv", storage_key=dataset_storage.file_key(str(path)))
+    db.add(dataset)
+    db.commit()
+    return dataset
+
+
+@pytest.fixture
+def no_workers(monkeypatch):
+    """Queue jobs without handing them to a worker, so tests run them explicitly"""
+    monkeypatch.setattr(ingestion_pipeline, "_submit", lambda job_ids: None)
+
+
+def item_count(db, dataset_id):
+    return db.query(models.DatasetItem).filter(models.DatasetItem.dataset_id == dataset_id).count()
+
+
+def test_run_job_writes_every_row(db, csv_dataset, no_workers):
+    job = ingestion_pipeline.enqueue(db, [csv_dataset.dataset_id])[0]
+
+    assert ingestion_pipeline.run_job(job.job_id) == "complete"
+    db.expire_all()
+    assert item_count(db, csv_dataset.dataset_id) == 2500
+    assert db.get(models.Dataset, csv_dataset.dataset_id).row_count == 2500
+
+
+def test_enqueue_reuses_active_job(db, csv_dataset, no_workers):
+    first = ingestion_pipeline.enqueue(db, [csv_dataset.dataset_id])[0]
+    second = ingestion_pipeline.enqueue(db, [csv_dataset.dataset_id])[0]
+
+    assert second.job_id == first.job_id
+    assert db.query(models.IngestionJob).count() == 1
+
+
+def test_second_job_is_refused_while_one_runs(db, csv_dataset, no_workers):
+    running = models.IngestionJob(dataset_id=csv_dataset.dataset_id, status="running")
+    queued = models.IngestionJob(dataset_id=csv_dataset.dataset_id, status="queued")
+    db.add_all([running, queued])
+    db.commit()
+
+    assert ingestion_pipeline.run_job(queued.job_id) == "refused"
+    db.expire_all()
+    assert db.get(models.IngestionJob, queued.job_id).status == "failed"
+    assert db.get(models.IngestionJob, running.job_id).status == "running"
+
+
+def test_failed_ingest_removes_only_its_own_items(db, csv_dataset):
+    dataset_id = csv_dataset.dataset_id
+    foreign = 10000
+
+    def records():
+        for i in range(1500):
+            yield {"i": i}
+        # Rows this call never wrote must survive its cleanup
+        db.add(models.DatasetItem(dataset_id=dataset_id, ordinal=foreign, payload={}))
+        db.commit()
+        raise ValueError("bad record")
+
+    with pytest.raises(ValueError):
+        dataset_items.ingest_dataset_items(db, dataset_id, records())
+
+    remaining = [row.ordinal for row in db.query(models.DatasetItem.ordinal).filter(
+        models.DatasetItem.dataset_id == dataset_id
+    )]
+    assert remaining == [foreign]
+
+
+def test_resume_requeues_only_jobs_past_their_lease(db, csv_dataset, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(ingestion_pipeline, "_submit", submitted.extend)
+    now = datetime.utcnow()
+    live = models.IngestionJob(dataset_id=csv_dataset.dataset_id, status="running", updated_at=now)
+    stale = models.IngestionJob(dataset_id=csv_dataset.dataset_id, status="running",
+                                updated_at=now - ingestion_pipeline.INGESTION_LEASE - timedelta(seconds=1))
+    queued = models.IngestionJob(dataset_id=csv_dataset.dataset_id, status="queued", updated_at=now)
+    db.add_all([live, stale, queued])
+    db.commit()
+
+    assert ingestion_pipeline.resume_pending(db) == 2
+
+    db.expire_all()
+    assert submitted == [stale.job_id, queued.job_id]
+    assert db.get(models.IngestionJob, live.job_id).status == "running"
+    assert db.get(models.IngestionJob, stale.job_id).status == "queued"
+
+
+def test_heartbeat_renews_running_job(db, csv_dataset, monkeypatch):
+    monkeypatch.setattr(ingestion_pipeline, "HEARTBEAT_INTERVAL", timedelta(milliseconds=10))
+    started = datetime.utcnow() - timedelta(hours=1)
+    job = models.IngestionJob(dataset_id=csv_dataset.dataset_id, status="running", updated_at=started)
+    db.add(job)
+    db.commit()
+
+    stop = threading.Event()
+    beat = threading.Thread(target=ingestion_pipeline._heartbeat, args=(job.job_id, stop))
+    beat.start()
+    time.sleep(0.1)
+    stop.set()
+    beat.join()
+
+    db.expire_all()
+    assert db.get(models.IngestionJob, job.job_id).updated_at > started
@@ -0,0 +1,54 @@
+import json
+import pytest
+from services.json_patch import make_patch, apply_patch
+
+
+@pytest.mark.parametrize("source,target", [
+    ({"a": 1, "b": {"c": [1, 2], "d": "x"}}, {"a": 1, "b": {"c": [1, 2, 3], "e": None}}),
+    ({"a/b": 1, "m~n": {"~1": 2}}, {"a/b": 2, "m~n": {"~1": 3, "/": 4}}),
+    ({"n": 1}, {"n": True}),
+    ({"n": 1.0}, {"n": 1}),
+    ({"deep": {"er": {"est": 1}}}, {"deep": {"er": {}}}),
+    ({"content": "old", "label_ids": [1, 2]}, {"content": {"spans": [0, 4]}, "label_ids": []}),
+    ([1, 2], {"now": "an object"}),
+    ("scalar", "other"),
+])
+def test_patch_round_trips(source, target):
+    result = apply_patch(source, make_patch(source, target))
+
+    # Serialized, so 1 / 1.0 / True count as different values
+    assert json.dumps(result, sort_keys=True) == json.dumps(target, sort_keys=True)
+
+
+def test_equal_documents_give_empty_patch():
+    document = {"a": [1, {"b": 2}], "c": None}
+    assert make_patch(document, {"a": [1, {"b": 2}], "c": None}) == []
+
+
+def test_keys_are_escaped_in_paths():
+    patch = make_patch({}, {"a/b~c": 1})
+    assert patch == [{"op": "add", "path": "/a~1b~0c", "value": 1}]
+
+
+def test_apply_leaves_input_untouched():
+    source = {"a": {"b": [1, 2]}}
+    patch = make_patch(source, {"a": {"b": [3]}, "c": 1})
+    apply_patch(source, patch)
+    assert source == {"a": {"b": [1, 2]}}
+
+
+def test_list_operations():
+    patched = apply_patch([1, 2, 3], [
+        {"op": "add", "path": "/-", "value": 4},
+        {"op": "add", "path": "/0", "value": 0},
+        {"op": "remove", "path": "/2"},
+        {"op": "replace", "path": "/1", "value": 9},
+    ])
+    assert patched == [0, 9, 3, 4]
+
+
+def test_invalid_operations_raise():
+    with pytest.raises(ValueError):
+        apply_patch({"a": 1}, [{"op": "remove", "path": ""}])
+    with pytest.raises(ValueError):
+        apply_patch({"a": 1}, [{"op": "move", "path": "/a"}])
@@ -0,0 +1,52 @@
+import io
+import json
+import pytest
+from services.json_stream import iter_json_items
+
+DOCUMENTS = [
+    [],
+    [{"a": 1}, {"b": [1, 2, {"c": None}]}, 3.25, -1e-3, True, False, None, "s"],
+    [{"nested": {"deep": [[[[{"x": "y"}]]]], "empty": {}, "list": []}}],
+    ["quote \" and backslash \\", "brackets ] } [ { , inside", "unicode é ☃ \U0001f600", "\n\t\r\u0000"],
+    [{"key with \"quotes\"": "and \\\" escapes", "\\": "/"}] * 3,
+    [12345678901234567890, 1.5, 0, -0.0, 2E10],
+    {"single": "object"},
+]
+
+
+def stream(document, read_size, indent=None):
+    text = json.dumps(document, indent=indent, ensure_ascii=False)
+    return list(iter_json_items(io.StringIO(text), read_size=read_size))
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 5, 64 * 1024])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_round_trip_across_read_boundaries(read_size, indent):
+    for document in DOCUMENTS:
+        expected = document if isinstance(document, list) else [document]
+        assert stream(document, read_size, indent) == expected
+
+
+def test_escaped_input_split_at_every_position():
+    text = '[{"k\\"ey": "va\\\\lue\\u00e9", "n": [1.25e2, {"m": "]"}]}, "\\\\", 7]'
+    expected = json.loads(text)
+    for read_size in range(1, len(text) + 1):
+        assert list(iter_json_items(io.StringIO(text), read_size=read_size)) == expected
+
+
+def test_numbers_are_not_cut_at_a_read_boundary():
+    assert list(iter_json_items(io.StringIO("[1.5, 23456]"), read_size=2)) == [1.5, 23456]
+
+
+@pytest.mark.parametrize("text", ["", "[1, 2", "[1 2]", "[1,]", "[1] [2]", '["unterminated]'])
+def test_malformed_input_raises(text):
+    with pytest.raises(ValueError):
+        list(iter_json_items(io.StringIO(text), read_size=2))
+
+
+def test_items_before_an_error_are_yielded():
+    items = iter_json_items(io.StringIO('[{"a": 1}, {"b": 2}, {"c": '), read_size=4)
+    assert next(items) == {"a": 1}
+    assert next(items) == {"b": 2}
+    with pytest.raises(ValueError):
+        next(items)
@@ -0,0 +1,57 @@
+import hashlib
+import uuid
+import models
+from services import project_service
+from services.blob_store import blob_store
+from services.dataset_storage import blob_key
+
+
+def stored(content: bytes):
+    path = blob_store.new_temp_path()
+    with open(path, 'wb') as f:
+        f.write(content)
+    sha256 = hashlib.sha256(content).hexdigest()
+    blob_store.commit_file(path, sha256, len(content))
+    return sha256
+
+
+def test_bulk_create_datasets_registers_files_in_input_order(db):
+    contents = [uuid.uuid4().bytes * (i + 1) for i in range(25)]
+    files = [{
+        'filename': f"upload/file{i}.{'csv' if i % 2 else 'txt'}",
+        'sha256': stored(content), 'size': len(content), 'pinned': True
+    } for i, content in enumerate(contents)]
+
+    created = project_service.bulk_create_datasets(db, files)
+
+    assert [c['filename'] for c in created] == [f['filename'] for f in files]
+    for result, f in zip(created, files):
+        dataset = db.get(models.Dataset, result['dataset_id'])
+        assert dataset.dataset_name == f['filename']
+        assert dataset.format == ('.csv' if f['filename'].endswith('csv') else '.txt')
+        assert (dataset.storage_key, dataset.checksum, dataset.file_size) == (blob_key(f['sha256']), f['sha256'], f['size'])
+        link = db.query(models.DatasetBlob).filter(models.DatasetBlob.dataset_id == dataset.dataset_id).one()
+        assert (link.sha256, link.filename) == (f['sha256'], f['filename'].split('/')[-1])
+        assert db.get(models.Blob, f['sha256']).ref_count == 1
+
+
+def test_bulk_create_datasets_takes_unknown_sizes_from_stored_blobs(db):
+    content = uuid.uuid4().bytes * 3
+    sha256 = stored(content)
+    project_service.bulk_create_datasets(db, [{'filename': 'first.txt', 'sha256': sha256, 'size': len(content), 'pinned': True}])
+
+    created = project_service.bulk_create_datasets(db, [{
+        'filename': 'again.txt', 'sha256': sha256, 'size': None,
+        'dataset_name': 'Again', 'description': 'same bytes', 'format': 'txt'
+    }])
+
+    dataset = db.get(models.Dataset, created[0]['dataset_id'])
+    assert (dataset.dataset_name, dataset.description, dataset.format) == ('Again', 'same bytes', 'txt')
+    assert dataset.file_size == len(content)
+    db.expire_all()
+    assert db.get(models.Blob, sha256).ref_count == 2
+
+
+def test_bulk_create_datasets_with_no_files(db):
+    assert project_service.bulk_create_datasets(db, []) == []
+    assert db.query(models.Dataset).count() == 0
@@ -0,0 +1,131 @@
+import threading
+import time
+import pytest
+from services import refresh_cache
+from services.refresh_cache import RefreshingCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(refresh_cache, "time", clock)
+    return clock
+
+
+class Loader:
+    """Counts calls; each call returns the next integer, optionally after `gate` opens"""
+
+    def __init__(self, gate=None):
+        self.calls = 0
+        self.gate = gate
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            value = self.calls
+        if self.gate is not None:
+            assert self.gate.wait(timeout=5)
+        return value
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_fresh_value_is_reused(clock):
+    loader = Loader()
+    cache = RefreshingCache(loader, ttl=60, max_stale=600)
+
+    assert [cache.get() for _ in range(3)] == [1, 1, 1]
+    clock.now += 59
+    assert cache.get() == 1
+    assert loader.calls == 1
+
+
+def test_stale_value_is_served_while_one_refresh_runs(clock):
+    gate = threading.Event()
+    loader = Loader()
+    cache = RefreshingCache(loader, ttl=60, max_stale=600)
+    cache.get()
+    loader.gate = gate
+
+    clock.now += 61
+    assert [cache.get() for _ in range(5)] == [1] * 5  # Stale, returned without waiting
+    assert wait_for(lambda: loader.calls == 2)  # A single background refresh
+    assert cache.get() == 1 and loader.calls == 2
+
+    gate.set()
+    assert wait_for(lambda: cache.get() == 2)
+    assert loader.calls == 2
+
+
+def test_value_past_max_stale_is_recomputed_inline(clock):
+    loader = Loader()
+    cache = RefreshingCache(loader, ttl=60, max_stale=600)
+    cache.get()
+
+    clock.now += 661
+    assert cache.get() == 2
+
+
+def test_concurrent_misses_share_one_load(clock):
+    gate = threading.Event()
+    loader = Loader(gate)
+    cache = RefreshingCache(loader, ttl=60, max_stale=600)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+
+    assert wait_for(lambda: loader.calls == 1)
+    time.sleep(0.05)
+    gate.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == [1] * 8
+    assert loader.calls == 1
+
+
+def test_failed_load_raises_and_is_retried(clock):
+    outcomes = [RuntimeError("database down"), "ok"]
+
+    def loader():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    cache = RefreshingCache(loader, ttl=60, max_stale=600)
+    with pytest.raises(RuntimeError):
+        cache.get()
+    assert cache.get() == "ok"
+
+
+def test_invalidate_discards_refresh_in_flight(clock):
+    gate = threading.Event()
+    loader = Loader(gate)
+    cache = RefreshingCache(loader, ttl=60, max_stale=600)
+    first = []
+    thread = threading.Thread(target=lambda: first.append(cache.get()))
+    thread.start()
+    assert wait_for(lambda: loader.calls == 1)
+
+    cache.invalidate()  # The data changed after the running load read it
+    gate.set()
+    thread.join(timeout=5)
+
+    assert first == [1]
+    assert cache.get() == 2
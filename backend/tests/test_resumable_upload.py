@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import os
+import threading
+import pytest
+import models
+from database import SessionLocal
+from services.resumable_upload import ResumableUploadService
+
+
+async def _body(data: bytes, piece: int = 64 * 1024):
+    for start in range(0, len(data), piece):
+        yield data[start:start + piece]
+
+
+def _write(db, session, index, data, checksum=None):
+    return asyncio.run(ResumableUploadService.write_chunk(db, session, index, _body(data), checksum))
+
+
+def _staged(session):
+    with open(ResumableUploadService.staging_path(session.upload_id), 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def upload(db):
+    chunk_size = ResumableUploadService.MIN_CHUNK_SIZE
+    return ResumableUploadService.create_session(db, "data.bin", chunk_size * 2, chunk_size=chunk_size)
+
+
+def test_chunks_land_at_their_offsets(db, upload):
+    first, second = b"a" * upload.chunk_size, b"b" * upload.chunk_size
+    _write(db, upload, 1, second)
+    result = _write(db, upload, 0, first, hashlib.sha256(first).hexdigest())
+
+    assert result['received_chunks'] == 2
+    assert _staged(upload) == first + second
+
+
+def test_failed_resend_keeps_received_chunk(db, upload):
+    original = b"a" * upload.chunk_size
+    _write(db, upload, 0, original)
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        _write(db, upload, 0, b"x" * upload.chunk_size, checksum="0" * 64)
+    with pytest.raises(ValueError, match="must be"):
+        _write(db, upload, 0, b"y" * (upload.chunk_size // 2))
+
+    assert _staged(upload)[:upload.chunk_size] == original
+    chunk = db.query(models.UploadChunk).filter(models.UploadChunk.upload_id == upload.upload_id).one()
+    assert chunk.sha256 == hashlib.sha256(original).hexdigest()
+
+
+def _fill(db, upload, content=None):
+    content = content or os.urandom(upload.total_size)
+    for index in range(upload.total_chunks):
+        _write(db, upload, index, content[index * upload.chunk_size:(index + 1) * upload.chunk_size])
+    return content
+
+
+def test_incomplete_upload_stays_open(db, upload):
+    _write(db, upload, 0, b"a" * upload.chunk_size)
+
+    with pytest.raises(ValueError, match="Missing chunks"):
+        ResumableUploadService.complete(db, upload)
+
+    db.refresh(upload)
+    assert upload.status == "open"
+
+
+def test_repeated_complete_returns_the_first_result(db, upload):
+    content = _fill(db, upload)
+
+    first = ResumableUploadService.complete(db, upload)
+    again = ResumableUploadService.complete(db, upload)
+
+    assert first['sha256'] == hashlib.sha256(content).hexdigest()
+    assert first['deduplicated'] is False
+    assert {k: v for k, v in again.items() if k != 'deduplicated'} == \
+        {k: v for k, v in first.items() if k != 'deduplicated'}
+    assert db.query(models.Dataset).count() == 1
+
+
+def test_concurrent_completes_create_one_dataset(db, upload):
+    _fill(db, upload)
+    upload_id = upload.upload_id
+    barrier = threading.Barrier(4)
+    results, errors = [], []
+
+    def complete():
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            results.append(ResumableUploadService.complete(session, ResumableUploadService.get_session(session, upload_id)))
+        except ValueError as e:
+            errors.append(str(e))
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=complete) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert db.query(models.Dataset).count() == 1
+    assert len({result['dataset_id'] for result in results}) == 1
+    assert all(error == "Upload is completing" for error in errors)
+    assert len(results) + len(errors) == 4
@@ -0,0 +1,43 @@
+import csv
+import io
+import pytest
+from services import row_index
+
+TRICKY_CSV = (
+    'id,text,note\r\n'
+    '1,5" screen,plain\r\n'                 # Stray quote inside an unquoted field
+    '2,"quoted, with comma","multi\nline"\n'
+    '3,"say ""hi""",x"y"z\n'                # Escaped quotes; quotes mid-field
+    '4,"",""\n'
+    '5,"closed"then text,last\n'
+    '6,12",end"\n'
+)
+
+
+def build(tmp_path, content: str, chunk_size: int):
+    data_path = tmp_path / "data.csv"
+    data_path.write_bytes(content.encode())
+    builder = row_index.RowIndexBuilder('csv')
+    raw = content.encode()
+    for start in range(0, len(raw), chunk_size):
+        builder.feed(raw[start:start + chunk_size])
+    index_path = tmp_path / f"data.{chunk_size}.rowidx"
+    builder.write(str(index_path))
+    return str(data_path), str(index_path), builder.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1024])
+def test_rows_match_csv_module_at_any_chunk_size(tmp_path, chunk_size):
+    data_path, index_path, offsets = build(tmp_path, TRICKY_CSV, chunk_size)
+
+    expected = list(csv.DictReader(io.StringIO(TRICKY_CSV, newline='')))
+    assert row_index.row_count(index_path, 'csv') == len(expected) == 6
+    assert row_index.read_rows(data_path, index_path, 'csv', 0, 100) == expected
+    assert list(offsets) == list(build(tmp_path, TRICKY_CSV, 1024)[2])
+
+
+def test_stray_quote_does_not_swallow_following_rows(tmp_path):
+    content = 'a,b\n1,2"\n3,4\n5,6\n'
+    data_path, index_path, _ = build(tmp_path, content, 4)
+
+    assert row_index.read_rows(data_path, index_path, 'csv', 1, 2) == [{'a': '3', 'b': '4'}, {'a': '5', 'b': '6'}]
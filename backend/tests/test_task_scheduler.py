@@ -0,0 +1,56 @@
+import models
+import schemas
+from services import annotation_service
+from services.task_scheduler import TaskSchedulerService
+
+
+def test_plan_gives_each_task_to_the_least_loaded_user():
+    plan = TaskSchedulerService.plan_distribution([10, 11, 12, 13, 14], {1: 2, 2: 0, 3: 1})
+
+    # Ties go to the lower user id
+    assert plan == [(10, 2), (11, 2), (12, 3), (13, 1), (14, 2)]
+
+
+def test_plan_weights_scale_capacity():
+    plan = TaskSchedulerService.plan_distribution(list(range(6)), {1: 0, 2: 0}, {1: 10.0, 2: 5.0})
+
+    assert [user_id for _, user_id in plan] == [1, 2, 1, 1, 2, 1]
+    assert TaskSchedulerService.plan_distribution([1], {}) == []
+
+
+def test_auto_distribute_balances_pending_work(db, project_setup):
+    project, dataset = project_setup["project"], project_setup["dataset"]
+    tasks = [models.AnnotationTask(project_id=project.project_id, dataset_id=dataset.dataset_id) for _ in range(6)]
+    db.add_all(tasks)
+    db.commit()
+    task_ids = [task.task_id for task in tasks]
+    busy, idle = project_setup["users"][0].user_id, project_setup["users"][1].user_id
+    # busy already holds two pending tasks; those are not redistributed
+    annotation_service.bulk_create_task_assignments(db, [(task_ids[0], busy), (task_ids[1], busy)])
+
+    result = TaskSchedulerService.auto_distribute(db, project.project_id, [busy, idle, 9999])
+
+    assert result["unassigned_tasks"] == 4
+    assert result["errors"] == ["User 9999 not found"]
+    assert [(a["task_id"], a["user_id"]) for a in result["assignments"]] == [
+        (task_ids[2], idle), (task_ids[3], idle), (task_ids[4], busy), (task_ids[5], idle)
+    ]
+    assert TaskSchedulerService.get_pending_loads(db, [busy, idle]) == {busy: 3, idle: 3}
+    assert TaskSchedulerService.get_unassigned_task_ids(db, project.project_id) == []
+
+
+def test_quality_weights_default_for_unreviewed_annotators(db, project_setup):
+    setup = project_setup
+    task = models.AnnotationTask(project_id=setup["project"].project_id, dataset_id=setup["dataset"].dataset_id)
+    db.add(task)
+    db.commit()
+    reviewed, unreviewed = setup["users"][0].user_id, setup["users"][1].user_id
+    for score in (8.0, 6.0, None):
+        annotation = annotation_service.create_annotation(db, schemas.AnnotationCreate(task_id=task.task_id, user_id=reviewed))
+        annotation_service.create_review(db, schemas.ReviewCreate(
+            annotation_id=annotation.annotation_id, reviewer_id=setup["reviewer"].user_id, quality_score=score
+        ))
+
+    assert TaskSchedulerService.get_quality_weights(db, [reviewed, unreviewed]) == {
+        reviewed: 7.0, unreviewed: TaskSchedulerService.DEFAULT_QUALITY_WEIGHT
+    }
@@ -0,0 +1,71 @@
+import hashlib
+import uuid
+import models
+from services import dataset_storage, project_service
+from services.blob_store import blob_store
+from services.upload_stats import UploadStatsService
+
+
+def upload(db, content: bytes, filename: str):
+    path = blob_store.new_temp_path()
+    with open(path, 'wb') as f:
+        f.write(content)
+    sha256 = hashlib.sha256(content).hexdigest()
+    blob_store.commit_file(path, sha256, len(content))
+    dataset_id = project_service.bulk_create_datasets(db, [{
+        'filename': filename, 'sha256': sha256, 'size': len(content), 'pinned': True
+    }])[0]['dataset_id']
+    return db.get(models.Dataset, dataset_id)
+
+
+def counters(db):
+    db.expire_all()
+    stats = UploadStatsService.get_stats(db)
+    stats.pop('reconciled_at')
+    return stats
+
+
+def reconciled(db):
+    stats = UploadStatsService.reconcile(db)
+    stats.pop('reconciled_at')
+    return stats
+
+
+def test_counters_match_reconcile_after_create_and_delete(db):
+    shared = uuid.uuid4().bytes * 50
+    datasets = [
+        upload(db, b"a,b\n" + uuid.uuid4().hex.encode(), "one.csv"),
+        upload(db, b"\x89PNG" + uuid.uuid4().bytes, "two.png"),
+        upload(db, shared, "three.txt"),
+        upload(db, shared, "copy.txt"),
+    ]
+
+    created = counters(db)
+    assert created['total_files'] == 4
+    assert created['by_type']['text']['count'] == 3
+    assert created['by_type']['image']['count'] == 1
+    assert created == reconciled(db)
+
+    for dataset in datasets[1:3]:
+        dataset_storage.delete_dataset(db, dataset)
+
+    deleted = counters(db)
+    assert deleted['total_files'] == 2
+    assert deleted['stored_size'] == datasets[0].file_size + len(shared)
+    assert deleted == reconciled(db)
+
+    for dataset in (datasets[0], datasets[3]):
+        dataset_storage.delete_dataset(db, dataset)
+    assert counters(db) == {'total_files': 0, 'total_size': 0, 'by_type': {}, 'stored_size': 0}
+    assert counters(db) == reconciled(db)
+
+
+def test_reconcile_if_empty_builds_missing_counters(db):
+    upload(db, uuid.uuid4().bytes, "data.txt")
+    expected = counters(db)
+    db.query(models.UploadStats).delete()
+    db.commit()
+
+    assert UploadStatsService.reconcile_if_empty(db) is True
+    assert counters(db) == expected
+    assert UploadStatsService.reconcile_if_empty(db) is False
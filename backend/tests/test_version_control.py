@@ -0,0 +1,104 @@
+import json
+import threading
+import models
+from database import SessionLocal
+from services.advanced_features import VersionControlService
+
+
+def annotation(db, setup):
+    task = models.AnnotationTask(project_id=setup["project"].project_id, dataset_id=setup["dataset"].dataset_id)
+    db.add(task)
+    db.commit()
+    row = models.Annotation(task_id=task.task_id, user_id=setup["users"][0].user_id, content="v0")
+    db.add(row)
+    db.commit()
+    return row.annotation_id
+
+
+def document(i):
+    """Version i: content and labels that keep changing shape"""
+    content = {"text": f"rev {i}", "spans": list(range(i % 4))}
+    if i % 3 == 0:
+        content["note"] = {"by": i}
+    return content, [i % 3 + 1] if i % 2 else []
+
+
+def test_versions_rebuild_from_snapshots_and_deltas(db, project_setup):
+    annotation_id = annotation(db, project_setup)
+    user_id = project_setup["users"][0].user_id
+    for i in range(1, 26):
+        content, label_ids = document(i)
+        VersionControlService.create_version(db, annotation_id, user_id, content, label_ids)
+
+    rows = db.query(models.AnnotationVersion).filter_by(annotation_id=annotation_id).order_by(
+        models.AnnotationVersion.version
+    ).all()
+    assert [row.version for row in rows if row.is_snapshot] == [1, 11, 21]
+    for i in range(1, 26):
+        content, label_ids = document(i)
+        assert VersionControlService._reconstruct(db, annotation_id, i) == {"content": content, "label_ids": label_ids}
+
+    history = VersionControlService.get_version_history(db, annotation_id)
+    assert [entry["version_id"] for entry in history] == list(range(25, 0, -1))
+    assert [(entry["details"]["content"], entry["details"]["label_ids"]) for entry in reversed(history)] == \
+        [document(i) for i in range(1, 26)]
+
+
+def test_broken_delta_chain_falls_back_to_snapshot(db, project_setup):
+    annotation_id = annotation(db, project_setup)
+    user_id = project_setup["users"][0].user_id
+    for i in range(1, 4):
+        VersionControlService.create_version(db, annotation_id, user_id, *document(i))
+    db.query(models.AnnotationVersion).filter_by(annotation_id=annotation_id, version=1).delete()
+    db.commit()
+
+    VersionControlService.create_version(db, annotation_id, user_id, *document(4))
+
+    latest = db.query(models.AnnotationVersion).filter_by(annotation_id=annotation_id, version=4).one()
+    assert latest.is_snapshot
+    assert VersionControlService._reconstruct(db, annotation_id, 4)["content"] == document(4)[0]
+
+
+def test_restore_is_one_commit(db, project_setup, count_queries):
+    annotation_id = annotation(db, project_setup)
+    user_id = project_setup["users"][0].user_id
+    labels = [label.label_id for label in project_setup["labels"]]
+    VersionControlService.create_version(db, annotation_id, user_id, {"text": "first"}, labels[:2])
+    VersionControlService.create_version(db, annotation_id, user_id, "second", labels[2:])
+
+    with count_queries() as counter:
+        restored = VersionControlService.restore_version(db, annotation_id, 1, user_id)
+
+    assert restored is not None
+    assert counter.commits == 1
+    db.expire_all()
+    assert json.loads(db.get(models.Annotation, annotation_id).content) == {"text": "first"}
+    assert sorted(l.label_id for l in db.query(models.AnnotationLabel).filter_by(annotation_id=annotation_id)) == labels[:2]
+    assert VersionControlService._reconstruct(db, annotation_id, 3) == {"content": {"text": "first"}, "label_ids": labels[:2]}
+
+
+def test_concurrent_saves_get_distinct_versions(db, project_setup):
+    annotation_id = annotation(db, project_setup)
+    user_id = project_setup["users"][0].user_id
+    barrier = threading.Barrier(6)
+    errors = []
+
+    def save(i):
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            VersionControlService.create_version(session, annotation_id, user_id, f"edit {i}", [])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    versions = sorted(v for v, in db.query(models.AnnotationVersion.version).filter_by(annotation_id=annotation_id))
+    assert versions == list(range(1, 7))